@@ -173,6 +173,92 @@ REST_FRAMEWORK = {
     )
 }
 
+# Maximum number of locations uploaded in one batch
+LOCATION_BATCH_SIZE = 500
+
+# Storage of the location pings: 'sync' (one insert per request) or 'buffered' (bulk inserts by a background thread,
+# see webapp/ingest.py). The buffer is flushed every LOCATION_BUFFER_FLUSH_INTERVAL milliseconds or when
+# LOCATION_BUFFER_FLUSH_SIZE pings are waiting, the pings that cannot be stored are written to
+# LOCATION_BUFFER_SPILL_FILE suffixed with the process ID
+LOCATION_INGEST_MODE = 'sync'
+LOCATION_BUFFER_FLUSH_INTERVAL = 500
+LOCATION_BUFFER_FLUSH_SIZE = 200
+LOCATION_BUFFER_SPILL_FILE = None
+
+# Filter of the redundant pings (see webapp/ingest.py): a ping is dropped if it is sent less than LOCATION_MIN_INTERVAL
+# seconds after the last stored point of the team, or if it is closer than LOCATION_MIN_DISTANCE metres to it and
+# LOCATION_MAX_INTERVAL seconds did not pass yet. 0 disables the check
+LOCATION_MIN_INTERVAL = 5
+LOCATION_MIN_DISTANCE = 10
+LOCATION_MAX_INTERVAL = 60
+
+# Tolerance (in metres) of the simplification of the team routes, tolerances a client can request, and lifetime of the
+# simplified segments (in seconds), they are also simplified again when they grow
+TRACK_SIMPLIFY_TOLERANCE = 10
+TRACK_SIMPLIFY_TOLERANCES = (0, 5, 10, 25, 50, 100)
+TRACKS_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Speed (in m/s) below which a team is considered stopped by the track statistics (see webapp/analytics.py), and
+# minimum duration (in seconds) of a stop
+ANALYTICS_STOP_SPEED = 1
+ANALYTICS_STOP_DURATION = 120
+
+# Directory of the archives of the finished events (see webapp/archive.py)
+EVENT_ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archives')
+
+# Maximum number of instants of a replay request (see webapp/replay.py)
+REPLAY_MAX_FRAMES = 600
+
+# Number of events whose replay index and archived tracks each process keeps in memory (see webapp/replay.py and
+# webapp/archive.py)
+EVENT_MEMORY_CACHE_SIZE = 4
+
+# Number of track points read from the database and written to the response at once by the GPX/GeoJSON exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Radius (in metres) of the geofences of the destinations of an event. With GEOFENCE_AUTO_ARRIVAL, the timer of a team
+# is stopped and the segment scored when a location is sent from inside the geofence of its next destination
+GEOFENCE_RADIUS = 100
+GEOFENCE_AUTO_ARRIVAL = True
+
+# Maximum lifetime of the cached geofences (in seconds), they are also dropped when the event is edited. Kept short so
+# that, without a cache shared by the processes, the processes that did not handle the edit do not use outdated ones
+GEOFENCES_CACHE_TIMEOUT = 60
+
+# Maximum lifetime of the active event cached by each process (in seconds), it is also reloaded when the event changes
+ACTIVE_EVENT_CACHE_TIMEOUT = 60
+
+# Lifetime of the cached segments of an event (in seconds), they are also dropped when the event is edited
+SEGMENTS_CACHE_TIMEOUT = 60 * 60
+
+# Scoreboard push channel: broker class, lifetime/keep-alive interval of the streams (in seconds) and maximum number of
+# streams open at the same time by a user or IP address. Each stream holds a worker until it ends, the application must
+# be served by asynchronous workers (e.g. gunicorn --worker-class gevent) when the streams are used
+SCOREBOARD_BROKER = 'webapp.broker.InProcessBroker'
+SCOREBOARD_STREAM_TIMEOUT = 300
+SCOREBOARD_STREAM_KEEPALIVE = 15
+SCOREBOARD_STREAM_MAX_PER_CLIENT = 2
+
+# Cache of the simplified tracks, track statistics, scoreboard and standings versions. It must be shared by the
+# processes in production: set CACHE_LOCATION to the address of a memcached server (e.g. 127.0.0.1:11211). Without
+# it, each process keeps its own cache in memory. MAX_ENTRIES fits an event of 300 teams with 11 segments
+# cached at every allowed tolerance
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 25000},
+        }
+    }
+
 # Page where the webapp will redirect after login
 LOGIN_REDIRECT_URL = '/admin/dashboard/'
 
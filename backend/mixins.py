@@ -0,0 +1,33 @@
+from webapp.active_event import get_active_event
+from webapp.models import Team
+
+
+def get_active_team(user):
+    """
+    Returns the team of a user for the active event, with its event, in a single query (the active event is cached)
+    :param user: User object
+    :return: Team object (with its event set), None if there is no active event or the user is not in a team for it
+    """
+    if not user.is_authenticated:
+        return None
+    event = get_active_event()
+    if not event:
+        return None
+    team = Team.objects.filter(event_id=event.pk, userteam__user_id=user.pk).first()
+    if team:
+        team.event = event
+    return team
+
+
+class ActiveTeamMixin:
+    """
+    Mixin of the API views of the team members, resolving once per request (after authentication):
+        - request.active_team: Team of the requesting user for the active event, None if there is no active event or
+          the user is not in a team for it
+        - request.active_event: Event of request.active_team, None if there is no team
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        request.active_team = get_active_team(request.user)
+        request.active_event = request.active_team.event if request.active_team else None
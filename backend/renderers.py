@@ -0,0 +1,26 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renderer accepting the text/event-stream media type of server-sent events.
+    Streaming views return the events themselves, this renderer only renders their error responses.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ('data: %s\n\n' % json.dumps(data)).encode(self.charset)
+
+
+class PolylineRenderer(JSONRenderer):
+    """
+    JSON renderer selected with ?format=polyline, for the views returning tracks as encoded polylines.
+    The view checks request.accepted_renderer.format to build the encoded payload.
+    """
+    format = 'polyline'
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
@@ -60,6 +61,21 @@ class LocationSerializer(serializers.ModelSerializer):
         fields = ('id', 'latitude', 'longitude')
 
 
+class LocationFixSerializer(serializers.Serializer):
+    latitude = serializers.FloatField()
+    longitude = serializers.FloatField()
+    datetime = serializers.DateTimeField()
+
+
+class LocationBatchSerializer(serializers.Serializer):
+    locations = LocationFixSerializer(many=True, allow_empty=False)
+
+    def validate_locations(self, value):
+        if len(value) > settings.LOCATION_BATCH_SIZE:
+            raise serializers.ValidationError('At most %d locations per batch' % settings.LOCATION_BATCH_SIZE)
+        return value
+
+
 class TeamLocationStopSerializer(serializers.Serializer):
     latitude = serializers.FloatField()
     longitude = serializers.FloatField()
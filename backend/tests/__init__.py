@@ -1,7 +1,16 @@
+from backend.tests.test_analytics import *
+from backend.tests.test_archive import *
 from backend.tests.test_authentication import *
+from backend.tests.test_benchmarks import *
 from backend.tests.test_challenges import *
 from backend.tests.test_events import *
+from backend.tests.test_export import *
+from backend.tests.test_geohash import *
+from backend.tests.test_indexes import *
 from backend.tests.test_locations import *
+from backend.tests.test_replay import *
 from backend.tests.test_scoreboard import *
+from backend.tests.test_scoring import *
 from backend.tests.test_teams import *
+from backend.tests.test_tracks import *
 from backend.tests.test_user import *
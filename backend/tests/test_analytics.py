@@ -0,0 +1,183 @@
+""" Unit tests for the distance and speed statistics of the teams (analytics REST API) """
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND
+
+from webapp.analytics import compute_statistics, get_event_statistics
+from webapp.models import Location, Event, Team, TeamLocation
+
+client = Client()
+User = get_user_model()
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+# Distance (in metres) of 0.001 degree of latitude
+STEP = 111.19
+
+
+class AnalyticsTests(TestCase):
+    password = '123456abc'
+
+    # URLs
+    login_url = 'api_login'
+    analytics_url = 'api_event_analytics'
+
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Create a user
+        self.user = User.objects.create(
+            first_name='Test',
+            last_name='User',
+            is_superuser=False,
+            email='user@test.com',
+            is_active=True,
+            is_staff=False,
+            phone='0123456789',
+            first_login=False,
+            password='pbkdf2_sha256$100000$Wxbl16Sprv4g$h4v5hURFNJY0/cpm/yeA1OKDGrX09O5Kb3Ghap4UJcg='
+        )
+
+        # Create start and end locations
+        self.start_location = Location.objects.create(latitude=0, longitude=0)
+        self.end_location = Location.objects.create(latitude=1, longitude=1)
+
+        # Create an event and two teams
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now(),
+            end_date=now(),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.start_location.pk,
+            end_location_id=self.end_location.pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+        self.team = Team.objects.create(event_id=self.event.pk)
+        self.other_team = Team.objects.create(event_id=self.event.pk)
+
+        # First team: 5 steps of 111 m in 10 s, stopped for 3 minutes, then 2 more steps
+        start_time = now()
+        points = [(index * 0.001, index * 10) for index in range(6)]
+        points += [(0.005, 50 + index * 60) for index in range(1, 4)]
+        points += [(0.005 + index * 0.001, 230 + index * 10) for index in range(1, 3)]
+        TeamLocation.objects.bulk_create(
+            [TeamLocation(team_id=self.team.pk, segment=1, latitude=latitude, longitude=0,
+                          datetime=start_time + timedelta(seconds=seconds)) for latitude, seconds in points] +
+            [TeamLocation(team_id=self.other_team.pk, segment=1, latitude=0, longitude=0, datetime=start_time)])
+
+    """
+    Unit tests for compute_statistics()
+    """
+
+    def test_compute_statistics(self):
+        print(separator)
+        print("Testing compute_statistics()")
+        print(separator)
+
+        print("No track points")
+        self.assertEqual(compute_statistics(*[np.array([])] * 5, stop_speed=1, stop_duration=120), [])
+        print(small_separator)
+
+        print("Two segments, stop at the end of the first one")
+        team_ids = np.array([1, 1, 1, 1, 1, 1])
+        segments = np.array([1, 1, 1, 1, 2, 2])
+        latitudes = np.array([0, 0.001, 0.001, 0.001, 0.002, 0.002])
+        longitudes = np.zeros(6)
+        times = np.array([0, 10, 70, 130, 1000, 1060], dtype=float)
+        first, second = compute_statistics(team_ids, segments, latitudes, longitudes, times, stop_speed=1,
+                                           stop_duration=120)
+        self.assertEqual((first['team_id'], first['segment'], second['segment']), (1, 1, 2))
+        self.assertAlmostEqual(first['distance'], STEP, places=0)
+        self.assertEqual(first['moving_time'], 10)
+        self.assertAlmostEqual(first['max_speed'], STEP / 10, places=1)
+        self.assertEqual(first['stops'], 1)
+        # The step between the segments is not counted
+        self.assertEqual((second['distance'], second['moving_time'], second['stops']), (0, 0, 0))
+        print(separator)
+
+    """
+    Unit tests for EventAnalyticsView
+    """
+
+    def test_event_analytics(self):
+        print(separator)
+        print("Testing /api/events/<event_id>/analytics/")
+        print(separator)
+
+        """
+        GET request, unauthenticated (expected HTTP 401)
+        """
+        print("GET request, unauthenticated")
+        print(small_separator)
+        api_response = client.get(reverse(self.analytics_url, args=[self.event.pk]))
+        self.assertEqual(api_response.status_code, HTTP_401_UNAUTHORIZED)
+        print("Got HTTP 401")
+        print(separator)
+
+        # Log in
+        request = client.post(reverse(self.login_url), {"username": self.user.email, "password": self.password})
+        headers = {"HTTP_AUTHORIZATION": "Token " + request.data['token']}
+
+        """
+        GET request, non-existing event (expected HTTP 404)
+        """
+        print("GET request, non-existing event")
+        print(small_separator)
+        api_response = client.get(reverse(self.analytics_url, args=[self.event.pk + 1]), **headers)
+        self.assertEqual(api_response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
+        """
+        GET request, valid (expected HTTP 200)
+        """
+        print("GET request, valid")
+        print(small_separator)
+        api_response = client.get(reverse(self.analytics_url, args=[self.event.pk]), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        print(small_separator)
+        team, other_team = api_response.data
+        self.assertEqual((team['team_id'], other_team['team_id']), (self.team.pk, self.other_team.pk))
+        self.assertAlmostEqual(team['distance'], 7 * STEP / 1000, places=2)
+        self.assertEqual(team['moving_time'], 70)
+        self.assertEqual(team['average_speed'], 40.0)
+        self.assertEqual(team['max_speed'], 40.0)
+        self.assertEqual(team['stops'], 1)
+        self.assertEqual([segment['segment'] for segment in team['segments']], [1])
+        self.assertEqual((other_team['distance'], other_team['average_speed'], other_team['stops']), (0, 0, 0))
+        print("Matching statistics")
+        print(separator)
+
+        print("Statistics cached until the event has new track points")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_event_statistics(self.event), api_response.data)
+        self.assertEqual(len(queries), 1)
+        start_time = TeamLocation.objects.get(team_id=self.other_team.pk).datetime
+        TeamLocation.objects.create(team_id=self.other_team.pk, segment=1, latitude=0.001, longitude=0,
+                                    datetime=start_time + timedelta(seconds=10))
+        self.assertEqual(get_event_statistics(self.event)[1]['max_speed'], 40.0)
+
+        print("Only the segments that grew computed again")
+        key = 'statistics_%d_1' % self.team.pk
+        entry = cache.get(key)
+        entry['statistics'] = dict(entry['statistics'], stops=5)
+        cache.set(key, entry)
+        TeamLocation.objects.create(team_id=self.other_team.pk, segment=1, latitude=0.002, longitude=0,
+                                    datetime=start_time + timedelta(seconds=20))
+        team, other_team = get_event_statistics(self.event)
+        self.assertEqual(team['stops'], 5)
+        self.assertAlmostEqual(other_team['distance'], 2 * STEP / 1000, places=2)
+        print(separator)
@@ -0,0 +1,144 @@
+""" Unit tests for the archive of the finished events """
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.status import HTTP_200_OK
+
+from webapp.analytics import get_event_statistics
+from webapp.archive import get_archive_path, read_archive
+from webapp.functions import get_map
+from webapp.models import Location, Event, Team, Challenge, TeamChallenge, TeamLocation, Score, TeamStanding
+from webapp.standings import refresh_standings
+
+client = Client()
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+
+class ArchiveTests(TestCase):
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Archives written to a temporary directory
+        self.archive_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(EVENT_ARCHIVE_ROOT=self.archive_root)
+        self.settings_override.enable()
+        cache.clear()
+
+        # Create start and end locations
+        self.start_location = Location.objects.create(latitude=0, longitude=0)
+        self.end_location = Location.objects.create(latitude=1, longitude=1)
+
+        # Create a finished event and two teams
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now() - timedelta(days=2),
+            end_date=now() - timedelta(days=1),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.start_location.pk,
+            end_location_id=self.end_location.pk,
+            winner_photo='',
+            is_active=False,
+            emergency_contact='0123456789')
+        self.challenge = Challenge.objects.create(
+            title='Challenge',
+            description='Description',
+            reward='00:15',
+            event_id=self.event.pk
+        )
+        self.teams = [Team.objects.create(event_id=self.event.pk) for _ in range(2)]
+
+        # Two segments of track points per team, a score and an accepted challenge
+        start_time = self.event.start_date
+        for number, team in enumerate(self.teams):
+            TeamLocation.objects.bulk_create(
+                [TeamLocation(team_id=team.pk, segment=segment, latitude=index * 0.001, longitude=number * 0.01,
+                              datetime=start_time + timedelta(seconds=(segment - 1) * 3600 + index * 10))
+                 for segment in (1, 2) for index in range(10)])
+            Score.objects.create(team_id=team.pk, start_location_id=self.start_location.pk,
+                                 end_location_id=self.end_location.pk, time=timedelta(hours=number + 1))
+        TeamChallenge.objects.create(team_id=self.teams[0].pk, challenge_id=self.challenge.pk,
+                                     location_id=self.end_location.pk, is_accepted=True, picture='challenge/test.jpg')
+        refresh_standings(self.event.pk)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.archive_root)
+        cache.clear()
+
+    """
+    Unit tests for the archive_events command
+    """
+
+    def test_archive_event(self):
+        print(separator)
+        print("Test the archive of a finished event")
+        print(separator)
+
+        standings = list(TeamStanding.objects.filter(event_id=self.event.pk).order_by('rank')
+                         .values_list('team_id', 'rank', 'final_time', 'bonus_time'))
+        team_routes = get_map(self.event.pk)
+        statistics = get_event_statistics(self.event)
+        cache.clear()
+
+        print("Archive the finished events")
+        call_command('archive_events', stdout=StringIO())
+
+        print("Test the rows are removed from the database")
+        team_ids = [team.pk for team in self.teams]
+        self.assertFalse(TeamLocation.objects.filter(team_id__in=team_ids).exists())
+        self.assertFalse(Score.objects.filter(team_id__in=team_ids).exists())
+        self.assertFalse(TeamChallenge.objects.filter(team_id__in=team_ids).exists())
+        self.event.refresh_from_db()
+        self.assertIsNotNone(self.event.archived)
+
+        print("Test the archive holds the rows")
+        self.assertTrue(os.path.exists(get_archive_path(self.event.pk)))
+        self.assertEqual(len(list(read_archive(self.event.pk, TeamLocation))), 40)
+        self.assertEqual(sorted(row['time'] for row in read_archive(self.event.pk, Score)),
+                         [timedelta(hours=1), timedelta(hours=2)])
+        submissions = list(read_archive(self.event.pk, TeamChallenge))
+        self.assertEqual(len(submissions), 1)
+        self.assertEqual(submissions[0]['picture'], 'challenge/test.jpg')
+        self.assertTrue(submissions[0]['is_accepted'])
+
+        print("Test the standings are frozen")
+        refresh_standings(self.event.pk)
+        self.assertEqual(list(TeamStanding.objects.filter(event_id=self.event.pk).order_by('rank')
+                              .values_list('team_id', 'rank', 'final_time', 'bonus_time')), standings)
+
+        print("Test the map and the statistics are read from the archive")
+        self.assertEqual(get_map(self.event.pk), team_routes)
+        self.assertEqual(get_event_statistics(self.event), statistics)
+
+        print(small_separator)
+        print("Test the event page of an archived event")
+        response = client.get(reverse('event_detail', kwargs={'event_id': self.event.pk}))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        print(small_separator)
+
+    def test_archive_active_event(self):
+        print(separator)
+        print("Test the archive of an active event")
+        print(separator)
+
+        self.event.is_active = True
+        self.event.save()
+        with self.assertRaises(CommandError):
+            call_command('archive_events', str(self.event.pk), stdout=StringIO())
+        self.assertEqual(TeamLocation.objects.filter(team__event_id=self.event.pk).count(), 40)
+        self.assertFalse(os.path.exists(get_archive_path(self.event.pk)))
+        print("Active event not archived")
+        print(small_separator)
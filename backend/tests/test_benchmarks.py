@@ -0,0 +1,204 @@
+""" Benchmarks of the REST API and the event page on a large synthetic event
+
+Skipped unless the GELIFT_BENCHMARK environment variable is set, e.g.:
+    GELIFT_BENCHMARK=1 python manage.py test backend.tests.test_benchmarks
+
+The query count, wall time and peak memory of each endpoint are written as a JSON report to the file named by
+GELIFT_BENCHMARK_REPORT (benchmark_report.json by default) and compared against the budgets checked in as
+benchmark_budgets.json. GELIFT_BENCHMARK_SCALE (1 by default) scales the size of the event for quick local runs, the
+budgets are only enforced at scale 1.
+"""
+import json
+import os
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.status import HTTP_200_OK
+
+from webapp.models import Location, Event, Team, UserTeam, Challenge, TeamChallenge, SubLocation, TeamLocation, Score
+from webapp.scoring import get_segments
+from webapp.standings import mark_standings_stale, refresh_standings
+
+client = Client()
+User = get_user_model()
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+budgets_file = os.path.join(os.path.dirname(__file__), 'benchmark_budgets.json')
+scale = float(os.environ.get('GELIFT_BENCHMARK_SCALE', 1))
+
+
+# Scales a number of rows of the synthetic event
+def scaled(count):
+    return max(int(count * scale), 1)
+
+
+@skipUnless(os.environ.get('GELIFT_BENCHMARK'), "Set GELIFT_BENCHMARK to run the benchmarks")
+class BenchmarkTests(TestCase):
+    # Size of the synthetic event
+    team_count = scaled(300)
+    members_per_team = 4
+    sub_destination_count = 10
+    ping_count = scaled(200000)
+    challenge_count = 20
+    submission_count = scaled(5000)
+
+    # Rows inserted per query
+    batch_size = 5000
+
+    """
+    Database set-up for the benchmarks (once for the whole class)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        start_time = now() - timedelta(days=1)
+
+        # Create start, end and sub-destination locations
+        locations = Location.objects.bulk_create(
+            [Location(latitude=51 + index / 10, longitude=5) for index in range(cls.sub_destination_count + 2)])
+
+        # Create the event and its sub-destinations
+        cls.event = Event.objects.create(
+            title='Benchmark',
+            start_date=start_time,
+            end_date=start_time + timedelta(days=2),
+            start_city='City 0',
+            end_city='City ' + str(cls.sub_destination_count + 1),
+            start_location_id=locations[0].pk,
+            end_location_id=locations[-1].pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+        SubLocation.objects.bulk_create(
+            [SubLocation(event_id=cls.event.pk, location_id=location.pk, city='City ' + str(order), order=order)
+             for order, location in enumerate(locations[1:-1], start=1)])
+        segments = get_segments(cls.event)
+
+        # Create the teams and their members, the first member is an administrator
+        teams = Team.objects.bulk_create(
+            [Team(event_id=cls.event.pk, is_disqualified=False, is_winner=False, timer_started=True)
+             for _ in range(cls.team_count)])
+        users = User.objects.bulk_create(
+            [User(first_name='User ' + str(index), last_name='Benchmark', email='user' + str(index) + '@test.com',
+                  is_active=True, is_staff=index == 0, first_login=False, password='')
+             for index in range(cls.team_count * cls.members_per_team)], batch_size=cls.batch_size)
+        UserTeam.objects.bulk_create(
+            [UserTeam(user_id=user.pk, team_id=teams[index // cls.members_per_team].pk)
+             for index, user in enumerate(users)], batch_size=cls.batch_size)
+        cls.user = users[0]
+        cls.token = Token.objects.create(user=cls.user).key
+
+        # Create the challenges and the submissions, every other one accepted
+        challenges = Challenge.objects.bulk_create(
+            [Challenge(event_id=cls.event.pk, title='Challenge ' + str(index), description='Description',
+                       reward=timedelta(minutes=15)) for index in range(cls.challenge_count)])
+        TeamChallenge.objects.bulk_create(
+            [TeamChallenge(team_id=teams[index % cls.team_count].pk,
+                           challenge_id=challenges[index // cls.team_count % cls.challenge_count].pk,
+                           location_id=locations[0].pk, picture='challenge/picture.jpg', is_accepted=index % 2 == 0)
+             for index in range(cls.submission_count)], batch_size=cls.batch_size)
+
+        # Create the location pings, spread evenly over the teams and their segments
+        pings_per_team = max(cls.ping_count // cls.team_count, len(segments) * 2)
+        for team in teams:
+            TeamLocation.objects.bulk_create(
+                [TeamLocation(team_id=team.pk, latitude=51 + index / pings_per_team, longitude=5 + team.pk / 1000,
+                              segment=index * len(segments) // pings_per_team + 1,
+                              datetime=start_time + timedelta(minutes=index))
+                 for index in range(pings_per_team)], batch_size=cls.batch_size)
+
+            # Every segment is completed
+            Score.objects.bulk_create(
+                [Score(team_id=team.pk, start_location_id=segment['start_id'], end_location_id=segment['end_id'],
+                       time=timedelta(minutes=pings_per_team // len(segments))) for segment in segments])
+
+    # Measures the query count, wall time and peak memory of @request (called once beforehand to warm the caches)
+    def measure(self, request):
+        request()
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request()
+            seconds = time.perf_counter() - start
+        # The next request resets the query log
+        query_count = len(queries.captured_queries)
+
+        tracemalloc.start()
+        request()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        if response is not None:
+            self.assertEqual(response.status_code, HTTP_200_OK)
+        return dict(queries=query_count, seconds=round(seconds, 3),
+                    peak_memory_kb=peak_memory // 1024)
+
+    # Returns the API request of @url_name
+    def api_request(self, url_name):
+        return lambda: client.get(reverse(url_name), HTTP_AUTHORIZATION="Token " + self.token)
+
+    # Rebuilds the standings from scratch
+    def rebuild_standings(self):
+        mark_standings_stale(self.event.pk)
+        refresh_standings(self.event.pk)
+
+    """
+    Benchmarks
+    """
+
+    def test_benchmarks(self):
+        print(separator)
+        print("Benchmarking a synthetic event (scale " + str(scale) + ")")
+        print(separator)
+
+        requests = [
+            ('scoreboard', self.api_request('api_scoreboard')),
+            ('scoreboard_rebuild', self.rebuild_standings),
+            ('teams', self.api_request('api_teams')),
+            ('team_route', self.api_request('api_my_team_route')),
+            ('challenges', self.api_request('api_challenges')),
+            ('admin_challenges', self.api_request('api_challenge_admin')),
+            ('active_event', self.api_request('api_active_event')),
+            ('event_detail', lambda: client.get(reverse('event_detail', args=[self.event.pk]))),
+        ]
+
+        report = {}
+        for name, request in requests:
+            report[name] = self.measure(request)
+            print(name + ": " + json.dumps(report[name], sort_keys=True))
+
+        # Write the report
+        report_file = os.environ.get('GELIFT_BENCHMARK_REPORT', 'benchmark_report.json')
+        with open(report_file, 'w') as file:
+            json.dump(dict(scale=scale, results=report), file, indent=4, sort_keys=True)
+        print(small_separator)
+        print("Report written to " + report_file)
+        print(separator)
+
+        # Compare against the budgets
+        if scale != 1:
+            print("Budgets not enforced at scale " + str(scale))
+            print(separator)
+            return
+
+        with open(budgets_file) as file:
+            budgets = json.load(file)
+
+        exceeded = []
+        for name, budget in sorted(budgets.items()):
+            for metric, limit in sorted(budget.items()):
+                if report[name][metric] > limit:
+                    exceeded.append("%s %s: %s > %s" % (name, metric, report[name][metric], limit))
+        self.assertFalse(exceeded, "Budgets exceeded:\n" + "\n".join(exceeded))
+        print("Within budgets")
+        print(separator)
@@ -1,7 +1,11 @@
 """ Unit tests for the events REST API (backend) """
 
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
+from django.db.models.signals import pre_save
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 # APIClient
 from django.urls import reverse
 from django.utils.timezone import now
@@ -181,6 +185,42 @@ class EventTests(TestCase):
         print("End location matching")
         print(separator)
 
+        """
+        GET request, active event cached (expected a single query, for the sub-destinations)
+        """
+        print("GET request with the active event cached")
+        print(small_separator)
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse(self.active_event_view_url))
+            query_count = len(queries)
+        self.assertEqual(query_count, 1)
+        print("Active event read from the cache")
+        print(separator)
+
+        """
+        GET request, end location edited (expected HTTP 200 and the new coordinates)
+        """
+        print("GET request with the end location edited")
+        print(small_separator)
+        self.end_location.latitude = 5
+        self.end_location.save()
+        api_response = client.get(reverse(self.active_event_view_url))
+        self.assertEqual(api_response.data['end_location']['latitude'], 5)
+        print("Active event reloaded")
+        print(small_separator)
+
+        """
+        GET request, event marked as inactive (expected HTTP 404)
+        """
+        print("GET request with the event marked as inactive")
+        print(small_separator)
+        self.event.is_active = False
+        self.event.save()
+        api_response = client.get(reverse(self.active_event_view_url))
+        self.assertEqual(api_response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
     """ 
     Unit tests for view EmergencyContactView 
     """
@@ -273,3 +313,43 @@ class EventTests(TestCase):
         self.assertEqual(event.emergency_contact, emergency_contact)
         print("Matching emergency contact")
         print(separator)
+
+    """
+    Unit tests for the event administration views
+    """
+
+    def test_edit_event_keeps_standings(self):
+        print(separator)
+        print("Testing the event administration views against concurrent writes to the standings")
+        print(separator)
+
+        superuser = User.objects.create(email='superuser@test.com', first_name='Super', last_name='User',
+                                        is_superuser=True, is_active=True, is_staff=True, phone='0123456789',
+                                        first_login=False)
+        web_client = Client()
+        web_client.force_login(superuser)
+
+        # Another process writing the standings and the archive flag between the read and the save of a view
+        def concurrent_write(sender, instance, **kwargs):
+            Event.objects.filter(pk=instance.pk).update(standings_version=F('standings_version') + 5, archived=now())
+
+        version = Event.objects.get(pk=self.event.pk).standings_version
+        pre_save.connect(concurrent_write, sender=Event)
+        try:
+            print("Edit the title and mark the event inactive")
+            api_response = web_client.post(reverse('edit_event', kwargs={'event_id': self.event.pk}),
+                                           {'title': 'Edited event'})
+            self.assertEqual(api_response.status_code, HTTP_200_OK)
+            Event.objects.filter(pk=self.event.pk).update(is_active=True)
+            api_response = web_client.get(reverse('make_event_inactive', kwargs={'event_id': self.event.pk}))
+            self.assertEqual(api_response.status_code, HTTP_200_OK)
+        finally:
+            pre_save.disconnect(concurrent_write, sender=Event)
+
+        print("Test the version only moved forward and the archive flag was kept")
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.title, 'Edited event')
+        self.assertFalse(self.event.is_active)
+        self.assertGreater(self.event.standings_version, version + 10)
+        self.assertIsNotNone(self.event.archived)
+        print(small_separator)
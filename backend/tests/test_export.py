@@ -0,0 +1,177 @@
+""" Unit tests for the GPX/GeoJSON export of the team tracks (webapp) """
+import json
+from datetime import timedelta
+from xml.etree import ElementTree
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.status import HTTP_200_OK, HTTP_302_FOUND, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, \
+    HTTP_404_NOT_FOUND
+
+from webapp.models import Location, Event, Team, TeamLocation
+
+client = Client()
+User = get_user_model()
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+GPX = '{http://www.topografix.com/GPX/1/1}'
+
+
+class ExportTests(TestCase):
+    # URLs
+    event_export_url = 'export_event_tracks'
+    team_export_url = 'export_team_track'
+
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Create users
+        self.superuser = User.objects.create(first_name='Super', last_name='User', is_superuser=True,
+                                             email='superuser@test.com', is_active=True, is_staff=True,
+                                             phone='0123456789', first_login=False)
+        self.user = User.objects.create(first_name='Test', last_name='User', is_superuser=False,
+                                        email='user@test.com', is_active=True, is_staff=True,
+                                        phone='0123456789', first_login=False)
+
+        # Create start and end locations
+        self.start_location = Location.objects.create(latitude=0, longitude=0)
+        self.end_location = Location.objects.create(latitude=1, longitude=1)
+
+        # Create an event and two teams
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now(),
+            end_date=now(),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.start_location.pk,
+            end_location_id=self.end_location.pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+        self.team = Team.objects.create(event_id=self.event.pk)
+        self.other_team = Team.objects.create(event_id=self.event.pk)
+
+        # Two segments of 3 track points for the first team, one segment of 2 track points for the other
+        start_time = now()
+        TeamLocation.objects.bulk_create(
+            [TeamLocation(team_id=self.team.pk, segment=segment, latitude=segment + index * 0.001, longitude=0.5,
+                          datetime=start_time + timedelta(hours=segment, minutes=index))
+             for segment in (1, 2) for index in range(3)] +
+            [TeamLocation(team_id=self.other_team.pk, segment=1, latitude=0.5, longitude=index * 0.001,
+                          datetime=start_time + timedelta(minutes=index)) for index in range(2)])
+
+    """
+    Unit tests for the export views
+    """
+
+    def test_export(self):
+        print(separator)
+        print("Testing /admin/event/<event_id>/export/ and /admin/team/<team_id>/export/")
+        print(separator)
+
+        """
+        GET request, not logged in (expected redirection to the login page)
+        """
+        print("GET request, not logged in")
+        print(small_separator)
+        response = client.get(reverse(self.event_export_url, args=[self.event.pk]))
+        self.assertEqual(response.status_code, HTTP_302_FOUND)
+        print("Redirected to the login page")
+        print(separator)
+
+        """
+        GET request, not superuser (expected HTTP 403)
+        """
+        print("GET request, not superuser")
+        print(small_separator)
+        client.force_login(self.user)
+        response = client.get(reverse(self.event_export_url, args=[self.event.pk]))
+        self.assertEqual(response.status_code, HTTP_403_FORBIDDEN)
+        print("Got HTTP 403")
+        print(separator)
+
+        client.force_login(self.superuser)
+
+        """
+        GET request, invalid format (expected HTTP 400)
+        """
+        print("GET request, invalid format")
+        print(small_separator)
+        response = client.get(reverse(self.event_export_url, args=[self.event.pk]), {'format': 'kml'})
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        """
+        GET request, non-existing team (expected HTTP 404)
+        """
+        print("GET request, non-existing team")
+        print(small_separator)
+        response = client.get(reverse(self.team_export_url, args=[self.other_team.pk + 1]))
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
+        """
+        GET request, event as GPX (expected HTTP 200)
+        """
+        print("GET request, event as GPX")
+        print(small_separator)
+        # The track points are read in chunks of 2 rows, with a single query
+        with override_settings(EXPORT_CHUNK_SIZE=2), CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse(self.event_export_url, args=[self.event.pk]))
+            self.assertEqual(response.status_code, HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content)
+            self.assertEqual(len([query for query in queries if 'webapp_teamlocation' in query['sql']]), 1)
+        print("Got HTTP 200")
+        print(small_separator)
+        self.assertEqual(response['Content-Type'], 'application/gpx+xml')
+        self.assertIn('event_%d.gpx' % self.event.pk, response['Content-Disposition'])
+        tracks = ElementTree.fromstring(content).findall(GPX + 'trk')
+        self.assertEqual([track.find(GPX + 'name').text for track in tracks],
+                         ['Team %d' % self.team.pk, 'Team %d' % self.other_team.pk])
+        self.assertEqual([len(segment.findall(GPX + 'trkpt')) for segment in tracks[0].findall(GPX + 'trkseg')],
+                         [3, 3])
+        point = tracks[0].find(GPX + 'trkseg').find(GPX + 'trkpt')
+        self.assertEqual((float(point.get('lat')), float(point.get('lon'))), (1, 0.5))
+        print("Matching tracks")
+        print(separator)
+
+        """
+        GET request, team as GeoJSON (expected HTTP 200)
+        """
+        print("GET request, team as GeoJSON")
+        print(small_separator)
+        response = client.get(reverse(self.team_export_url, args=[self.other_team.pk]), {'format': 'geojson'})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        print(small_separator)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        features = json.loads(b''.join(response.streaming_content).decode())['features']
+        self.assertEqual([feature['geometry']['coordinates'] for feature in features], [[0, 0.5], [0.001, 0.5]])
+        self.assertEqual({(feature['properties']['team_id'], feature['properties']['segment']) for feature in features},
+                         {(self.other_team.pk, 1)})
+        print("Matching track points")
+        print(separator)
+
+        """
+        GET request, event without track points (expected HTTP 200)
+        """
+        print("GET request, event without track points")
+        print(small_separator)
+        TeamLocation.objects.all().delete()
+        response = client.get(reverse(self.event_export_url, args=[self.event.pk]), {'format': 'geojson'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content).decode())['features'], [])
+        response = client.get(reverse(self.event_export_url, args=[self.event.pk]))
+        self.assertEqual(ElementTree.fromstring(b''.join(response.streaming_content)).findall(GPX + 'trk'), [])
+        print("Empty documents")
+        print(separator)
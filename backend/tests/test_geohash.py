@@ -0,0 +1,111 @@
+""" Unit tests for the geohash grid index of the locations and track points """
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.timezone import now
+from io import StringIO
+
+from webapp.geohash import cover, encode, filter_bounding_box, within_radius
+from webapp.models import Location, Event, Team, TeamLocation
+
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+
+class GeohashTests(TestCase):
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Create locations around Eindhoven (about 110 m apart) and one in Amsterdam
+        self.locations = [Location.objects.create(latitude=51.44 + index * 0.001, longitude=5.47)
+                          for index in range(5)]
+        self.far_location = Location.objects.create(latitude=52.37, longitude=4.89)
+
+        # Create an event and a team
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now(),
+            end_date=now(),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.locations[0].pk,
+            end_location_id=self.far_location.pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+        self.team = Team.objects.create(event_id=self.event.pk, is_disqualified=False, is_winner=False,
+                                        timer_started=True)
+
+    """
+    Unit tests for encode() and cover()
+    """
+
+    def test_encode(self):
+        print(separator)
+        print("Testing encode() and cover()")
+        print(separator)
+
+        print("Known geohash")
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        print(small_separator)
+
+        print("Prefix of the shorter geohashes")
+        self.assertEqual(encode(57.64911, 10.40744, 5), 'u4pru')
+        print(small_separator)
+
+        print("Cover of a bounding box")
+        cells = cover(51.4395, 5.4695, 51.4445, 5.4705)
+        self.assertLessEqual(len(cells), 16)
+        for location in self.locations:
+            self.assertTrue(any(location.geohash.startswith(cell) for cell in cells))
+        self.assertFalse(any(self.far_location.geohash.startswith(cell) for cell in cells))
+
+    """
+    Unit tests for filter_bounding_box() and within_radius()
+    """
+
+    def test_queries(self):
+        print(separator)
+        print("Testing filter_bounding_box() and within_radius()")
+        print(separator)
+
+        print("Geohash set on save")
+        self.assertEqual(Location.objects.get(pk=self.far_location.pk).geohash, encode(52.37, 4.89))
+        print(small_separator)
+
+        print("Points inside a bounding box")
+        points = filter_bounding_box(Location.objects.all(), 51.4405, 5.46, 51.4425, 5.48)
+        self.assertEqual(set(points), {self.locations[1], self.locations[2]})
+        print(small_separator)
+
+        print("Points within 150 m, nearest first")
+        points = within_radius(Location.objects.all(), 51.4421, 5.47, 150)
+        self.assertEqual([point for _, point in points], [self.locations[2], self.locations[3], self.locations[1]])
+        self.assertAlmostEqual(points[0][0], 11.1, places=0)
+        print(small_separator)
+
+        print("Geohash set on bulk insert")
+        TeamLocation.objects.bulk_create([TeamLocation(team_id=self.team.pk, segment=1, latitude=52.37,
+                                                       longitude=4.89, datetime=now())])
+        points = within_radius(TeamLocation.objects.filter(team_id=self.team.pk), 52.37, 4.89, 10)
+        self.assertEqual(len(points), 1)
+        self.assertEqual(points[0][1].geohash, encode(52.37, 4.89))
+
+    """
+    Unit tests for the index_geohashes command
+    """
+
+    def test_index_geohashes(self):
+        print(separator)
+        print("Testing the index_geohashes command")
+        print(separator)
+
+        # Points stored before the index was added
+        Location.objects.all().update(geohash=None)
+
+        out = StringIO()
+        call_command('index_geohashes', stdout=out)
+        self.assertIn('6 locations and 0 track points indexed', out.getvalue())
+        self.assertEqual(Location.objects.get(pk=self.far_location.pk).geohash, encode(52.37, 4.89))
+        self.assertFalse(Location.objects.filter(geohash__isnull=True).exists())
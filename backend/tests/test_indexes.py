@@ -0,0 +1,108 @@
+""" Query plan tests of the hot lookups, checking that they use the composite indexes of the models """
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils.timezone import now
+
+from webapp.geohash import filter_bounding_box
+from webapp.models import Event, Location, Score, SubLocation, Team, TeamChallenge, TeamLocation, UserTeam
+
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+
+def explain(queryset):
+    """
+    :param queryset: QuerySet to explain
+    :return: Query plan of @queryset (text)
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        # The test tables are nearly empty: without this, a sequential scan is always the cheapest plan
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def index_names(model, columns):
+    """
+    :param model: Model class
+    :param columns: List of the columns of the index
+    :return: Names of the indexes of @model on @columns (on PostgreSQL, the text columns have a second index for LIKE)
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return [name for name, constraint in constraints.items()
+            if constraint['index'] and constraint['columns'] == columns]
+
+
+class IndexTests(TestCase):
+    """
+    Unit tests for the query plans of the hot lookups
+    """
+
+    def assertUsesIndex(self, queryset, model, columns):
+        plan = explain(queryset)
+        # The expected index must exist, otherwise the pattern would match any index
+        names = index_names(model, columns)
+        self.assertTrue(names, 'No index on %s%s' % (model._meta.db_table, tuple(columns)))
+        # "Index Scan using <index> on <table>", "Index Only Scan using ..." or "Bitmap Index Scan on <index>"
+        self.assertRegex(plan, r'(using|Bitmap Index Scan on) (%s)\b' % '|'.join(names))
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_query_plans(self):
+        print(separator)
+        print("Testing the query plans of the hot lookups")
+        print(separator)
+
+        # Track points of a team over several segments, with up-to-date statistics: both indexes of TeamLocation cost
+        # the same on an empty table, the planner would pick either of them
+        location = Location.objects.create(latitude=0, longitude=0)
+        event = Event.objects.create(title='Event', start_date=now(), end_date=now(), start_city='Eindhoven',
+                                     end_city='Amsterdam', start_location=location, end_location=location,
+                                     winner_photo='', emergency_contact='0123456789')
+        team = Team.objects.create(event=event)
+        TeamLocation.objects.bulk_create(
+            [TeamLocation(team=team, segment=segment, latitude=0, longitude=0,
+                          datetime=now() + timedelta(minutes=segment * 100 + index))
+             for segment in range(1, 21) for index in range(50)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE %s' % TeamLocation._meta.db_table)
+
+        print("Last track point of a team")
+        self.assertUsesIndex(TeamLocation.objects.filter(team_id=team.pk).order_by('-datetime')[:1],
+                             TeamLocation, ['team_id', 'datetime'])
+        print(small_separator)
+
+        print("Track points of a segment")
+        self.assertUsesIndex(TeamLocation.objects.filter(team_id=team.pk, segment=2).order_by('datetime'),
+                             TeamLocation, ['team_id', 'segment', 'datetime'])
+        print(small_separator)
+
+        print("Team of a user")
+        self.assertUsesIndex(UserTeam.objects.filter(user_id=1, team_id=2), UserTeam, ['user_id', 'team_id'])
+        print(small_separator)
+
+        print("Accepted submissions of a team for a challenge")
+        self.assertUsesIndex(TeamChallenge.objects.filter(team_id=1, challenge_id=2, is_accepted=True),
+                             TeamChallenge, ['team_id', 'challenge_id', 'is_accepted'])
+        print(small_separator)
+
+        print("Score of a team at a destination")
+        self.assertUsesIndex(Score.objects.filter(team_id=1, end_location_id=2), Score, ['team_id', 'end_location_id'])
+        print(small_separator)
+
+        print("Sub-destinations of an event in order")
+        self.assertUsesIndex(SubLocation.objects.filter(event_id=1).order_by('order'), SubLocation,
+                             ['event_id', 'order'])
+        print(small_separator)
+
+        print("Active event")
+        self.assertUsesIndex(Event.objects.filter(is_active=True), Event, ['is_active'])
+        print(small_separator)
+
+        print("Locations inside a bounding box")
+        self.assertUsesIndex(filter_bounding_box(Location.objects.all(), 51.44, 5.47, 51.45, 5.48), Location,
+                             ['geohash'])
+        print(separator)
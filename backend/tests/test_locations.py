@@ -1,14 +1,24 @@
 """ Unit tests for the location REST API (backend) """
+import json
+import os
+import subprocess
+import tempfile
 from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase
 from django.urls import reverse
 from django.utils.timezone import now
 from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED, HTTP_200_OK, HTTP_401_UNAUTHORIZED, \
-    HTTP_400_BAD_REQUEST, HTTP_417_EXPECTATION_FAILED
+    HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, HTTP_417_EXPECTATION_FAILED
 
-from webapp.models import Location, Event, Team, UserTeam, TeamLocation, Score
+from webapp.geo import find_arrival
+from webapp.ingest import LocationBuffer, PingFilter
+from webapp.models import Location, Event, Team, UserTeam, TeamLocation, Score, SubLocation
+from webapp.tracks import encode_polyline
 
 client = Client()
 User = get_user_model()
@@ -24,6 +34,8 @@ class LocationTests(TestCase):
     login_url = 'api_login'
     logout_url = 'api_logout'
     location_view_url = 'api_my_team_location'
+    location_batch_url = 'api_my_team_locations'
+    location_buffer_url = 'api_location_buffer'
     timer_start_url = '/api/teams/my/start/'
     timer_stop_url = '/api/teams/my/stop/'
     route_url = 'api_my_team_route'
@@ -96,7 +108,8 @@ class LocationTests(TestCase):
         self.team_location = TeamLocation.objects.create(
             segment=1,
             datetime=now(),
-            location_id=self.location.pk,
+            latitude=self.location.latitude,
+            longitude=self.location.longitude,
             team_id=self.team.pk
         )
 
@@ -199,20 +212,20 @@ class LocationTests(TestCase):
         print(small_separator)
         # Check against database
         last_location = TeamLocation.objects.latest('datetime')
-        location = Location.objects.get(pk=last_location.location_id)
 
         self.assertEqual(last_location.segment, self.team_location.segment)
         print("Matching segment")
-        self.assertEqual(self.dummy_data['latitude'], location.latitude)
+        self.assertEqual(self.dummy_data['latitude'], last_location.latitude)
         print("Matching latitude")
-        self.assertEqual(self.dummy_data['longitude'], location.longitude)
+        self.assertEqual(self.dummy_data['longitude'], last_location.longitude)
         print("Matching longitude")
         self.assertEqual(self.team.pk, last_location.team_id)
         print("Matching team ID")
         print(separator)
 
-        # Delete known locations
+        # Delete known locations, and the segment of the team read from them
         TeamLocation.objects.all().delete()
+        Team.objects.filter(pk=self.team.pk).update(segment=0)
 
         """
         POST request, no last known location (expected HTTP 417)
@@ -312,7 +325,6 @@ class LocationTests(TestCase):
         # Check against database
         team = Team.objects.get(pk=self.team.pk)
         team_location = TeamLocation.objects.latest('datetime')
-        location = Location.objects.latest('pk')
 
         self.assertEqual(team.timer_started, True)
         print("Timer started successfully")
@@ -320,11 +332,11 @@ class LocationTests(TestCase):
         print("Segment OK")
         self.assertEqual(team_location.team_id, self.team.pk)
         print("Matching team ID")
-        self.assertEqual(team_location.location_id, location.pk)
-        print("Matching location ID")
-        self.assertEqual(location.latitude, self.dummy_data['latitude'])
+        self.assertEqual(team_location.location_id, None)
+        print("No named location")
+        self.assertEqual(team_location.latitude, self.dummy_data['latitude'])
         print("Matching latitude")
-        self.assertEqual(location.longitude, self.dummy_data['longitude'])
+        self.assertEqual(team_location.longitude, self.dummy_data['longitude'])
         print("Matching longitude")
         print(separator)
 
@@ -344,7 +356,6 @@ class LocationTests(TestCase):
         # Check against database
         team = Team.objects.get(pk=self.team.pk)
         team_location = TeamLocation.objects.latest('datetime')
-        location = Location.objects.latest('pk')
 
         self.assertEqual(team.timer_started, True)
         print("Timer started successfully")
@@ -352,11 +363,11 @@ class LocationTests(TestCase):
         print("Segment OK")
         self.assertEqual(team_location.team_id, self.team.pk)
         print("Matching team ID")
-        self.assertEqual(team_location.location_id, location.pk)
-        print("Matching location ID")
-        self.assertEqual(location.latitude, self.dummy_data['latitude'])
+        self.assertEqual(team_location.location_id, None)
+        print("No named location")
+        self.assertEqual(team_location.latitude, self.dummy_data['latitude'])
         print("Matching latitude")
-        self.assertEqual(location.longitude, self.dummy_data['longitude'])
+        self.assertEqual(team_location.longitude, self.dummy_data['longitude'])
         print("Matching longitude")
         print(separator)
 
@@ -533,18 +544,17 @@ class LocationTests(TestCase):
 
         # Check against database
         team_location = TeamLocation.objects.latest('pk')
-        location = Location.objects.latest('pk')
         team = Team.objects.get(pk=self.team.pk)
 
         self.assertEqual(team_location.segment, self.team_location.segment)
         print("Matching segment")
-        self.assertEqual(team_location.location_id, location.pk)
-        print("Matching location")
+        self.assertEqual(team_location.location_id, None)
+        print("No named location")
         self.assertEqual(team_location.team_id, self.team.pk)
         print("Matching team ID")
-        self.assertEqual(location.latitude, self.dummy_data['latitude'])
+        self.assertEqual(team_location.latitude, self.dummy_data['latitude'])
         print("Matching latitude")
-        self.assertEqual(location.longitude, self.dummy_data['longitude'])
+        self.assertEqual(team_location.longitude, self.dummy_data['longitude'])
         print("Matching longitude")
         self.assertEqual(team.timer_started, False)
         print("Successfully stopped timer")
@@ -566,6 +576,413 @@ class LocationTests(TestCase):
         print("Got HTTP 417")
         print(separator)
 
+    def test_team_location_stop_progress(self):
+        print(separator)
+        print("Testing the segment state kept by /api/teams/my/start/ and /api/teams/my/stop/")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+
+        # Log in as team member
+        request = client.post(reverse(self.login_url), {"username": self.team_user.email, "password": self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        Start, team with a location history but no segment state (expected segment after the last one)
+        """
+        print("Start, team with a location history but no segment state")
+        print(small_separator)
+        client.post(self.timer_start_url, data={'latitude': 3, 'longitude': 3}, **headers)
+        team = Team.objects.get(pk=self.team.pk)
+        start = TeamLocation.objects.latest('datetime')
+        self.assertEqual(team.segment, 2)
+        print("Matching segment")
+        self.assertEqual(team.segment_start, start.datetime)
+        print("Matching segment start")
+        self.assertEqual(team.unscored_time, timedelta())
+        print("No unscored time")
+        print(separator)
+
+        """
+        Stop at a location (expected score of the segment)
+        """
+        print("Stop at a location")
+        print(small_separator)
+        client.post(self.timer_stop_url, data={'latitude': 3, 'longitude': 3, 'location_id': self.location.pk},
+                    **headers)
+        team = Team.objects.get(pk=self.team.pk)
+        stop = TeamLocation.objects.latest('datetime')
+        score = Score.objects.get(team_id=self.team.pk)
+        self.assertEqual(score.time, stop.datetime - start.datetime)
+        print("Matching score")
+        self.assertEqual(team.unscored_time, timedelta())
+        print("No unscored time")
+        print(separator)
+
+        """
+        Stop without location, then at the end location (expected score of both segments)
+        """
+        print("Stop without location, then at the end location")
+        print(small_separator)
+        client.post(self.timer_start_url, data={'latitude': 3, 'longitude': 3}, **headers)
+        client.post(self.timer_stop_url, data={'latitude': 3, 'longitude': 3, 'location_id': -1}, **headers)
+        team = Team.objects.get(pk=self.team.pk)
+        segment_3 = TeamLocation.objects.filter(team_id=self.team.pk, segment=3).order_by('datetime')
+        segment_3_time = segment_3.last().datetime - segment_3.first().datetime
+        self.assertEqual(team.unscored_time, segment_3_time)
+        print("Matching unscored time")
+
+        client.post(self.timer_start_url, data={'latitude': 3, 'longitude': 3}, **headers)
+        client.post(self.timer_stop_url,
+                    data={'latitude': 3, 'longitude': 3, 'location_id': self.end_location.pk}, **headers)
+        team = Team.objects.get(pk=self.team.pk)
+        segment_4 = TeamLocation.objects.filter(team_id=self.team.pk, segment=4).order_by('datetime')
+        score = Score.objects.get(team_id=self.team.pk, end_location_id=self.end_location.pk)
+        self.assertEqual(score.time, segment_3_time + segment_4.last().datetime - segment_4.first().datetime)
+        print("Matching score")
+        self.assertEqual(score.start_location_id, self.location.pk)
+        print("Matching start location")
+        self.assertEqual(team.segment, 4)
+        print("Matching segment")
+        self.assertEqual(team.unscored_time, timedelta())
+        print("No unscored time")
+        print(separator)
+
+    """
+    Unit tests for the automatic arrival of LocationView
+    """
+    def test_location_arrival(self):
+        print(separator)
+        print("Testing the automatic arrival at the next destination")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+
+        # Log in as team member and start the timer
+        request = client.post(reverse(self.login_url), {"username": self.team_user.email, "password": self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+        client.post(self.timer_start_url, data={'latitude': 0, 'longitude': 0}, **headers)
+
+        """
+        POST request, outside the geofence of the end location (expected HTTP 200, timer running)
+        """
+        print("POST request, outside the geofence")
+        print(small_separator)
+        api_response = client.post(reverse(self.location_view_url), data={'latitude': 1.01, 'longitude': 1},
+                                   **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertTrue(Team.objects.get(pk=self.team.pk).timer_started)
+        print("Timer running")
+        print(separator)
+
+        """
+        POST request, inside the geofence of the end location (expected HTTP 200, segment scored)
+        """
+        print("POST request, inside the geofence")
+        print(small_separator)
+        api_response = client.post(reverse(self.location_view_url), data={'latitude': 1.0005, 'longitude': 1},
+                                   **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data, {'arrived_location_id': self.end_location.pk})
+        print("Arrived at the end location")
+        self.assertFalse(Team.objects.get(pk=self.team.pk).timer_started)
+        print("Timer stopped")
+        self.assertTrue(Score.objects.filter(team_id=self.team.pk, end_location_id=self.end_location.pk).exists())
+        print("Segment scored")
+        print(separator)
+
+    def test_find_arrival(self):
+        print(separator)
+        print("Testing find_arrival()")
+        print(separator)
+
+        # A sub-destination before the end location
+        sub_location = Location.objects.create(latitude=0.5, longitude=0.5)
+        SubLocation.objects.create(event_id=self.event.pk, location_id=sub_location.pk, city='City', order=1)
+        self.assertIsNone(find_arrival(self.team, self.event, 1, 1))
+        self.assertEqual(find_arrival(self.team, self.event, 0.5, 0.5), sub_location.pk)
+        print("The sub-destination is the next destination")
+
+        # Stopped at the sub-destination without a score (no travel time)
+        TeamLocation.objects.create(team_id=self.team.pk, segment=1, latitude=0.5, longitude=0.5, datetime=now(),
+                                    location_id=sub_location.pk)
+        self.assertIsNone(find_arrival(self.team, self.event, 0.5, 0.5))
+        self.assertEqual(find_arrival(self.team, self.event, 1, 1), self.end_location.pk)
+        print("The end location is the next destination")
+        print(separator)
+
+    """
+    Unit tests for LocationBatchView view
+    """
+    def test_location_batch(self):
+        print(separator)
+        print("Testing /api/teams/my/locations/")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+
+        # Log in as team member
+        request = client.post(reverse(self.login_url), {"username": self.team_user.email, "password": self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        POST request, invalid data (expected HTTP 400)
+        """
+        print("POST request, invalid data")
+        print(small_separator)
+        api_response = client.post(reverse(self.location_batch_url), data=json.dumps({'locations': []}),
+                                   content_type='application/json', **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        # Start the timer (segment 2)
+        client.post(self.timer_start_url, data={'latitude': 3, 'longitude': 3}, **headers)
+        start = TeamLocation.objects.latest('datetime')
+
+        """
+        POST request, valid data (expected HTTP 200, locations attributed to their segment)
+        """
+        print("POST request, valid data")
+        print(small_separator)
+        locations = [
+            # Running segment
+            {'latitude': 4, 'longitude': 4, 'datetime': start.datetime.isoformat()},
+            # Timer stopped
+            {'latitude': 5, 'longitude': 5, 'datetime': (self.team_location.datetime - timedelta(hours=1)).isoformat()},
+            # Stopped segment
+            {'latitude': 6, 'longitude': 6, 'datetime': self.team_location.datetime.isoformat()},
+            # Future
+            {'latitude': 7, 'longitude': 7, 'datetime': (now() + timedelta(hours=1)).isoformat()},
+        ]
+        api_response = client.post(reverse(self.location_batch_url), data=json.dumps({'locations': locations}),
+                                   content_type='application/json', **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data, {'accepted': 2, 'rejected': 2})
+        print("2 locations accepted, 2 rejected")
+        self.assertEqual(TeamLocation.objects.filter(segment=1, latitude=6).count(), 1)
+        print("Location attributed to the stopped segment")
+        self.assertEqual(TeamLocation.objects.filter(segment=2, latitude=4).count(), 1)
+        print("Location attributed to the running segment")
+        print(separator)
+
+        """
+        POST request, too many locations (expected HTTP 400)
+        """
+        print("POST request, too many locations")
+        print(small_separator)
+        with self.settings(LOCATION_BATCH_SIZE=1):
+            api_response = client.post(reverse(self.location_batch_url),
+                                       data=json.dumps({'locations': locations[:2]}),
+                                       content_type='application/json', **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+    """
+    Unit tests for the buffered ingestion of LocationView
+    """
+    def test_location_buffer(self):
+        print(separator)
+        print("Testing the location buffer")
+        print(separator)
+
+        # Mark event and timer as started
+        self.event.is_active = True
+        self.event.save()
+        self.team.timer_started = True
+        self.team.save()
+
+        # Log in as team member
+        request = client.post(reverse(self.login_url), {"username": self.team_user.email, "password": self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        # Buffer flushed by the test only
+        spill_file = os.path.join(tempfile.mkdtemp(), 'spill.jsonl')
+        buffer = LocationBuffer(flush_interval=3600 * 1000, flush_size=1000, spill_file=spill_file)
+        count = TeamLocation.objects.count()
+
+        """
+        POST request, buffered mode (expected HTTP 200, location buffered)
+        """
+        print("POST request, buffered mode")
+        print(small_separator)
+        with self.settings(LOCATION_INGEST_MODE='buffered'), \
+                mock.patch('backend.views.locations.get_location_buffer', return_value=buffer):
+            api_response = client.post(reverse(self.location_view_url), data=self.dummy_data, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(TeamLocation.objects.count(), count)
+        self.assertEqual(buffer.stats()['depth'], 1)
+        print("Location buffered")
+        print(separator)
+
+        """
+        Spill, then flush (expected location stored once)
+        """
+        print("Spill, then flush")
+        print(small_separator)
+        self.assertEqual(buffer.spill(), 1)
+        self.assertEqual(buffer.spill_file, '%s.%d' % (spill_file, os.getpid()))
+        self.assertTrue(os.path.exists(buffer.spill_file))
+        print("Location spilled to the spill file of the process")
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(os.listdir(os.path.dirname(spill_file)), [])
+        self.assertEqual(TeamLocation.objects.filter(latitude=self.dummy_data['latitude']).count(), 1)
+        print("Location stored")
+        stats = buffer.stats()
+        self.assertEqual((stats['depth'], stats['flushed'], stats['flushes'], stats['spilled']), (0, 1, 1, 1))
+        print("Counters updated")
+        print(separator)
+
+        """
+        Flush with the spill file of an exited process (expected location stored)
+        """
+        print("Flush with the spill file of an exited process")
+        print(small_separator)
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        with open('%s.%d' % (spill_file, exited.pid), 'w') as file:
+            file.write(json.dumps(dict(team_id=self.team.pk, latitude=1.5, longitude=1.5, segment=1,
+                                       datetime=now().isoformat())) + '\n')
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(os.listdir(os.path.dirname(spill_file)), [])
+        self.assertEqual(TeamLocation.objects.filter(latitude=1.5).count(), 1)
+        print("Location stored")
+        print(separator)
+
+        """
+        GET buffer counters, administrator (expected HTTP 200)
+        """
+        print("GET buffer counters, administrator")
+        print(small_separator)
+        api_response = client.get(reverse(self.location_buffer_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data['mode'], 'sync')
+        print("Matching mode")
+        print(separator)
+
+        """
+        GET buffer counters, not an administrator (expected HTTP 403)
+        """
+        print("GET buffer counters, not an administrator")
+        print(small_separator)
+        request = client.post(reverse(self.login_url), {"username": self.user.email, "password": self.password})
+        api_response = client.get(reverse(self.location_buffer_url),
+                                  HTTP_AUTHORIZATION="Token " + request.data['token'])
+        self.assertEqual(api_response.status_code, HTTP_403_FORBIDDEN)
+        print("Got HTTP 403")
+        print(separator)
+
+    """
+    Unit tests for the ping filter
+    """
+    def test_ping_filter(self):
+        print(separator)
+        print("Testing the ping filter")
+        print(separator)
+
+        ping_filter = PingFilter(min_interval=5, min_distance=10, max_interval=60)
+        start_time = now()
+
+        def ping(seconds, latitude, segment=1):
+            return ping_filter.accept(TeamLocation(team_id=self.team.pk, segment=segment, latitude=latitude,
+                                                   longitude=5.47, datetime=start_time + timedelta(seconds=seconds)))
+
+        print("First ping of the team")
+        self.assertTrue(ping(0, 51.44))
+        print(small_separator)
+
+        print("Ping of another member, 2 s later")
+        self.assertFalse(ping(2, 51.4401))
+        print(small_separator)
+
+        print("Ping 5 m away, 30 s later")
+        self.assertFalse(ping(30, 51.44005))
+        print(small_separator)
+
+        print("Ping 110 m away, 30 s later")
+        self.assertTrue(ping(30, 51.441))
+        print(small_separator)
+
+        print("Ping at the same place, 90 s later")
+        self.assertTrue(ping(120, 51.441))
+        print(small_separator)
+
+        print("First ping of a new segment")
+        self.assertTrue(ping(121, 51.441, segment=2))
+        self.assertEqual(ping_filter.stats(), dict(accepted=4, dropped=2))
+        print(separator)
+
+        # Mark event and timer as started
+        self.event.is_active = True
+        self.event.save()
+        self.team.timer_started = True
+        self.team.save()
+
+        # Log in as team member
+        request = client.post(reverse(self.login_url), {"username": self.team_user.email, "password": self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        POST request, same location twice (expected HTTP 200, location stored once)
+        """
+        print("POST request, same location twice")
+        print(small_separator)
+        count = TeamLocation.objects.count()
+        with mock.patch('backend.views.locations.get_ping_filter', return_value=PingFilter(5, 10, 60)):
+            for _ in range(2):
+                api_response = client.post(reverse(self.location_view_url), data=self.dummy_data, **headers)
+                self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(TeamLocation.objects.count(), count + 1)
+        print("Location stored once")
+        print(separator)
+
+    """
+    Unit tests for the inline_team_locations command
+    """
+    def test_inline_team_locations(self):
+        print(separator)
+        print("Testing the inline_team_locations command")
+        print(separator)
+
+        # Track points stored as locations, one of them at the end location of the event
+        ping = Location.objects.create(latitude=4, longitude=4)
+        ping_location = TeamLocation.objects.create(segment=1, datetime=now(), location_id=ping.pk,
+                                                    team_id=self.team.pk)
+        end_location = TeamLocation.objects.create(segment=1, datetime=now(), location_id=self.end_location.pk,
+                                                   team_id=self.team.pk)
+
+        call_command('inline_team_locations', stdout=StringIO())
+        ping_location.refresh_from_db()
+        end_location.refresh_from_db()
+
+        self.assertEqual((ping_location.latitude, ping_location.longitude), (4, 4))
+        print("Coordinates copied")
+        self.assertEqual(ping_location.location_id, None)
+        self.assertFalse(Location.objects.filter(pk=ping.pk).exists())
+        print("Track point location deleted")
+        self.assertEqual((end_location.latitude, end_location.longitude), (1, 1))
+        self.assertEqual(end_location.location_id, self.end_location.pk)
+        print("Named location kept")
+        print(separator)
+
     """
     Unit tests for TeamRoute view
     """
@@ -643,16 +1060,57 @@ class LocationTests(TestCase):
         self.assertEqual(api_response['segment'], self.team_location.segment)
         print("Matching segment")
         api_response = api_response['locations'][0]
-        self.assertEqual(api_response['id'], self.team_location.location_id)
-        print("Matching location ID")
-        self.assertEqual(api_response['latitude'], self.location.latitude)
+        self.assertEqual(api_response['id'], self.team_location.pk)
+        print("Matching track point ID")
+        self.assertEqual(api_response['latitude'], self.team_location.latitude)
         print("Matching latitude")
-        self.assertEqual(api_response['longitude'], self.location.longitude)
+        self.assertEqual(api_response['longitude'], self.team_location.longitude)
         print("Matching longitude")
         self.assertEqual(api_response['datetime'], self.team_location.datetime)
         print("Matching datetime")
         print(separator)
 
+        """
+        GET request, invalid tolerance (expected HTTP 400)
+        """
+        print("GET request, invalid tolerance")
+        print(small_separator)
+        api_response = client.get(reverse(self.route_url), {'tolerance': 'abc'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        """
+        GET request, tolerance not allowed (expected HTTP 400)
+        """
+        print("GET request, tolerance not allowed")
+        print(small_separator)
+        api_response = client.get(reverse(self.route_url), {'tolerance': '7'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        """
+        GET request, polyline format (expected HTTP 200)
+        """
+        print("GET request, polyline format")
+        print(small_separator)
+        api_response = client.get(reverse(self.route_url), {'format': 'polyline'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        print(small_separator)
+        # Check return data
+        api_response = api_response.data[0]
+        self.assertEqual(api_response['segment'], self.team_location.segment)
+        print("Matching segment")
+        self.assertEqual(api_response['polyline'],
+                         encode_polyline([(self.team_location.latitude, self.team_location.longitude)]))
+        print("Matching polyline")
+        self.assertEqual(api_response['start'], self.team_location.datetime)
+        self.assertEqual(api_response['times'], [0])
+        print("Matching times")
+        print(separator)
+
         # Remove team locations
         TeamLocation.objects.all().delete()
 
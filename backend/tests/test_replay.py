@@ -0,0 +1,180 @@
+""" Unit tests for the replay of an event (replay REST API) """
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND
+
+from webapp.models import Location, Event, Team, TeamLocation
+from webapp.replay import get_positions, get_replay_index
+
+client = Client()
+User = get_user_model()
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+
+class ReplayTests(TestCase):
+    password = '123456abc'
+
+    # URLs
+    login_url = 'api_login'
+    replay_url = 'api_event_replay'
+
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Create a user
+        self.user = User.objects.create(
+            first_name='Test',
+            last_name='User',
+            is_superuser=False,
+            email='user@test.com',
+            is_active=True,
+            is_staff=False,
+            phone='0123456789',
+            first_login=False,
+            password='pbkdf2_sha256$100000$Wxbl16Sprv4g$h4v5hURFNJY0/cpm/yeA1OKDGrX09O5Kb3Ghap4UJcg='
+        )
+
+        # Create start and end locations
+        self.start_location = Location.objects.create(latitude=0, longitude=0)
+        self.end_location = Location.objects.create(latitude=1, longitude=1)
+
+        # Create an event and two teams
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now(),
+            end_date=now(),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.start_location.pk,
+            end_location_id=self.end_location.pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+        self.team = Team.objects.create(event_id=self.event.pk)
+        self.other_team = Team.objects.create(event_id=self.event.pk)
+
+        # First team: from (0, 0) to (1, 0) in 100 s, then a second segment from (2, 0) to (2, 1) 100 s later
+        # Other team: starts 50 s later at (0, 1)
+        self.start_time = now().replace(microsecond=0)
+        TeamLocation.objects.bulk_create([
+            TeamLocation(team_id=self.team.pk, segment=1, latitude=0, longitude=0, datetime=self.start_time),
+            TeamLocation(team_id=self.team.pk, segment=1, latitude=1, longitude=0,
+                         datetime=self.start_time + timedelta(seconds=100)),
+            TeamLocation(team_id=self.team.pk, segment=2, latitude=2, longitude=0,
+                         datetime=self.start_time + timedelta(seconds=200)),
+            TeamLocation(team_id=self.team.pk, segment=2, latitude=2, longitude=1,
+                         datetime=self.start_time + timedelta(seconds=300)),
+            TeamLocation(team_id=self.other_team.pk, segment=1, latitude=0, longitude=1,
+                         datetime=self.start_time + timedelta(seconds=50))])
+
+    """
+    Unit tests for get_positions()
+    """
+
+    def test_get_positions(self):
+        print(separator)
+        print("Testing get_positions()")
+        print(separator)
+
+        track = get_replay_index(self.event)[self.team.pk]
+        start = self.start_time.timestamp()
+        positions = get_positions(track, start + np.array([-10, 0, 25, 100, 150, 250, 400]))
+
+        print("Before the first location")
+        self.assertIsNone(positions[0])
+        print(small_separator)
+
+        print("Interpolated in a segment")
+        self.assertEqual(positions[1:4], [(0, 0), (0.25, 0), (1, 0)])
+        self.assertEqual(positions[5], (2, 0.5))
+        print(small_separator)
+
+        print("Between two segments and after the last location")
+        self.assertEqual(positions[4], (1, 0))
+        self.assertEqual(positions[6], (2, 1))
+        print(separator)
+
+    """
+    Unit tests for EventReplayView
+    """
+
+    def test_event_replay(self):
+        print(separator)
+        print("Testing /api/events/<event_id>/replay/")
+        print(separator)
+
+        url = reverse(self.replay_url, args=[self.event.pk])
+        start = self.start_time.isoformat()
+
+        """
+        GET request, unauthenticated (expected HTTP 401)
+        """
+        print("GET request, unauthenticated")
+        print(small_separator)
+        api_response = client.get(url, {'t': start})
+        self.assertEqual(api_response.status_code, HTTP_401_UNAUTHORIZED)
+        print("Got HTTP 401")
+        print(separator)
+
+        # Log in
+        request = client.post(reverse(self.login_url), {"username": self.user.email, "password": self.password})
+        headers = {"HTTP_AUTHORIZATION": "Token " + request.data['token']}
+
+        """
+        GET request, invalid parameters (expected HTTP 400)
+        """
+        print("GET request, invalid parameters")
+        print(small_separator)
+        for parameters in ({}, {'t': 'abc'}, {'t': '2020-02-30T10:00'}, {'t': start, 'step': '-1'},
+                           {'t': start, 'frames': '0'}, {'t': start, 'frames': '100000'}):
+            api_response = client.get(url, parameters, **headers)
+            self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        """
+        GET request, non-existing event (expected HTTP 404)
+        """
+        print("GET request, non-existing event")
+        print(small_separator)
+        api_response = client.get(reverse(self.replay_url, args=[self.event.pk + 1]), {'t': start}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
+        """
+        GET request, valid (expected HTTP 200)
+        """
+        print("GET request, valid")
+        print(small_separator)
+        api_response = client.get(url, {'t': start, 'step': '50', 'frames': '3'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        print(small_separator)
+        self.assertEqual(api_response.data['instants'],
+                         [self.start_time + timedelta(seconds=seconds) for seconds in (0, 50, 100)])
+        self.assertEqual(api_response.data['teams'], [
+            dict(team_id=self.team.pk, positions=[(0, 0), (0.5, 0), (1, 0)]),
+            dict(team_id=self.other_team.pk, positions=[None, (0, 1), (0, 1)])])
+        print("Matching positions")
+        print(separator)
+
+        print("Replay index cached until the event has new track points")
+        with CaptureQueriesContext(connection) as queries:
+            get_replay_index(self.event)
+        self.assertEqual(len(queries), 1)
+        TeamLocation.objects.create(team_id=self.other_team.pk, segment=1, latitude=1, longitude=1,
+                                    datetime=self.start_time + timedelta(seconds=150))
+        self.assertEqual(get_positions(get_replay_index(self.event)[self.other_team.pk],
+                                       np.array([self.start_time.timestamp() + 100])), [(0.5, 1)])
+        print(separator)
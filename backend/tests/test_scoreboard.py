@@ -1,19 +1,27 @@
 """ Unit tests for the scoreboard REST API (backend) """
+import json
 import shutil
 import tempfile
 from datetime import timedelta
 from io import BytesIO
+from unittest import mock
 
 from PIL import Image
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.utils.timezone import now
-from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED, HTTP_200_OK, HTTP_401_UNAUTHORIZED
+from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED, HTTP_200_OK, HTTP_401_UNAUTHORIZED, \
+    HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST, HTTP_429_TOO_MANY_REQUESTS
 
-from webapp.models import Location, Event, Team, UserTeam, Challenge, TeamChallenge, SubLocation, TeamLocation, Score
+from webapp.broker import get_broker
+from webapp.models import Location, Event, Team, UserTeam, Challenge, TeamChallenge, SubLocation, TeamLocation, Score, \
+    TeamStanding
+from webapp.standings import mark_standings_stale, refresh_standings
 
 client = Client()
 User = get_user_model()
@@ -44,6 +52,9 @@ class ScoreboardTests(TestCase):
     login_url = 'api_login'
     logout_url = 'api_logout'
     scoreboard_url = 'api_scoreboard'
+    scoreboard_stream_url = 'api_scoreboard_stream'
+    scoreboard_history_url = 'api_scoreboard_history'
+    admin_accept_url = 'api_challenge_admin_accept'
 
     """
     Database set-up for unit tests
@@ -317,3 +328,634 @@ class ScoreboardTests(TestCase):
 
         # Delete temporary folder
         shutil.rmtree(self.folder)
+
+    """
+    Unit tests for the stored standings
+    """
+
+    def test_scoreboard_standings(self):
+        print(separator)
+        print("Testing stored standings of /api/scoreboard/")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        Accepting a challenge (expected standings rebuilt by the write)
+        """
+        print("Accepting a challenge")
+        print(small_separator)
+        data = {'challenge_id': self.challenge_1.pk, 'team_id': self.team.pk}
+        api_response = client.post(reverse(self.admin_accept_url), data=data, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertFalse(Event.objects.get(pk=self.event.pk).standings_stale)
+        print("Standings are up-to-date")
+        standing = TeamStanding.objects.get(team_id=self.team.pk)
+        self.assertEqual(standing.bonus_time, timedelta(minutes=15))
+        print("Matching stored bonus time")
+        self.assertEqual(standing.final_time, standing.travel_time - timedelta(minutes=15))
+        print("Matching stored final time")
+        self.assertEqual(standing.rank, 1)
+        print("Matching stored rank")
+        print(separator)
+
+        """
+        GET request, up-to-date standings (expected HTTP 200, no scoring queries)
+        """
+        print("GET request, up-to-date standings")
+        print(small_separator)
+        with CaptureQueriesContext(connection) as queries:
+            api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data[0]['final_time'], '01:15')
+        print("Matching final time")
+        for query in queries.captured_queries:
+            self.assertNotIn('webapp_score', query['sql'])
+            self.assertNotIn('webapp_teamlocation', query['sql'])
+        print("Scoreboard read from the stored standings")
+        print(separator)
+
+        """
+        Disqualifying a team (expected standings marked as stale, then rebuilt on read)
+        """
+        print("Disqualifying a team")
+        print(small_separator)
+        self.team.is_disqualified = True
+        self.team.save()
+        self.assertTrue(Event.objects.get(pk=self.event.pk).standings_stale)
+        print("Standings are stale")
+        api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        self.assertEqual(api_response.data[0]['is_disqualified'], True)
+        print("Matching disqualification status")
+        self.assertFalse(Event.objects.get(pk=self.event.pk).standings_stale)
+        print("Standings are up-to-date")
+        print(separator)
+
+    def test_scoreboard_running_segment(self):
+        print(separator)
+        print("Testing the travel time of a running team on /api/scoreboard/")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+
+        # The team runs a third segment, started an hour ago
+        segment_start = now() - timedelta(hours=1)
+        TeamLocation.objects.create(segment=3, datetime=segment_start, latitude=0, longitude=0, team_id=self.team.pk)
+        Team.objects.filter(pk=self.team.pk).update(timer_started=True, segment=3, segment_start=segment_start)
+        mark_standings_stale(self.event.pk)
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        Ping of the running team (expected travel time of the stopped segments only)
+        """
+        print("Ping of the running team")
+        print(small_separator)
+        api_response = client.post(reverse('api_my_team_location'), data={'latitude': 5, 'longitude': 5}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        self.assertEqual(api_response.data[0]['travel_time'], '01:30')
+        print("Running segment left out of the travel time")
+        print(separator)
+
+        """
+        Stopping the timer (expected travel time including the stopped segment)
+        """
+        print("Stopping the timer")
+        print(small_separator)
+        api_response = client.post('/api/teams/my/stop/', data={'latitude': 5, 'longitude': 5, 'location_id': -1},
+                                   **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        self.assertEqual(api_response.data[0]['travel_time'], '02:30')
+        print("Stopped segment added to the travel time")
+        print(separator)
+
+    """
+    Unit tests for conditional requests on the scoreboard
+    """
+
+    def test_scoreboard_conditional_get(self):
+        print(separator)
+        print("Testing conditional GET requests on /api/scoreboard/")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        GET request (expected HTTP 200, ETag and Last-Modified headers)
+        """
+        print("GET request")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        etag = api_response['ETag']
+        last_modified = api_response['Last-Modified']
+        self.assertTrue(etag)
+        print("Got ETag")
+        self.assertTrue(last_modified)
+        print("Got Last-Modified")
+        print(separator)
+
+        """
+        GET request, matching ETag (expected HTTP 304, no standings queries)
+        """
+        print("GET request, matching ETag")
+        print(small_separator)
+        with CaptureQueriesContext(connection) as queries:
+            api_response = client.get(reverse(self.scoreboard_url), HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(api_response.status_code, HTTP_304_NOT_MODIFIED)
+        print("Got HTTP 304")
+        for query in queries.captured_queries:
+            self.assertNotIn('webapp_teamstanding', query['sql'])
+            self.assertNotIn('webapp_score', query['sql'])
+        print("Standings not queried")
+        print(separator)
+
+        """
+        GET request, matching Last-Modified (expected HTTP 304)
+        """
+        print("GET request, matching Last-Modified")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), HTTP_IF_MODIFIED_SINCE=last_modified, **headers)
+        self.assertEqual(api_response.status_code, HTTP_304_NOT_MODIFIED)
+        print("Got HTTP 304")
+        print(separator)
+
+        """
+        GET request, ETag of a previous version (expected HTTP 200, new ETag)
+        """
+        print("GET request, ETag of a previous version")
+        print(small_separator)
+        data = {'challenge_id': self.challenge_1.pk, 'team_id': self.team.pk}
+        client.post(reverse(self.admin_accept_url), data=data, **headers)
+        api_response = client.get(reverse(self.scoreboard_url), HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertNotEqual(api_response['ETag'], etag)
+        print("Got a new ETag")
+        self.assertEqual(api_response.data[0]['bonus_time'], '00:15')
+        print("Matching bonus time")
+        print(separator)
+
+    """
+    Unit tests for the ranking of the scoreboard
+    """
+
+    def test_scoreboard_ranking(self):
+        print(separator)
+        print("Testing the ranking of /api/scoreboard/")
+        print(separator)
+
+        # Mark event as active and add two teams without results (tied)
+        self.event.is_active = True
+        self.event.save()
+        team_b = Team.objects.create(is_disqualified=False, is_winner=False, timer_started=False,
+                                     event_id=self.event.pk)
+        team_c = Team.objects.create(is_disqualified=False, is_winner=False, timer_started=False,
+                                     event_id=self.event.pk)
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        GET request, tied teams (expected HTTP 200, ties broken by team ID)
+        """
+        print("GET request, tied teams")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual([team['team_id'] for team in api_response.data], [team_b.pk, team_c.pk, self.team.pk])
+        print("Teams in rank order")
+        self.assertEqual([team['rank'] for team in api_response.data], [1, 2, 3])
+        print("Matching ranks")
+        self.assertEqual([team['rank_change'] for team in api_response.data], [0, 0, 0])
+        print("No rank change")
+        print(separator)
+
+        """
+        GET request, disqualified team (expected HTTP 200, disqualified team last)
+        """
+        print("GET request, disqualified team")
+        print(small_separator)
+        team_b.is_disqualified = True
+        team_b.save()
+        api_response = client.get(reverse(self.scoreboard_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual([team['team_id'] for team in api_response.data], [team_c.pk, self.team.pk, team_b.pk])
+        print("Disqualified team last")
+        self.assertEqual([team['rank_change'] for team in api_response.data], [1, 1, -2])
+        print("Matching rank changes")
+        print(separator)
+
+        """
+        GET request, top 1 (expected HTTP 200, first team only)
+        """
+        print("GET request, top 1")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), {'top': 1}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual([team['team_id'] for team in api_response.data], [team_c.pk])
+        print("First team only")
+        print(separator)
+
+        """
+        GET request, invalid top (expected HTTP 400)
+        """
+        print("GET request, invalid top")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), {'top': 'all'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+    """
+    Unit tests for the delta mode of the scoreboard
+    """
+
+    def test_scoreboard_delta(self):
+        print(separator)
+        print("Testing GET requests on /api/scoreboard/?since=")
+        print(separator)
+
+        # Mark event as active and add a second team
+        self.event.is_active = True
+        self.event.save()
+        other_team = Team.objects.create(is_disqualified=False, is_winner=False, timer_started=False,
+                                         event_id=self.event.pk)
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        GET request, invalid version (expected HTTP 400)
+        """
+        print("GET request, invalid version")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), {'since': 'abc'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        """
+        GET request, version 0 (expected HTTP 200, all teams)
+        """
+        print("GET request, version 0")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), {'since': 0}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data['team_ids'], [other_team.pk, self.team.pk])
+        print("Matching team IDs")
+        self.assertEqual([team['team_id'] for team in api_response.data['teams']], [other_team.pk, self.team.pk])
+        print("Got all teams")
+        self.assertEqual([team['rank'] for team in api_response.data['teams']], [1, 2])
+        print("Matching ranks")
+        version = api_response.data['version']
+        print(separator)
+
+        """
+        GET request, current version (expected HTTP 200, no team)
+        """
+        print("GET request, current version")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), {'since': version}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data['version'], version)
+        print("Matching version")
+        self.assertEqual(api_response.data['teams'], [])
+        print("No team")
+        print(separator)
+
+        """
+        GET request, previous version after accepting a challenge (expected HTTP 200, changed team only)
+        """
+        print("GET request, previous version after accepting a challenge")
+        print(small_separator)
+        data = {'challenge_id': self.challenge_1.pk, 'team_id': self.team.pk}
+        client.post(reverse(self.admin_accept_url), data=data, **headers)
+        api_response = client.get(reverse(self.scoreboard_url), {'since': version}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertGreater(api_response.data['version'], version)
+        print("Got a new version")
+        self.assertEqual(api_response.data['team_ids'], [other_team.pk, self.team.pk])
+        print("Matching team IDs")
+        self.assertEqual([team['team_id'] for team in api_response.data['teams']], [self.team.pk])
+        print("Got the changed team only")
+        self.assertEqual(api_response.data['teams'][0]['bonus_time'], '00:15')
+        print("Matching bonus time")
+        print(separator)
+
+        """
+        GET request, unknown version (expected HTTP 200, all teams)
+        """
+        print("GET request, unknown version")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_url), {'since': 1000}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(len(api_response.data['teams']), 2)
+        print("Got all teams")
+        print(separator)
+
+    """
+    Unit tests for the scoreboard history
+    """
+
+    def test_scoreboard_history(self):
+        print(separator)
+        print("Testing GET requests on /api/events/<event_id>/scoreboard/history/")
+        print(separator)
+
+        history_url = reverse(self.scoreboard_history_url, args=[self.event.pk])
+        before_event = now()
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        GET request, invalid time (expected HTTP 400)
+        """
+        print("GET request, invalid time")
+        print(small_separator)
+        api_response = client.get(history_url, {'at': 'yesterday'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        print(separator)
+
+        """
+        GET request, invalid date (expected HTTP 400)
+        """
+        print("GET request, invalid date")
+        print(small_separator)
+        api_response = client.get(history_url, {'at': '2020-02-30T10:00'}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400")
+        api_response = client.get(reverse('event_history', args=[self.event.pk]), {'at': '2020-02-30T10:00'})
+        self.assertEqual(api_response.status_code, HTTP_400_BAD_REQUEST)
+        print("Got HTTP 400 on the history page")
+        print(separator)
+
+        """
+        GET request, no scoreboard recorded (expected HTTP 404)
+        """
+        print("GET request, no scoreboard recorded")
+        print(small_separator)
+        api_response = client.get(history_url, **headers)
+        self.assertEqual(api_response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
+        # Record a scoreboard before and after accepting the challenge
+        self.event.is_active = True
+        self.event.save()
+        client.get(reverse(self.scoreboard_url), **headers)
+        data = {'challenge_id': self.challenge_1.pk, 'team_id': self.team.pk}
+        client.post(reverse(self.admin_accept_url), data=data, **headers)
+
+        """
+        GET request (expected HTTP 200, latest scoreboard)
+        """
+        print("GET request")
+        print(small_separator)
+        api_response = client.get(history_url, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response.data['version'], Event.objects.get(pk=self.event.pk).standings_version)
+        print("Matching version")
+        self.assertIsNone(api_response.data['next_version'])
+        print("No next version")
+        self.assertEqual(api_response.data['standings'][0]['bonus_time'], '00:15')
+        print("Matching bonus time")
+        previous_version = api_response.data['previous_version']
+        print(separator)
+
+        """
+        GET request, previous version (expected HTTP 200, scoreboard before accepting the challenge)
+        """
+        print("GET request, previous version")
+        print(small_separator)
+        api_response = client.get(history_url, {'version': previous_version}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertIsNone(api_response.data['previous_version'])
+        print("No previous version")
+        self.assertEqual(api_response.data['standings'][0]['bonus_time'], '00:00')
+        print("Matching bonus time")
+        print(separator)
+
+        """
+        GET request, time before the first scoreboard (expected HTTP 404)
+        """
+        print("GET request, time before the first scoreboard")
+        print(small_separator)
+        api_response = client.get(history_url, {'at': before_event.isoformat()}, **headers)
+        self.assertEqual(api_response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
+    """
+    Unit tests for the scoreboard stream
+    """
+
+    @override_settings(SCOREBOARD_STREAM_TIMEOUT=1, SCOREBOARD_STREAM_KEEPALIVE=1)
+    def test_scoreboard_stream(self):
+        print(separator)
+        print("Testing GET requests on /api/scoreboard/stream/")
+        print(separator)
+
+        """
+        GET request, unauthenticated (expected HTTP 401)
+        """
+        print("GET request, unauthenticated")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_stream_url))
+        self.assertEqual(api_response.status_code, HTTP_401_UNAUTHORIZED)
+        print("Got HTTP 401")
+        print(separator)
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        """
+        GET request, no active event (expected HTTP 404)
+        """
+        print("GET request, no active event")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_stream_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_404_NOT_FOUND)
+        print("Got HTTP 404")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+        client.get(reverse(self.scoreboard_url), **headers)
+
+        """
+        GET request, challenge accepted while streaming (expected HTTP 200, scoreboard event)
+        """
+        print("GET request, challenge accepted while streaming")
+        print(small_separator)
+        api_response = client.get(reverse(self.scoreboard_stream_url), HTTP_ACCEPT='text/event-stream', **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        print("Got HTTP 200")
+        self.assertEqual(api_response['Content-Type'], 'text/event-stream')
+        print("Matching content type")
+        stream = iter(api_response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 1000\n\n')
+        print("Subscribed")
+        data = {'challenge_id': self.challenge_1.pk, 'team_id': self.team.pk}
+        client.post(reverse(self.admin_accept_url), data=data, **headers)
+        message = next(stream).decode()
+        self.assertTrue(message.startswith('id: %d\nevent: scoreboard\n' % Event.objects.get().standings_version))
+        print("Got a scoreboard event")
+        data = json.loads(message.split('data: ', 1)[1])
+        self.assertEqual(data['team_ids'], [self.team.pk])
+        print("Matching team IDs")
+        self.assertEqual(data['teams'][0]['bonus_time'], '00:15')
+        print("Matching bonus time")
+        self.assertEqual(b''.join(stream), b': keepalive\n\n')
+        print("Stream closed after timeout")
+        print(separator)
+
+        """
+        GET requests, too many streams (expected HTTP 429 once the limit is reached)
+        """
+        print("GET requests, too many streams")
+        print(small_separator)
+        streams = []
+        for _ in range(settings.SCOREBOARD_STREAM_MAX_PER_CLIENT):
+            api_response = client.get(reverse(self.scoreboard_stream_url), **headers)
+            self.assertEqual(api_response.status_code, HTTP_200_OK)
+            streams.append(iter(api_response.streaming_content))
+            next(streams[-1])
+        print("Got HTTP 200 up to the limit")
+        api_response = client.get(reverse(self.scoreboard_stream_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+        print("Got HTTP 429")
+        api_response = client.get(reverse('event_scoreboard_stream', args=[self.event.pk]))
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        streams.append(iter(api_response.streaming_content))
+        next(streams[-1])
+        print("Public stream counted separately (by IP address)")
+        # Read until the end of the streams (after the timeout)
+        for stream in streams:
+            b''.join(stream)
+        api_response = client.get(reverse(self.scoreboard_stream_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        b''.join(api_response.streaming_content)
+        print("Got HTTP 200 once the streams ended")
+        print(separator)
+
+    @override_settings(SCOREBOARD_STREAM_TIMEOUT=2, SCOREBOARD_STREAM_KEEPALIVE=1)
+    def test_scoreboard_stream_other_process(self):
+        print(separator)
+        print("Testing the scoreboard stream with the standings rebuilt by other processes")
+        print(separator)
+
+        # Mark event as active
+        self.event.is_active = True
+        self.event.save()
+        refresh_standings(self.event.pk)
+
+        # Login
+        request = self.client.post(reverse(self.login_url), {"username": self.user.email, 'password': self.password})
+        token = request.data['token']
+        headers = {"HTTP_AUTHORIZATION": "Token " + token}
+
+        api_response = client.get(reverse(self.scoreboard_stream_url), **headers)
+        self.assertEqual(api_response.status_code, HTTP_200_OK)
+        stream = iter(api_response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 1000\n\n')
+
+        """
+        Rebuild not published to the process of the stream (expected changes sent at the keep-alive interval)
+        """
+        print("Rebuild published by another process")
+        print(small_separator)
+        with mock.patch.object(get_broker(), 'publish'):
+            data = {'challenge_id': self.challenge_1.pk, 'team_id': self.team.pk}
+            client.post(reverse(self.admin_accept_url), data=data, **headers)
+        message = next(stream).decode()
+        version = Event.objects.get(pk=self.event.pk).standings_version
+        self.assertTrue(message.startswith('id: %d\nevent: scoreboard\n' % version))
+        data = json.loads(message.split('data: ', 1)[1])
+        self.assertEqual(data['teams'][0]['bonus_time'], '00:15')
+        print("Got the changes of the other process")
+        print(separator)
+
+        """
+        Published rebuild following a missed one (expected changes of both rebuilds)
+        """
+        print("Published rebuild following a missed one")
+        print(small_separator)
+        with mock.patch.object(get_broker(), 'publish'):
+            self.team.is_disqualified = True
+            self.team.save()
+            refresh_standings(self.event.pk)
+        other_team = Team.objects.create(event_id=self.event.pk)
+        refresh_standings(self.event.pk)
+        message = next(stream).decode()
+        data = json.loads(message.split('data: ', 1)[1])
+        self.assertEqual(data['version'], Event.objects.get(pk=self.event.pk).standings_version)
+        self.assertEqual({team['team_id']: team['is_disqualified'] for team in data['teams']},
+                         {self.team.pk: True, other_team.pk: False})
+        print("Got the changes of both rebuilds")
+        b''.join(stream)
+        print(separator)
+
+    def test_publish_changes_only(self):
+        print(separator)
+        print("Testing the messages published when the standings are rebuilt")
+        print(separator)
+
+        refresh_standings(self.event.pk)
+        broker = get_broker()
+        subscription = broker.subscribe(self.event.pk)
+        try:
+            mark_standings_stale(self.event.pk)
+            refresh_standings(self.event.pk)
+            self.assertTrue(subscription.empty())
+            print("Nothing published when no team changed")
+        finally:
+            broker.unsubscribe(self.event.pk, subscription)
+        print(separator)
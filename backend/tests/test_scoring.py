@@ -0,0 +1,207 @@
+""" Unit tests for the scoring engine shared by the REST API and the webapp """
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils.timezone import now
+
+from webapp.models import Location, Event, Team, UserTeam, Challenge, TeamChallenge, SubLocation, TeamLocation, Score
+from webapp.scoring import compute_scoreboard, get_segments
+
+User = get_user_model()
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+
+class ScoringTests(TestCase):
+    # Number of queries issued by compute_scoreboard() once the segments are cached, whatever the size of the event
+    query_count = 5
+
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Create start and end locations
+        self.start_location = Location.objects.create(latitude=0, longitude=0)
+        self.end_location = Location.objects.create(latitude=1, longitude=1)
+
+        # Create an event
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now(),
+            end_date=now(),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.start_location.pk,
+            end_location_id=self.end_location.pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+
+        # Create a challenge
+        self.challenge = Challenge.objects.create(
+            title='Challenge',
+            description='Description',
+            reward='00:15',
+            event_id=self.event.pk
+        )
+
+        self.user_count = 0
+
+    # Adds a sub-destination to the event
+    def add_sub_destination(self, city):
+        order = SubLocation.objects.filter(event_id=self.event.pk).count() + 1
+        location = Location.objects.create(latitude=order, longitude=order)
+        return SubLocation.objects.create(event_id=self.event.pk, location_id=location.pk, city=city, order=order)
+
+    # Adds a team with one member, which completed every segment in 30 minutes and the challenge
+    def add_team(self):
+        team = Team.objects.create(is_disqualified=False, is_winner=False, timer_started=False,
+                                   event_id=self.event.pk)
+
+        self.user_count += 1
+        user = User.objects.create(first_name='User ' + str(self.user_count), last_name='Test',
+                                   email='user' + str(self.user_count) + '@test.com')
+        UserTeam.objects.create(team_id=team.pk, user_id=user.pk)
+
+        start_time = now()
+        start_location_id = self.event.start_location_id
+        for segment in get_segments(self.event):
+            TeamLocation.objects.create(team_id=team.pk, location_id=start_location_id, segment=segment['order'],
+                                        datetime=start_time)
+            TeamLocation.objects.create(team_id=team.pk, location_id=segment['end_id'], segment=segment['order'],
+                                        datetime=start_time + timedelta(minutes=30))
+            Score.objects.create(team_id=team.pk, start_location_id=start_location_id,
+                                 end_location_id=segment['end_id'], time=timedelta(minutes=30))
+            start_location_id = segment['end_id']
+            start_time = start_time + timedelta(hours=1)
+
+        TeamChallenge.objects.create(team_id=team.pk, challenge_id=self.challenge.pk, location_id=start_location_id,
+                                     is_accepted=True, picture='')
+        return team
+
+    """
+    Unit tests for get_segments()
+    """
+
+    def test_segments(self):
+        print(separator)
+        print("Testing get_segments()")
+        print(separator)
+
+        print("No sub-destination")
+        print(small_separator)
+        segments = get_segments(self.event)
+        self.assertEqual(segments, [dict(order=1, name='Eindhoven-Amsterdam', start_id=self.start_location.pk,
+                                         end_id=self.end_location.pk)])
+        print("Single segment from start to end city")
+        print(separator)
+
+        print("Two sub-destinations")
+        print(small_separator)
+        utrecht = self.add_sub_destination('Utrecht')
+        breda = self.add_sub_destination('Breda')
+        segments = get_segments(self.event)
+        self.assertEqual([segment['name'] for segment in segments],
+                         ['Eindhoven-Utrecht', 'Utrecht-Breda', 'Breda-Amsterdam'])
+        print("Matching segment names")
+        self.assertEqual([segment['order'] for segment in segments], [1, 2, 3])
+        print("Matching segment orders")
+        self.assertEqual([segment['start_id'] for segment in segments],
+                         [self.start_location.pk, utrecht.location_id, breda.location_id])
+        print("Matching segment start locations")
+        self.assertEqual([segment['end_id'] for segment in segments],
+                         [utrecht.location_id, breda.location_id, self.end_location.pk])
+        print("Matching segment end locations")
+        print(separator)
+
+    def test_segments_cache(self):
+        print(separator)
+        print("Testing the cache of get_segments()")
+        print(separator)
+
+        print("Cached segments")
+        print(small_separator)
+        utrecht = self.add_sub_destination('Utrecht')
+        get_segments(self.event)
+        self.assertNumQueries(0, get_segments, self.event)
+        print("No query")
+        print(separator)
+
+        print("Sub-destination renamed")
+        print(small_separator)
+        utrecht.city = 'Breda'
+        utrecht.save()
+        self.assertEqual([segment['name'] for segment in get_segments(self.event)],
+                         ['Eindhoven-Breda', 'Breda-Amsterdam'])
+        print("Matching segment names")
+        print(separator)
+
+        print("Sub-destination deleted")
+        print(small_separator)
+        utrecht.delete()
+        self.assertEqual([segment['name'] for segment in get_segments(self.event)], ['Eindhoven-Amsterdam'])
+        print("Matching segment names")
+        print(separator)
+
+        print("End city renamed")
+        print(small_separator)
+        self.event.end_city = 'Rotterdam'
+        self.event.save()
+        self.assertEqual([segment['name'] for segment in get_segments(self.event)], ['Eindhoven-Rotterdam'])
+        print("Matching segment names")
+        print(separator)
+
+    """
+    Unit tests for compute_scoreboard()
+    """
+
+    def test_compute_scoreboard(self):
+        print(separator)
+        print("Testing compute_scoreboard()")
+        print(separator)
+
+        print("Results")
+        print(small_separator)
+        self.add_sub_destination('Utrecht')
+        team = self.add_team()
+        segments, results = compute_scoreboard(self.event)
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertEqual(result['team'], team)
+        print("Matching team")
+        self.assertEqual(result['members'], ['User 1'])
+        print("Matching members")
+        self.assertEqual(result['segment_times'], [timedelta(minutes=30), timedelta(minutes=30)])
+        print("Matching segment times")
+        self.assertEqual(result['travel_time'], timedelta(hours=1))
+        print("Matching travel time")
+        self.assertEqual(result['bonus_time'], timedelta(minutes=15))
+        print("Matching bonus time")
+        self.assertEqual(result['final_time'], timedelta(minutes=45))
+        print("Matching final time")
+        print(separator)
+
+    def test_compute_scoreboard_query_count(self):
+        print(separator)
+        print("Testing the query count of compute_scoreboard()")
+        print(separator)
+
+        print("1 team, 1 segment")
+        print(small_separator)
+        self.add_team()
+        self.assertNumQueries(self.query_count, compute_scoreboard, self.event)
+        print("Got " + str(self.query_count) + " queries")
+        print(separator)
+
+        print("11 teams, 5 segments")
+        print(small_separator)
+        for city in ('Utrecht', 'Breda', 'Tilburg', 'Arnhem'):
+            self.add_sub_destination(city)
+        for i in range(10):
+            self.add_team()
+        self.assertNumQueries(self.query_count, compute_scoreboard, self.event)
+        print("Got " + str(self.query_count) + " queries")
+        print(separator)
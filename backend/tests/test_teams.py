@@ -1,7 +1,9 @@
 """ Unit tests for the teams REST API (backend) """
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.timezone import now
 from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED, HTTP_200_OK, HTTP_401_UNAUTHORIZED
@@ -101,7 +103,8 @@ class TeamsTests(TestCase):
         self.team_location = TeamLocation.objects.create(
             segment=1,
             datetime=now(),
-            location_id=self.location.pk,
+            latitude=self.location.latitude,
+            longitude=self.location.longitude,
             team_id=self.team_2.pk
         )
 
@@ -317,6 +320,18 @@ class TeamsTests(TestCase):
 
         print(separator)
 
+        """
+        GET request, active event, user in a team (expected 3 queries: token, team with its event, members)
+        """
+        print("GET request, query count")
+        print(small_separator)
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse(self.my_team_url), **headers)
+            query_count = len(queries)
+        self.assertEqual(query_count, 3)
+        print("Team resolved with a single query")
+        print(separator)
+
         # Remove user from team
         self.team_member_1.delete()
 
@@ -0,0 +1,143 @@
+""" Unit tests for the simplification of the team tracks shared by the REST API and the webapp """
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from webapp.models import Location, Event, Team, TeamLocation
+from webapp.tracks import encode_polyline, encode_times, get_tracks, simplify
+
+separator = "====================================================================="
+small_separator = "---------------------------------------------------------------------"
+
+
+class TracksTests(TestCase):
+    """
+    Database set-up for unit tests
+    """
+
+    def setUp(self):
+        # Create start and end locations
+        self.start_location = Location.objects.create(latitude=0, longitude=0)
+        self.end_location = Location.objects.create(latitude=1, longitude=1)
+
+        # Create an event and a team
+        self.event = Event.objects.create(
+            title='Event',
+            start_date=now(),
+            end_date=now(),
+            start_city='Eindhoven',
+            end_city='Amsterdam',
+            start_location_id=self.start_location.pk,
+            end_location_id=self.end_location.pk,
+            winner_photo='',
+            is_active=True,
+            emergency_contact='0123456789')
+        self.team = Team.objects.create(event_id=self.event.pk, is_disqualified=False, is_winner=False,
+                                        timer_started=True)
+
+        # Straight line of 11 track points (about 110 m apart), with one point 1 km off the line
+        self.start_time = now()
+        for index in range(11):
+            longitude = 0.01 if index == 5 else 0
+            TeamLocation.objects.create(team_id=self.team.pk, segment=1, latitude=index * 0.001, longitude=longitude,
+                                        datetime=self.start_time + timedelta(minutes=index))
+
+    """
+    Unit tests for simplify()
+    """
+
+    def test_simplify(self):
+        print(separator)
+        print("Testing simplify()")
+        print(separator)
+
+        points = [(index * 0.001, 0.01 if index == 5 else 0) for index in range(11)]
+
+        print("Tolerance of 10 m")
+        self.assertEqual(simplify(points, 10), [points[0], points[4], points[5], points[6], points[10]])
+        print("Points on the straight parts dropped")
+        print(small_separator)
+
+        print("Tolerance of 2 km")
+        self.assertEqual(simplify(points, 2000), [points[0], points[10]])
+        print("Only the ends kept")
+        print(small_separator)
+
+        print("Tolerance of 0 m")
+        self.assertEqual(simplify(points, 0), points)
+        print("Every point kept")
+        print(separator)
+
+    """
+    Unit tests for get_tracks()
+    """
+
+    def test_get_tracks(self):
+        print(separator)
+        print("Testing get_tracks()")
+        print(separator)
+
+        team_locations = TeamLocation.objects.filter(team__event_id=self.event.pk)
+
+        print("First call")
+        tracks = get_tracks(team_locations, 10)
+        self.assertEqual([(team_id, segment) for team_id, segment, _ in tracks], [(self.team.pk, 1)])
+        self.assertEqual([point[:2] for point in tracks[0][2]],
+                         [(0, 0), (0.004, 0), (0.005, 0.01), (0.006, 0), (0.01, 0)])
+        print("Segment simplified")
+        print(small_separator)
+
+        print("Second call")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_tracks(team_locations, 10), tracks)
+        self.assertEqual(len(queries), 1)
+        print("Segment read from the cache")
+        print(small_separator)
+
+        print("Segment grown (bulk insert, no signal)")
+        TeamLocation.objects.bulk_create([TeamLocation(team_id=self.team.pk, segment=1, latitude=0.01, longitude=0.01,
+                                                       datetime=self.start_time + timedelta(minutes=20))])
+        tracks = get_tracks(team_locations, 10)
+        self.assertEqual(tracks[0][2][-1][:2], (0.01, 0.01))
+        print("Segment simplified again")
+        print(small_separator)
+
+        print("New segment")
+        TeamLocation.objects.bulk_create([TeamLocation(team_id=self.team.pk, segment=2, latitude=0.02, longitude=0.02,
+                                                       datetime=self.start_time + timedelta(minutes=30))])
+        with CaptureQueriesContext(connection) as queries:
+            new_tracks = get_tracks(team_locations, 10)
+        self.assertEqual(new_tracks[0], tracks[0])
+        self.assertEqual([point[:2] for point in new_tracks[1][2]], [(0.02, 0.02)])
+        self.assertIn('"segment" = 2', queries[1]['sql'])
+        self.assertNotIn('"segment" = 1', queries[1]['sql'])
+        print("Only the new segment read and simplified")
+        print(separator)
+
+    """
+    Unit tests for encode_polyline() and encode_times()
+    """
+
+    def test_encode_polyline(self):
+        print(separator)
+        print("Testing encode_polyline() and encode_times()")
+        print(separator)
+
+        print("Known polyline")
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        # A point not moving (zero differences)
+        self.assertEqual(encode_polyline([(38.5, -120.2), (38.5, -120.2)]), '_p~iF~ps|U??')
+        print(small_separator)
+
+        print("Empty track")
+        self.assertEqual(encode_polyline([]), '')
+        self.assertEqual(encode_times([]), [])
+        print(small_separator)
+
+        print("Times of the points")
+        datetimes = [self.start_time + timedelta(seconds=seconds) for seconds in (0, 1.4, 2.8, 60)]
+        self.assertEqual(encode_times(datetimes), [0, 1, 2, 57])
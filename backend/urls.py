@@ -29,6 +29,7 @@ urlpatterns = [
     url(r'^api/teams/my/$', backend_views.MyTeamView.as_view(), name='api_my_team'),
     url(r'^api/teams/my/route/$', backend_views.TeamRoute.as_view(), name='api_my_team_route'),
     url(r'^api/teams/my/location/$', backend_views.LocationView.as_view(), name='api_my_team_location'),
+    url(r'^api/teams/my/locations/$', backend_views.LocationBatchView.as_view(), name='api_my_team_locations'),
     url(r'^api/challenges/submit/$', backend_views.SubmitChallengeView.as_view(), name='api_challenge_submit'),
     url(r'^api/challenges/delete/$', backend_views.DeleteChallengeSubmissionView.as_view(),
         name='api_challenge_submission_delete'),
@@ -37,5 +38,13 @@ urlpatterns = [
         name='api_challenge_admin_accept'),
     url(r'^api/admin/challenges/reject/$', backend_views.RejectChallengeView.as_view(),
         name='api_challenge_admin_reject'),
+    url(r'^api/admin/locations/buffer/$', backend_views.LocationBufferView.as_view(), name='api_location_buffer'),
     url(r'^api/scoreboard/$', backend_views.Scoreboard.as_view(), name='api_scoreboard'),
+    url(r'^api/scoreboard/stream/$', backend_views.ScoreboardStream.as_view(), name='api_scoreboard_stream'),
+    url(r'^api/events/(?P<event_id>[0-9]+)/analytics/$', backend_views.EventAnalyticsView.as_view(),
+        name='api_event_analytics'),
+    url(r'^api/events/(?P<event_id>[0-9]+)/replay/$', backend_views.EventReplayView.as_view(),
+        name='api_event_replay'),
+    url(r'^api/events/(?P<event_id>[0-9]+)/scoreboard/history/$', backend_views.ScoreboardHistory.as_view(),
+        name='api_scoreboard_history'),
 ]
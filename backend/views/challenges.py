@@ -6,14 +6,17 @@ from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_200_OK, HTTP_400_BAD_
 from rest_framework.views import APIView
 
 from backend.functions import decode_base64_file, time_format
+from backend.mixins import ActiveTeamMixin
 from backend.serializers import ChallengeSubmitSerializer, ChallengeReviewSerializer, \
     ChallengeSubmissionDeletionSerializer
-from webapp.models import Event, UserTeam, Team, Challenge, TeamChallenge, Location
+from webapp.active_event import get_active_event
+from webapp.models import Challenge, TeamChallenge, Location
+from webapp.standings import refresh_standings
 
 User = get_user_model()
 
 
-class ChallengeView(APIView):
+class ChallengeView(ActiveTeamMixin, APIView):
     """
     API endpoint allowing a team member to get the challenges for the active event\n
     Allowed methods: GET\n
@@ -23,7 +26,7 @@ class ChallengeView(APIView):
         - HTTP 404: No active event exists, no teams exist for the active event
                     or the requesting user is not in a team
         - HTTP 405: On POST/PUT/DELETE requests
-    :return:\n
+    :return: List of the challenges, newest first\n
         - id: challenge ID
         - title: challenge title
         - description: challenge description
@@ -36,60 +39,44 @@ class ChallengeView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
-        # Try to get the active event
-        event = Event.objects.filter(is_active=True)
-        if event:
-            # Get the active event
-            event = Event.objects.get(is_active=True)
-            # Get the user's teams
-            teams = UserTeam.objects.filter(user_id=request.user.pk)
-            if teams:
-                # Try to get the user's team for the active event
-                team = Team.objects.filter(event_id=event.pk, pk__in=teams.values_list('team_id'))
-                if team:
-                    # Get the user's team for the active event
-                    team = Team.objects.get(event_id=event.pk, pk__in=teams.values_list('team_id'))
-                    # Get all the challenges for the active event
-                    challenges = Challenge.objects.filter(event_id=event.pk)
-
-                    # List of challenges that will be returned
-                    challenge_list = []
-                    for challenge in challenges:
-                        # Set the default status as "open"
-                        status = "open"
-
-                        # For each challenge, retrieve the status for the user's team
-                        team_challenge = TeamChallenge.objects.filter(challenge_id=challenge.pk, team_id=team.pk)
-                        if team_challenge:
-                            # If there is an entry, get the status
-                            team_challenge = TeamChallenge.objects.get(challenge_id=challenge.pk, team_id=team.pk)
-                            status = team_challenge.is_accepted
-                            if status:
-                                status = "accepted"
-                            else:
-                                status = "under_review"
-
-                        # Construct the data to return
-                        reward = time_format(challenge.reward)
-                        data = dict(id=challenge.pk, title=challenge.title, description=challenge.description,
-                                    reward=reward, status=status)
-                        # Add it to the list
-                        challenge_list.append(data)
-                    # Return the list
-                    return Response(challenge_list, status=HTTP_200_OK)
-
-                # The requesting user is not in a team for the active event
-                else:
-                    return Response(status=HTTP_404_NOT_FOUND)
-            # The requesting user is not in a team
-            else:
-                return Response(status=HTTP_404_NOT_FOUND)
-        # No active event
+        # Check if the requesting user is in a team for the active event
+        team = request.active_team
+        if team:
+            # Get all the challenges for the active event, newest first
+            challenges = Challenge.objects.filter(event_id=team.event_id).order_by('-pk')
+
+            # Submissions of the user's team, by challenge
+            submissions = dict(TeamChallenge.objects.filter(team_id=team.pk, challenge__event_id=team.event_id)
+                               .values_list('challenge_id', 'is_accepted'))
+
+            # List of challenges that will be returned
+            challenge_list = []
+            for challenge in challenges:
+                # Set the default status as "open"
+                status = "open"
+
+                # If the team submitted an entry for the challenge, get the status
+                if challenge.pk in submissions:
+                    if submissions[challenge.pk]:
+                        status = "accepted"
+                    else:
+                        status = "under_review"
+
+                # Construct the data to return
+                reward = time_format(challenge.reward)
+                data = dict(id=challenge.pk, title=challenge.title, description=challenge.description,
+                            reward=reward, status=status)
+                # Add it to the list
+                challenge_list.append(data)
+            # Return the list
+            return Response(challenge_list, status=HTTP_200_OK)
+
+        # No active event or the requesting user is not in a team for it
         else:
             return Response(status=HTTP_404_NOT_FOUND)
 
 
-class SubmitChallengeView(APIView):
+class SubmitChallengeView(ActiveTeamMixin, APIView):
     """
     API endpoint allowing a user to submit an entry for a challenge\n
     Allowed methods: POST\n
@@ -110,76 +97,67 @@ class SubmitChallengeView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
-        user = self.request.user
-        # Get the active event
-        event = Event.objects.filter(is_active=True)
-        if event:
-            event = Event.objects.get(is_active=True)
-            # Check if the user is in a team
-            team = UserTeam.objects.filter(team__event_id=event.pk, user_id=user.pk)
-            if team:
-                team = UserTeam.objects.get(team__event_id=event.pk, user_id=user.pk)
-                # Check if POST data is valid
-                serializer = ChallengeSubmitSerializer(data=request.data)
-                if serializer.is_valid():
-                    # Check if an image is submitted
-                    base64_picture = serializer.data.get("base64_picture")
-
-                    # Try to get a picture if it was submitted in binary form
-                    try:
-                        picture = serializer.validated_data["picture"]
-                    except KeyError:
-                        picture = None
-
-                    if picture or base64_picture:
-                        # Check if challenge exists
-                        challenge_id = serializer.validated_data["challenge_id"]
-                        challenge = Challenge.objects.filter(pk=challenge_id)
-                        if challenge:
-                            # Check if there is already an entry
-                            team_entry = TeamChallenge.objects.filter(team_id=team.team_id, challenge_id=challenge_id)
-                            if not team_entry:
-                                # Retrieve data and save it
-                                location = Location()
-                                location.latitude = serializer.validated_data["latitude"]
-                                location.longitude = serializer.validated_data["longitude"]
-                                location.save()
-
-                                team_challenge = TeamChallenge()
-                                team_challenge.challenge_id = serializer.validated_data["challenge_id"]
-                                team_challenge.is_accepted = False
-                                team_challenge.team_id = team.team_id
-                                team_challenge.location_id = location.pk
-
-                                if base64_picture:
-                                    picture = decode_base64_file(base64_picture)
-
-                                team_challenge.picture = picture
-
-                                team_challenge.save()
-
-                                return Response(status=HTTP_200_OK)
-                            # There is already an entry for this team and challenge
-                            else:
-                                return Response(status=HTTP_403_FORBIDDEN)
-                        # The challenge doesn't exist
+        # Check if the user is in a team for the active event
+        team = request.active_team
+        if team:
+            # Check if POST data is valid
+            serializer = ChallengeSubmitSerializer(data=request.data)
+            if serializer.is_valid():
+                # Check if an image is submitted
+                base64_picture = serializer.data.get("base64_picture")
+
+                # Try to get a picture if it was submitted in binary form
+                try:
+                    picture = serializer.validated_data["picture"]
+                except KeyError:
+                    picture = None
+
+                if picture or base64_picture:
+                    # Check if challenge exists
+                    challenge_id = serializer.validated_data["challenge_id"]
+                    challenge = Challenge.objects.filter(pk=challenge_id)
+                    if challenge:
+                        # Check if there is already an entry
+                        team_entry = TeamChallenge.objects.filter(team_id=team.pk, challenge_id=challenge_id)
+                        if not team_entry:
+                            # Retrieve data and save it
+                            location = Location()
+                            location.latitude = serializer.validated_data["latitude"]
+                            location.longitude = serializer.validated_data["longitude"]
+                            location.save()
+
+                            team_challenge = TeamChallenge()
+                            team_challenge.challenge_id = serializer.validated_data["challenge_id"]
+                            team_challenge.is_accepted = False
+                            team_challenge.team_id = team.pk
+                            team_challenge.location_id = location.pk
+
+                            if base64_picture:
+                                picture = decode_base64_file(base64_picture)
+
+                            team_challenge.picture = picture
+
+                            team_challenge.save()
+
+                            return Response(status=HTTP_200_OK)
+                        # There is already an entry for this team and challenge
                         else:
-                            return Response(status=HTTP_404_NOT_FOUND)
-                    # No picture was submitted
+                            return Response(status=HTTP_403_FORBIDDEN)
+                    # The challenge doesn't exist
                     else:
-                        return Response(status=HTTP_400_BAD_REQUEST)
-                # POST data invalid
+                        return Response(status=HTTP_404_NOT_FOUND)
+                # No picture was submitted
                 else:
                     return Response(status=HTTP_400_BAD_REQUEST)
-            # The user is not in a team
+            # POST data invalid
             else:
-                return Response(status=HTTP_404_NOT_FOUND)
-        # No active event
+                return Response(status=HTTP_400_BAD_REQUEST)
+        # No active event or the user is not in a team for it
         else:
             return Response(status=HTTP_404_NOT_FOUND)
 
 
-class DeleteChallengeSubmissionView(APIView):
+class DeleteChallengeSubmissionView(ActiveTeamMixin, APIView):
     """
         API endpoint allowing an team member to delete a submission for a challenge\n
         Allowed methods: POST\n
@@ -199,41 +177,30 @@ class DeleteChallengeSubmissionView(APIView):
         # Validate the POST data
         serializer = ChallengeSubmissionDeletionSerializer(data=request.POST)
         if serializer.is_valid():
-            user = self.request.user
-            # Get the active event
-            event = Event.objects.filter(is_active=True)
-            if event:
-                event = Event.objects.get(is_active=True)
-                # Check if the user is in a team
-                teams = Team.objects.filter(event_id=event.pk)
-                user_team = UserTeam.objects.filter(user_id=user.pk, team_id__in=teams.values_list('id'))
+            # Check if the user is in a team for the active event
+            team = request.active_team
+            if team:
 
-                if user_team:
-                    user_team = UserTeam.objects.get(user_id=user.pk, team_id__in=teams.values_list('id'))
+                # Get the challenge
+                challenge_id = serializer.validated_data['challenge_id']
+                challenge = Challenge.objects.filter(pk=challenge_id)
 
-                    # Get the challenge
-                    challenge_id = serializer.validated_data['challenge_id']
-                    challenge = Challenge.objects.filter(pk=challenge_id)
+                if challenge:
+                    # Get the submission (only if under review)
+                    submission = TeamChallenge.objects.filter(team_id=team.pk, challenge_id=challenge_id,
+                                                              is_accepted=False)
+                    if submission:
+                        # Delete the submission
+                        submission.delete()
+                        return Response(status=HTTP_200_OK)
 
-                    if challenge:
-                        # Get the submission (only if under review)
-                        submission = TeamChallenge.objects.filter(team_id=user_team.team_id, challenge_id=challenge_id,
-                                                                  is_accepted=False)
-                        if submission:
-                            # Delete the submission
-                            submission.delete()
-                            return Response(status=HTTP_200_OK)
-
-                        # No submission found
-                        else:
-                            return Response(status=HTTP_404_NOT_FOUND)
-                    # The challenge does not exist
+                    # No submission found
                     else:
                         return Response(status=HTTP_404_NOT_FOUND)
-                # The user is not in a team for the active event
+                # The challenge does not exist
                 else:
                     return Response(status=HTTP_404_NOT_FOUND)
-            # No active event
+            # No active event or the user is not in a team for it
             else:
                 return Response(status=HTTP_404_NOT_FOUND)
         # Invalid POST data
@@ -265,9 +232,8 @@ class AdminChallengeView(APIView):
         # Check for permission
         if user.is_staff:
             # Check for active event
-            event = Event.objects.filter(is_active=True)
+            event = get_active_event()
             if event:
-                event = Event.objects.get(is_active=True)
                 # Get the submissions
                 challenges = Challenge.objects.filter(event_id=event.pk)
                 submissions = TeamChallenge.objects.filter(challenge_id__in=challenges.values_list('id'),
@@ -330,6 +296,9 @@ class AcceptChallengeView(APIView):
                     submission = TeamChallenge.objects.get(challenge_id=challenge_id, team_id=team_id)
                     submission.is_accepted = True
                     submission.save()
+
+                    # Rebuild the scoreboard with the new bonus time
+                    refresh_standings(submission.challenge.event_id)
                     return Response(status=HTTP_200_OK)
                 # The submission does not exist
                 else:
@@ -377,6 +346,9 @@ class RejectChallengeView(APIView):
                     submission = TeamChallenge.objects.get(challenge_id=challenge_id, team_id=team_id)
                     submission.picture.delete()
                     submission.delete()
+
+                    # Rebuild the scoreboard without the rejected submission
+                    refresh_standings(submission.challenge.event_id)
                     return Response(status=HTTP_200_OK)
                 # The submission does not exist
                 else:
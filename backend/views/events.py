@@ -1,11 +1,20 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_403_FORBIDDEN, HTTP_400_BAD_REQUEST, HTTP_200_OK
 from rest_framework.views import APIView
 
 from backend.serializers import EmergencyContactSerializer
-from webapp.models import Event, Location, SubLocation
+from webapp.active_event import get_active_event
+from webapp.analytics import get_event_statistics
+from webapp.models import Event, SubLocation
+from webapp.replay import get_positions, get_replay_index
 
 User = get_user_model()
 
@@ -41,13 +50,11 @@ class ActiveEventView(APIView):
     def get(self, request):
 
         # Only get active event
-        event = Event.objects.filter(is_active=True)
+        event = get_active_event()
         if event:
-            event = Event.objects.get(is_active=True)
-
             # Get locations (start, end, sub-destinations)
-            start_location = Location.objects.get(pk=event.start_location.pk)
-            end_location = Location.objects.get(pk=event.end_location.pk)
+            start_location = event.start_location
+            end_location = event.end_location
 
             # Get start and end location detailed info
             start_location = dict(id=start_location.pk, latitude=start_location.latitude,
@@ -57,11 +64,11 @@ class ActiveEventView(APIView):
 
             sub_destinations = []
 
-            sub_dest_db = SubLocation.objects.filter(event_id=event.pk).order_by('order')
+            sub_dest_db = SubLocation.objects.filter(event_id=event.pk).select_related('location').order_by('order')
 
             # Fetch all sub-destinations with eventID = active event
             for sub_dest in sub_dest_db:
-                location = Location.objects.get(pk=sub_dest.location_id)
+                location = sub_dest.location
                 data = dict(id=sub_dest.location_id, latitude=location.latitude, longitude=location.longitude,
                             name=sub_dest.city, order=sub_dest.order)
                 sub_destinations.append(data)
@@ -98,10 +105,8 @@ class EmergencyContactView(APIView):
         # Check for permission
         if self.request.user.is_staff:
             # Check for active event
-            event = Event.objects.filter(is_active=True)
+            event = get_active_event()
             if event:
-                # Get event
-                event = Event.objects.get(is_active=True)
                 # Check POST data
                 serializer = EmergencyContactSerializer(data=request.data)
                 if serializer.is_valid():
@@ -109,7 +114,7 @@ class EmergencyContactView(APIView):
                     emergency_contact = serializer.validated_data["emergency_contact"]
                     # Update event in database
                     event.emergency_contact = emergency_contact
-                    event.save()
+                    event.save(update_fields=['emergency_contact'])
 
                     return Response(status=HTTP_200_OK)
 
@@ -122,3 +127,87 @@ class EmergencyContactView(APIView):
         # The user is not an administrator
         else:
             return Response(status=HTTP_403_FORBIDDEN)
+
+
+class EventAnalyticsView(APIView):
+    """
+    API endpoint allowing a user to view the distance and speed statistics of the teams of an event\n
+    Allowed methods: GET\n
+    Possible HTTP responses:\n
+        - HTTP 200: On successful request
+        - HTTP 401: If unauthenticated
+        - HTTP 404: If the event doesn't exist
+        - HTTP 405: On POST/PUT/DELETE requests
+    :return: Items for each team with track points\n
+        - team_id: ID of the team
+        - distance: Distance travelled (in km)
+        - moving_time: Time spent moving (in seconds)
+        - average_speed: Average speed while moving (in km/h)
+        - max_speed: Highest speed (in km/h)
+        - stops: Number of stops of at least settings.ANALYTICS_STOP_DURATION seconds
+        - segments: Same statistics for each segment of the team, with its segment number (segment)
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, event_id):
+        # Check if the event exists
+        event = Event.objects.filter(pk=event_id).first()
+        if event is None:
+            return Response(status=HTTP_404_NOT_FOUND)
+
+        return Response(get_event_statistics(event), status=HTTP_200_OK)
+
+
+class EventReplayView(APIView):
+    """
+    API endpoint allowing a user to replay an event: positions of all teams at given instants\n
+    Allowed methods: GET\n
+    Query parameters:\n
+        - t: Date and time (ISO 8601) of the first instant
+        - step (optional): Seconds between the instants
+        - frames (optional): Number of instants (at most settings.REPLAY_MAX_FRAMES), 1 by default
+    Possible HTTP responses:\n
+        - HTTP 200: On successful request
+        - HTTP 400: If t is missing or invalid, or step or frames is invalid
+        - HTTP 401: If unauthenticated
+        - HTTP 404: If the event doesn't exist
+        - HTTP 405: On POST/PUT/DELETE requests
+    :return:\n
+        - instants: Dates and times of the instants
+        - teams: Items for each team with track points
+            - team_id: ID of the team
+            - positions: Position of the team at each instant, interpolated between its locations: [latitude,
+              longitude], null before its first location
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, event_id):
+        # Check the first instant (parse_datetime() raises ValueError for well formatted but invalid dates)
+        try:
+            start = parse_datetime(request.query_params.get('t', ''))
+        except ValueError:
+            start = None
+        if start is None:
+            return Response(status=HTTP_400_BAD_REQUEST)
+        if is_naive(start):
+            start = make_aware(start)
+
+        # Check the step and the number of instants
+        step = request.query_params.get('step', '0')
+        frames = request.query_params.get('frames', '1')
+        if not step.isdigit() or not frames.isdigit() or not 1 <= int(frames) <= settings.REPLAY_MAX_FRAMES:
+            return Response(status=HTTP_400_BAD_REQUEST)
+        step, frames = int(step), int(frames)
+
+        # Check if the event exists
+        event = Event.objects.filter(pk=event_id).first()
+        if event is None:
+            return Response(status=HTTP_404_NOT_FOUND)
+
+        # Interpolate the position of each team at the instants
+        instants = start.timestamp() + step * np.arange(frames)
+        teams = [dict(team_id=team_id, positions=get_positions(track, instants))
+                 for team_id, track in sorted(get_replay_index(event).items())]
+
+        return Response(dict(instants=[start + timedelta(seconds=step * frame) for frame in range(frames)],
+                             teams=teams), status=HTTP_200_OK)
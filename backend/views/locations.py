@@ -1,22 +1,165 @@
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Min, Max, Sum
 from django.utils.timezone import now
 from fcm_django.models import FCMDevice
 from rest_framework import permissions
 from rest_framework import viewsets
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, \
+from rest_framework.settings import api_settings
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, \
     HTTP_417_EXPECTATION_FAILED
 from rest_framework.views import APIView
 
-from backend.serializers import LocationSerializer, TeamLocationStopSerializer
-from webapp.models import Event, Team, UserTeam, Location, TeamLocation, Score
+from backend.mixins import ActiveTeamMixin
+from backend.renderers import PolylineRenderer
+from backend.serializers import LocationSerializer, LocationBatchSerializer, TeamLocationStopSerializer
+from webapp.geo import find_arrival
+from webapp.ingest import get_location_buffer, get_ping_filter
+from webapp.models import Team, UserTeam, Location, TeamLocation, Score
+from webapp.standings import refresh_standings
+from webapp.tracks import get_tracks, encode_polyline, encode_times
 
 User = get_user_model()
 
 
-class LocationView(APIView):
+def load_team_progress(team):
+    """
+    Initializes the segment state of a team (segment, segment_start and unscored_time) from its location history, for
+    the teams that started before this state was stored. Does nothing for the other teams.
+    :param team: Team object, updated in place
+    """
+    if team.segment or not TeamLocation.objects.filter(team_id=team.pk).exists():
+        return
+
+    # Travel time of each segment (time between its first and last location)
+    segments = list(TeamLocation.objects.filter(team_id=team.pk).values('segment')
+                    .annotate(start=Min('datetime'), end=Max('datetime')).order_by('segment'))
+    team.segment = segments[-1]['segment']
+    team.segment_start = segments[-1]['start']
+
+    # Travel time of the stopped segments, minus the time already scored
+    travel_time = sum((segment['end'] - segment['start'] for segment in segments
+                       if not team.timer_started or segment['segment'] != team.segment), timedelta())
+    scored_time = Score.objects.filter(team_id=team.pk).aggregate(time=Sum('time'))['time'] or timedelta()
+    team.unscored_time = travel_time - scored_time
+
+    team.save(update_fields=['segment', 'segment_start', 'unscored_time'])
+
+
+def lock_team_progress(team_id):
+    """
+    Locks a team until the end of the transaction, so that concurrent requests changing its progress (start, stop,
+    automatic arrival, batch upload) are handled one after the other, and reads its segment state
+    :param team_id: ID of the team
+    :return: Team object, with its segment state initialized (see @load_team_progress())
+    """
+    team = Team.objects.select_for_update().get(pk=team_id)
+    load_team_progress(team)
+    return team
+
+
+def stop_team_timer(team_id, event, latitude, longitude, location_id):
+    """
+    Stops the timer of a team and, if it stopped at a location, scores the time not scored yet
+    :param team_id: ID of the team
+    :param event: Event of the team
+    :param latitude: Latitude of the team
+    :param longitude: Longitude of the team
+    :param location_id: ID of the location (sub-destination or end location) the team stopped at, -1 if none
+    :return: HTTP status: 200 if the timer was stopped, 417 if the team has no segment or the location does not exist,
+    418 if the timer was already stopped
+    """
+    with transaction.atomic():
+        # Lock the team, so that concurrent requests of its members are handled one after the other
+        team = lock_team_progress(team_id)
+
+        # If the timer is already stopped
+        if not team.timer_started:
+            return 418
+
+        # Check if there is a last known location
+        if not team.segment:
+            return HTTP_417_EXPECTATION_FAILED
+
+        # Prepare a new TeamLocation entry
+        team_location = TeamLocation()
+        team_location.team_id = team.pk
+        team_location.segment = team.segment
+        team_location.datetime = now()
+
+        # The travel time of the segment is not scored yet
+        team.unscored_time += team_location.datetime - team.segment_start
+
+        # If a location ID is provided, update score and set location ID to provided ID
+        if location_id != -1:
+
+            # Verify whether the location exists in the database or not
+            location = Location.objects.filter(pk=location_id).first()
+            if not location:
+                return HTTP_417_EXPECTATION_FAILED
+
+            team_location.location_id = location_id
+            team_location.latitude = location.latitude
+            team_location.longitude = location.longitude
+            team_location.save()
+
+            # Check if there is already a score for that location
+            check_score = Score.objects.filter(team_id=team.pk, end_location_id=location_id)
+
+            # If there is none, store the time not scored yet as the new score
+            if not check_score:
+                # Get the starting location: the end of the previous score, if any
+                start_location = event.start_location_id
+                previous_score = Score.objects.filter(team_id=team.pk).order_by('-id').first()
+                if previous_score:
+                    start_location = previous_score.end_location_id
+
+                # Store the score in the database, except if the calculated score is 00:00
+                if team.unscored_time.total_seconds() != 0:
+                    score = Score()
+                    score.team_id = team.pk
+                    score.time = team.unscored_time
+                    score.start_location_id = start_location
+                    score.end_location_id = location_id
+                    score.save()
+                    team.unscored_time = timedelta()
+
+        # If no location ID is provided, the score is not updated and the coordinates are stored
+        else:
+            team_location.latitude = latitude
+            team_location.longitude = longitude
+            team_location.save()
+
+        # Stop the timer
+        team.timer_started = False
+        team.save()
+
+    # Rebuild the scoreboard with the completed segment
+    refresh_standings(event.pk)
+    return HTTP_200_OK
+
+
+def notify_team(team_id, user_id, data):
+    """
+    Sends a Firebase message to the devices of the members of a team
+    :param team_id: ID of the team
+    :param user_id: ID of the member not to notify (the requesting user)
+    :param data: Data of the message
+    """
+    # Get a list of participants of the same team (excluding requesting user)
+    team_members = UserTeam.objects.filter(team_id=team_id).exclude(user_id=user_id)
+    # Get team member devices
+    devices = FCMDevice.objects.filter(user_id__in=team_members.values_list('user_id'), active=True)
+    if devices:
+        # Send firebase message
+        devices.send_message(data=data)
+
+
+class LocationView(ActiveTeamMixin, APIView):
     """
     API endpoint allowing a user to submit his current location\n
     Allowed methods: POST\n
@@ -30,6 +173,14 @@ class LocationView(APIView):
         - HTTP 404: When there is no active event or the user is not in a team for the active event
         - HTTP 405: On GET/PUT/DELETE requests
         - HTTP 417: When the timer is not started or there is no last known location
+    The redundant locations (sent shortly after the last stored location of the team, e.g. by another member, or too
+    close to it) are not stored, see the LOCATION_MIN_* settings.
+    With settings.LOCATION_INGEST_MODE = 'buffered', the location is stored shortly after the response by the location
+    buffer of the process.
+    With settings.GEOFENCE_AUTO_ARRIVAL, the timer of the team is stopped (as with /api/teams/my/stop/) when the
+    location is inside the geofence of the next destination of the team.
+    :return: Nothing, or when the team arrived at its next destination:\n
+        - arrived_location_id: ID of the location of the destination
     """
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -38,60 +189,161 @@ class LocationView(APIView):
 
         # Check if the POST data is valid
         if serializer.is_valid():
-            # Check if there is an active event
-            event = Event.objects.filter(is_active=True)
-            if event:
-                event = Event.objects.get(is_active=True)
-
-                # Check if the requesting user is in a team for this event
-                user = self.request.user
-                team = UserTeam.objects.filter(user_id=user.pk, team__event_id=event.pk)
-
-                if team:
-                    # Check if timer is started
-                    team = UserTeam.objects.get(user_id=user.pk, team__event_id=event.pk)
-                    team = Team.objects.get(pk=team.team_id)
-
-                    if team.timer_started:
-                        # Check if there is a last known location
-                        try:
-                            last_location = TeamLocation.objects.filter(team_id=team.pk).latest('datetime')
-                        except TeamLocation.DoesNotExist:
+            # Check if the requesting user is in a team for the active event
+            team = request.active_team
+            if team:
+                # Check if timer is started
+                if team.timer_started:
+                    # Check if there is a last known location: the team has a segment (only the teams started before
+                    # the segment was stored need to read it from their locations)
+                    if not team.segment:
+                        with transaction.atomic():
+                            team = lock_team_progress(team.pk)
+                        if not team.segment:
                             return Response(status=HTTP_417_EXPECTATION_FAILED)
+                    segment = team.segment
+
+                    # Store the location as a track point of the team
+                    team_location = TeamLocation()
+                    team_location.team_id = team.pk
+                    team_location.latitude = serializer.data.get("latitude")
+                    team_location.longitude = serializer.data.get("longitude")
+                    team_location.segment = segment
+                    team_location.datetime = now()
+                    # Skip the redundant locations
+                    if get_ping_filter().accept(team_location):
+                        if settings.LOCATION_INGEST_MODE == 'buffered':
+                            get_location_buffer().append(team_location)
+                        else:
+                            team_location.save()
 
-                        segment = last_location.segment
-
-                        # Create a new location
-                        location = Location()
-                        location.latitude = serializer.data.get("latitude")
-                        location.longitude = serializer.data.get("longitude")
-                        location.save()
-
-                        # Associate it to the team
-                        team_location = TeamLocation()
-                        team_location.team_id = team.pk
-                        team_location.location_id = location.pk
-                        team_location.segment = segment
-                        team_location.datetime = now()
-                        team_location.save()
+                    # Stop the timer when the team enters the geofence of its next destination
+                    if settings.GEOFENCE_AUTO_ARRIVAL:
+                        event = request.active_event
+                        arrival = find_arrival(team, event, team_location.latitude, team_location.longitude)
+                        if arrival is not None and stop_team_timer(team.pk, event, team_location.latitude,
+                                                                   team_location.longitude, arrival) == HTTP_200_OK:
+                            # Notify the other team members
+                            notify_team(team.pk, request.user.pk, {"timer_started": False})
+                            return Response(dict(arrived_location_id=arrival), status=HTTP_200_OK)
 
-                        return Response(status=HTTP_200_OK)
+                    return Response(status=HTTP_200_OK)
 
-                    else:
-                        # The team timer is not started
-                        return Response(status=HTTP_417_EXPECTATION_FAILED)
                 else:
-                    # Requesting user is not in a team for the active event
-                    return Response(status=HTTP_404_NOT_FOUND)
+                    # The team timer is not started
+                    return Response(status=HTTP_417_EXPECTATION_FAILED)
             else:
-                # There is no active event
+                # There is no active event or the requesting user is not in a team for it
                 return Response(status=HTTP_404_NOT_FOUND)
         else:
             # Invalid POST data
             return Response(status=HTTP_400_BAD_REQUEST)
 
 
-class TeamLocationStart(viewsets.ModelViewSet):
+class LocationBatchView(ActiveTeamMixin, APIView):
+    """
+    API endpoint allowing a user to submit the locations recorded by their device, e.g. after losing signal\n
+    Allowed methods: POST\n
+    Fields (JSON):\n
+        - locations: List of at most settings.LOCATION_BATCH_SIZE locations
+            - latitude: location latitude
+            - longitude: location longitude
+            - datetime: date and time (ISO 8601) the location was recorded by the device
+    Each location is added to the segment of the team that was running at its date and time. Locations recorded while
+    the timer of the team was stopped or in the future are rejected.
+    Possible HTTP responses:\n
+        - HTTP 200: On successful request
+        - HTTP 400: On invalid POST data
+        - HTTP 401: When not authenticated
+        - HTTP 404: When there is no active event or the user is not in a team for the active event
+        - HTTP 405: On GET/PUT/DELETE requests
+        - HTTP 417: When the team has no segment yet
+    :return:\n
+        - accepted: Number of locations stored
+        - rejected: Number of locations rejected
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        serializer = LocationBatchSerializer(data=request.data)
+
+        # Check if the POST data is valid
+        if not serializer.is_valid():
+            return Response(status=HTTP_400_BAD_REQUEST)
+
+        # Check if the requesting user is in a team for the active event
+        team = request.active_team
+        if not team:
+            return Response(status=HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            # Lock the team, so that its segments do not change (stop, start) while the locations are attributed
+            team = lock_team_progress(team.pk)
+
+            # Check if the team has a segment
+            if not team.segment:
+                return Response(status=HTTP_417_EXPECTATION_FAILED)
+
+            fixes = sorted(serializer.validated_data['locations'], key=lambda fix: fix['datetime'])
+
+            # Time range of each segment of the team: from its start to its stop, or to now for the running segment
+            upload_time = now()
+            ranges = []
+            for segment in TeamLocation.objects.filter(team_id=team.pk).values('segment') \
+                    .annotate(start=Min('datetime'), end=Max('datetime')) \
+                    .filter(start__lte=fixes[-1]['datetime'], end__gte=fixes[0]['datetime']).order_by('segment'):
+                ranges.append((segment['segment'], segment['start'], segment['end']))
+            if team.timer_started:
+                ranges = [segment for segment in ranges if segment[0] != team.segment]
+                ranges.append((team.segment, team.segment_start, upload_time))
+
+            # Attribute each location to the segment running at its date and time
+            accepted = []
+            for fix in fixes:
+                segment = next((segment for segment, start, end in ranges if start <= fix['datetime'] <= end), None)
+                if segment is not None:
+                    accepted.append((fix, segment))
+
+            # Store the accepted locations as track points of the team
+            TeamLocation.objects.bulk_create(
+                [TeamLocation(team_id=team.pk, latitude=fix['latitude'], longitude=fix['longitude'], segment=segment,
+                              datetime=fix['datetime']) for fix, segment in accepted])
+
+            return Response(dict(accepted=len(accepted), rejected=len(fixes) - len(accepted)), status=HTTP_200_OK)
+
+
+class LocationBufferView(APIView):
+    """
+    API endpoint allowing an administrator to monitor the location buffer of the process answering the request\n
+    Allowed methods: GET\n
+    Possible HTTP responses:\n
+        - HTTP 200: On successful request
+        - HTTP 401: When not authenticated
+        - HTTP 403: When the user is not an administrator
+        - HTTP 405: On POST/PUT/DELETE requests
+    :return:\n
+        - mode: settings.LOCATION_INGEST_MODE
+        - depth: Number of locations waiting in the buffer
+        - flushed: Number of locations stored by the buffer
+        - flushes: Number of bulk inserts
+        - spilled: Number of locations written to the spill file
+        - last_flush_ms: Duration of the last bulk insert (in milliseconds)
+        - max_flush_ms: Duration of the longest bulk insert (in milliseconds)
+        - accepted: Number of locations accepted by the ping filter of the process
+        - dropped: Number of redundant locations dropped by the ping filter of the process
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        # Check for permission
+        if not request.user.is_staff:
+            return Response(status=HTTP_403_FORBIDDEN)
+
+        return Response(dict(mode=settings.LOCATION_INGEST_MODE, **get_location_buffer().stats(),
+                             **get_ping_filter().stats()), status=HTTP_200_OK)
+
+
+class TeamLocationStart(ActiveTeamMixin, viewsets.ModelViewSet):
     """
     API endpoint allowing a user to start its team timer\n
     Allowed methods: POST\n
@@ -122,78 +374,48 @@ class TeamLocationStart(viewsets.ModelViewSet):
 
             user = self.request.user
 
-            # Check whether there is an active event
-            event = Event.objects.filter(is_active=True)
-
-            # If there is an active event
-            if event:
-                event = Event.objects.get(is_active=True)
-
-                # Check if the requesting user is in a team for this event
-                team = UserTeam.objects.filter(user_id=user.pk, team__event_id=event.pk)
-
-                if team:
-                    # Check if the timer is already running
-                    team = UserTeam.objects.get(user_id=user.pk, team__event_id=event.pk)
-                    team = Team.objects.get(pk=team.team_id)
-
-                    # If not
-                    if not team.timer_started:
-                        # Start the team timer
-                        team.timer_started = True
-                        team.save()
-
-                        # Get a list of participants of the same team (excluding requesting user)
-                        team_members = UserTeam.objects.filter(team_id=team.pk).exclude(user_id=user.pk)
-                        # Get team member devices
-                        devices = FCMDevice.objects.filter(user_id__in=team_members.values_list('user_id'), active=True)
-                        if devices:
-                            # Send firebase message
-                            devices.send_message(data={"timer_started": True})
-
-                        # Create a new location with provided coordinates
-                        location = Location()
-                        location.latitude = latitude
-                        location.longitude = longitude
-                        location.save()
-
-                        # Get existing last known location (if any) If there is not last known location,
-                        # the new segment number will be 1. Otherwise last segment + 1
-                        segment = 1
-                        try:
-                            previous_location = TeamLocation.objects.filter(team_id=team.pk).latest('datetime')
-                        except TeamLocation.DoesNotExist:
-                            previous_location = False
-
-                        if previous_location:
-                            segment = previous_location.segment + 1
-
-                        # Create a new TeamLocation entry
-                        team_location = TeamLocation()
-                        team_location.team_id = team.pk
-                        team_location.location_id = location.pk
-                        team_location.segment = segment
-                        team_location.datetime = now()
-                        team_location.save()
-
-                        # Return HTTP 200
-                        return Response(status=HTTP_200_OK)
-
-                    else:
-                        # If the timer is already started for the team, return I'm a teapot
+            # Check if the requesting user is in a team for the active event
+            if request.active_team:
+                with transaction.atomic():
+                    # Lock the team, so that concurrent requests of its members are handled one after the other
+                    team = lock_team_progress(request.active_team.pk)
+
+                    # If the timer is already started for the team, return I'm a teapot
+                    if team.timer_started:
                         return Response(status=418)
-                else:
-                    # If the requesting user is not in a team for the event
-                    return Response(status=HTTP_404_NOT_FOUND)
+
+                    # The new segment number is the last segment + 1 (1 if there is no last known location)
+                    start_time = now()
+
+                    # Create a new TeamLocation entry with provided coordinates
+                    team_location = TeamLocation()
+                    team_location.team_id = team.pk
+                    team_location.latitude = latitude
+                    team_location.longitude = longitude
+                    team_location.segment = team.segment + 1
+                    team_location.datetime = start_time
+                    team_location.save()
+
+                    # Start the team timer and the new segment
+                    team.timer_started = True
+                    team.segment = team_location.segment
+                    team.segment_start = start_time
+                    team.save()
+
+                # Notify the other team members
+                notify_team(team.pk, user.pk, {"timer_started": True})
+
+                # Return HTTP 200
+                return Response(status=HTTP_200_OK)
             else:
-                # If there is no active event
+                # If there is no active event or the requesting user is not in a team for it
                 return Response(status=HTTP_404_NOT_FOUND)
         else:
             # If POST data is invalid
             return Response(status=HTTP_400_BAD_REQUEST)
 
 
-class TeamLocationStop(viewsets.ModelViewSet):
+class TeamLocationStop(ActiveTeamMixin, viewsets.ModelViewSet):
     """
     API endpoint allowing a user to stop its team timer\n
     Allowed methods: POST\n
@@ -220,197 +442,87 @@ class TeamLocationStop(viewsets.ModelViewSet):
         # Check if POST data is valid
         serializer = TeamLocationStopSerializer(data=request.data)
         if serializer.is_valid():
-            # Check if there is an active event
-            event = Event.objects.filter(is_active=True)
-            if event:
-                event = Event.objects.get(is_active=True)
-
-                # Check if the requesting user is in a team for this event
-                user = self.request.user
-                team = UserTeam.objects.filter(user_id=user.pk, team__event_id=event.pk)
-
-                if team:
-                    # Check if the timer is already running
-                    team = UserTeam.objects.get(user_id=user.pk, team__event_id=event.pk)
-                    team = Team.objects.get(pk=team.team_id)
-
-                    # If so
-                    if team.timer_started:
-
-                        # Retrieve last segment number
-                        try:
-                            last_team_location = TeamLocation.objects.filter(team_id=team.pk).latest('datetime')
-                        except TeamLocation.DoesNotExist:
-                            return Response(status=HTTP_417_EXPECTATION_FAILED)
-
-                        last_segment = last_team_location.segment
-
-                        # Check if a location ID is provided
-                        latitude = serializer.data.get("latitude")
-                        longitude = serializer.data.get("longitude")
-                        location_id = serializer.data.get("location_id")
-
-                        # Prepare a new TeamLocation entry
-                        team_location = TeamLocation()
-                        team_location.team_id = team.pk
-                        team_location.segment = last_segment
-                        team_location.datetime = now()
-
-                        # If so, update score and set location ID to provided ID
-                        if location_id is not -1:
-
-                            # Verify whether the location exists in the database or not
-                            location_check = Location.objects.filter(pk=location_id)
-                            if not location_check:
-                                return Response(status=HTTP_417_EXPECTATION_FAILED)
-
-                            team_location.location_id = location_id
-                            team_location.save()
+            # Check if the requesting user is in a team for the active event
+            user = self.request.user
+            event = request.active_event
+            if request.active_team:
+                # Stop the timer, at the location if one is provided
+                latitude = serializer.data.get("latitude")
+                longitude = serializer.data.get("longitude")
+                location_id = serializer.data.get("location_id")
 
-                            # Check if there is already a score for that location
-                            check_score = Score.objects.filter(team_id=team.pk, end_location_id=location_id)
-
-                            # If there is none, calculate and store the new score
-                            if not check_score:
-                                # Get all distinct segments as a list
-                                segments = list(
-                                    TeamLocation.objects.filter(team_id=team.id)
-                                        .distinct('segment')
-                                        .values_list('segment', flat=True))
-                                segments.sort()
-                                # For each segment, calculate the time it took to complete
-                                segment_times = []
-                                for segment in segments:
-                                    start_time = TeamLocation.objects.filter(team_id=team.id, segment=segment) \
-                                        .earliest('datetime').datetime
-                                    end_time = TeamLocation.objects.filter(team_id=team.id, segment=segment) \
-                                        .latest('datetime').datetime
-
-                                    time = end_time - start_time
-                                    segment_times.append(time)
-
-                                # Add the times of each segment to get the score
-                                time_score = timedelta()
-                                for time in segment_times:
-                                    time_score = time_score + time
-
-                                # Get the starting location
-                                start_location = event.start_location_id
-
-                                # Check for previous score
-                                # If any, change the start location and calculate the score since then
-                                previous_scores = Score.objects.filter(team_id=team.pk)
-                                if previous_scores:
-                                    for previous_score in previous_scores:
-                                        time_score = time_score - previous_score.time
-
-                                    # Get new starting location
-                                    start_location = Score.objects.filter(team_id=team.pk).latest('id').end_location_id
-
-                                # Store the score in the database, except if the calculated score is 00:00
-                                score = Score()
-                                score.team_id = team.pk
-                                score.time = time_score
-                                score.start_location_id = start_location
-                                score.end_location_id = location_id
-                                if time_score.total_seconds() != 0:
-                                    score.save()
-
-                        # If no location ID is provided, the score is not updated and a new location is stored
-                        else:
-                            location = Location()
-                            location.latitude = latitude
-                            location.longitude = longitude
-                            location.save()
+                status = stop_team_timer(request.active_team.pk, event, latitude, longitude, location_id)
+                if status != HTTP_200_OK:
+                    return Response(status=status)
 
-                            team_location.location_id = location.pk
-                            team_location.save()
+                # Notify the other team members
+                notify_team(request.active_team.pk, user.pk, {"timer_started": False})
 
-                        # Stop the timer
-                        team.timer_started = False
-                        team.save()
-
-                        # Get a list of participants of the same team (excluding requesting user)
-                        team_members = UserTeam.objects.filter(team_id=team.pk).exclude(user_id=user.pk)
-                        # Get team member devices
-                        devices = FCMDevice.objects.filter(user_id__in=team_members.values_list('user_id'), active=True)
-                        if devices:
-                            # Send firebase message
-                            devices.send_message(data={"timer_started": False})
-
-                        return Response(status=HTTP_200_OK)
-                    else:
-                        # Timer already stopped
-                        return Response(status=418)
-                else:
-                    # User not in a team for the active event
-                    return Response(status=HTTP_404_NOT_FOUND)
+                return Response(status=HTTP_200_OK)
             else:
-                # No active event
+                # No active event or user not in a team for it
                 return Response(status=HTTP_404_NOT_FOUND)
         else:
             # If POST data is not valid
             return Response(status=HTTP_400_BAD_REQUEST)
 
 
-class TeamRoute(APIView):
+class TeamRoute(ActiveTeamMixin, APIView):
     """
     API endpoint allowing a user to view their team route
     Allowed methods: GET\n
+    Parameters:\n
+        - tolerance: Simplification tolerance in metres, one of settings.TRACK_SIMPLIFY_TOLERANCES (optional,
+          settings.TRACK_SIMPLIFY_TOLERANCE by default), the locations closer than it to the simplified route are left
+          out. 0 returns every location
+        - format: "polyline" to return each segment as an encoded polyline (optional)
     Possible HTTP responses:\n
         - HTTP 200: On successful request
+        - HTTP 400: If the tolerance is not one of the allowed values
         - HTTP 401: If unauthenticated
         - HTTP 404: If there is no route for the requesting user's team
         - HTTP 405: On POST/PUT/DELETE requests
     :return: A list of the locations the team went through, grouped by segment\n
         - segment: Segment number
         - locations:
-            - id: Location ID
+            - id: ID of the track point
             - latitude: Location's latitude
             - longitude: Location's longitude
             - datetime: Date/time the team reached the location
+    With format=polyline, each segment is returned as:\n
+        - segment: Segment number
+        - polyline: Locations of the segment, in the encoded polyline algorithm format of Google Maps
+        - start: Date/time the team reached the first location
+        - times: Seconds elapsed between each location and the previous one (0 for the first location)
     """
     permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (PolylineRenderer,)
 
     def get(self, request):
-        # Check if there is an active event
-        event = Event.objects.filter(is_active=True)
-        if event:
-            event = Event.objects.get(is_active=True)
-
-            # Check if the requesting user is in a team for this event
-            user = self.request.user
-            team = UserTeam.objects.filter(user_id=user.pk, team__event_id=event.pk)
-
-            if team:
-                # Retrieve the entries from TeamLocation
-                team = UserTeam.objects.get(user_id=user.pk, team__event_id=event.pk)
-                team_locations = TeamLocation.objects.filter(team_id=team.team_id).order_by('segment')
-                route = []
-                segments = []
-
-                # Get all the segments
-                for team_location in team_locations:
-                    if team_location.segment not in segments:
-                        segments.append(team_location.segment)
-
-                # For each segment, get the corresponding locations
-                for segment in segments:
-                    team_segment = TeamLocation.objects.filter(segment=segment, team_id=team.team_id)
-                    locations = []
-                    # For each location, get its corresponding data
-                    for data in team_segment:
-                        location = Location.objects.get(pk=data.location_id)
-                        serialized_location = dict(id=location.id, latitude=location.latitude,
-                                                   longitude=location.longitude, datetime=data.datetime)
-                        locations.append(serialized_location)
-                    # Combine locations with segment
-                    combined_segments = dict(segment=segment, locations=locations)
-                    route.append(combined_segments)
-                return Response(route, status=HTTP_200_OK)
-            else:
-                # The user is not in a team for the active event
-                return Response(status=HTTP_404_NOT_FOUND)
+        # Check the simplification tolerance, limited to a few values as the simplified segments are cached by tolerance
+        tolerance = request.query_params.get('tolerance')
+        if tolerance is not None:
+            if not tolerance.isdigit() or int(tolerance) not in settings.TRACK_SIMPLIFY_TOLERANCES:
+                return Response(status=HTTP_400_BAD_REQUEST)
+            tolerance = int(tolerance)
+
+        # Check if the requesting user is in a team for the active event
+        team = request.active_team
+        if team:
+            # Retrieve the simplified segments of the team
+            team_locations = TeamLocation.objects.filter(team_id=team.pk)
+            route = []
+
+            for _, segment, points in get_tracks(team_locations, tolerance):
+                if request.accepted_renderer.format == PolylineRenderer.format:
+                    datetimes = [point[3] for point in points]
+                    route.append(dict(segment=segment, polyline=encode_polyline(points), start=datetimes[0],
+                                      times=encode_times(datetimes)))
+                    continue
+                locations = [dict(id=team_location_id, latitude=latitude, longitude=longitude, datetime=datetime)
+                             for latitude, longitude, team_location_id, datetime in points]
+                route.append(dict(segment=segment, locations=locations))
+            return Response(route, status=HTTP_200_OK)
         else:
-            # There is no active event
+            # There is no active event or the user is not in a team for it
             return Response(status=HTTP_404_NOT_FOUND)
@@ -1,13 +1,22 @@
-from datetime import timedelta
+from calendar import timegm
 
-from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.utils.timezone import is_naive, make_aware
 from rest_framework import permissions
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_200_OK
+from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_429_TOO_MANY_REQUESTS
 from rest_framework.views import APIView
 
-from backend.functions import time_format
-from webapp.models import Event, Team, UserTeam, User, SubLocation, Score, TeamChallenge, Challenge, TeamLocation
+from backend.renderers import EventStreamRenderer
+from webapp.active_event import get_active_event
+from webapp.broker import event_stream, get_stream_client, open_stream
+from webapp.models import Event
+from webapp.standings import get_standings, get_standings_delta, get_standings_etag, get_snapshot, \
+    serialize_snapshot, serialize_standing
 
 
 class Scoreboard(APIView):
@@ -15,11 +24,17 @@ class Scoreboard(APIView):
     API endpoint allowing a user to view the scoreboard
     Allowed methods: GET\n
     Possible HTTP responses:\n
-        - HTTP 200: On successful request
+        - HTTP 200: On successful request, with the ETag and Last-Modified headers of the standings version
+        - HTTP 304: If the If-None-Match/If-Modified-Since headers match the current standings version
+        - HTTP 400: If since or top is not a non-negative integer
         - HTTP 401: If unauthenticated
         - HTTP 404: If there is no active event
         - HTTP 405: On POST/PUT/DELETE requests
-    :return: The scoreboard for the active event as a list with items for each team
+    Query parameters:\n
+        - since (optional): Standings version already known by the client, only the changes made after it are returned
+        - top (optional): Number of teams to return, starting from the first one
+    :return: The scoreboard for the active event as a list with items for each team, in rank order
+        - team_id: ID of the team
         - members: list of teams members containing the first names of the members
         - segments: List of the segments
             - order: Order of the segment
@@ -29,126 +44,138 @@ class Scoreboard(APIView):
         - bonus_time: Bonus time earned by a team via challenges
         - final_time: Total time - bonus time
         - is_disqualified: Whether the team is disqualified or not
+        - rank: Position of the team on the scoreboard (disqualified teams last, ties broken by team ID)
+        - rank_change: Number of positions gained (negative if lost) at the last rank change of the team
+    With the since parameter, a dictionary instead:
+        - version: Current version of the standings, to send as since on the next request
+        - team_ids: IDs of all teams in rank order, teams not listed have been deleted
+        - teams: Items (as above) of the teams whose entry changed after version since
     """
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
+        # Check the version sent by the client, if any
+        since = request.query_params.get('since')
+        if since is not None:
+            if not since.isdigit():
+                return Response(status=HTTP_400_BAD_REQUEST)
+            since = int(since)
+
+        top = request.query_params.get('top')
+        if top is not None:
+            if not top.isdigit():
+                return Response(status=HTTP_400_BAD_REQUEST)
+            top = int(top)
+
         # Get active event
-        event = Event.objects.filter(is_active=True)
+        event = Event.objects.filter(is_active=True).first()
         if event:
-            event = Event.objects.get(is_active=True)
-
-            # Get the teams
-            teams = Team.objects.filter(event_id=event.pk)
-            team_ids = teams.values_list('id')
-
-            # Get the sub-destinations
-            sub_destinations = SubLocation.objects.filter(event_id=event.pk).order_by('order')
-            last_sub_destination_order = sub_destinations.aggregate(order=Max('order')).get('order')
-
-            # Get the challenges
-            challenges = Challenge.objects.filter(event_id=event.pk)
-
-            # Get the scores
-            scores = Score.objects.filter(team_id__in=team_ids)
-            team_locations = TeamLocation.objects.filter(team__event_id=event.pk)
-
-            # Get the challenges validated by the teams
-            team_challenges = TeamChallenge.objects.filter(team_id__in=team_ids, is_accepted=True)
-
-            # Construct the segments
-
-            segment_names = []
-            segment_ids = []
-
-            for location in sub_destinations:
-                # If order is 1, then create the start location to first sub-destination segment
-                if location.order == 1:
-                    segment_names.append(event.start_city + "-" + location.city)
-                    ids = dict(order=location.order, end_id=location.location_id)
-                    segment_ids.append(ids)
-                # If order is the biggest one in the table, add last sub-destination to end location segment
-                if location.order == last_sub_destination_order:
-                    segment_names.append(location.city + "-" + event.end_city)
-                    ids = dict(order=location.order + 1, end_id=event.end_location_id)
-                    segment_ids.append(ids)
-                else:
-                    next_location = sub_destinations.get(order=location.order + 1)
-                    segment_names.append(location.city + "-" + next_location.city)
-                    ids = dict(order=location.order + 1, end_id=next_location.location_id)
-                    segment_ids.append(ids)
-
-            # Construct array to return
-            return_data = []
-
-            # For each team
-            for team in teams:
-
-                # Get the member first names
-                members = UserTeam.objects.filter(team_id=team.pk)
-                users = User.objects.filter(pk__in=members.values_list('user_id'))
-                names = []
-                for user in users:
-                    names.append(user.first_name)
-
-                # For each segment, fetch the time and the order
-                segments = []
-                for segment_name in segment_names:
-                    # Get the array index
-                    index = segment_names.index(segment_name)
-
-                    # Get the order and end location of the segment
-                    order = segment_ids[index].get('order')
-                    end_location = segment_ids[index].get('end_id')
-
-                    # Get the score data for that segment
-                    team_score = scores.filter(end_location_id=end_location, team_id=team.pk)
-                    time = timedelta()
-                    if team_score:
-                        time = team_score.filter(end_location_id=end_location, team_id=team.pk).first().time
-
-                    # Construct segment data (time in HH:MM format or N/A if equal to 00:00)
-                    if time > timedelta(seconds=0):
-                        time = time_format(time)
-                    else:
-                        time = "N/A"
-
-                    segment = dict(order=order, name=segment_name, time=time)
-                    segments.append(segment)
-
-                # Fetch the bonus time
-                bonus_time = timedelta()
-                for team_challenge in team_challenges.filter(team_id=team.pk):
-                    reward = challenges.get(pk=team_challenge.challenge_id).reward
-                    bonus_time = bonus_time + reward
-
-                # Calculate the total travel time
-                total_travel_time = timedelta()
-                team_location = team_locations.filter(team_id=team.pk)
-                for data in team_location.values('segment').distinct():
-                    segment = team_location.filter(segment=data['segment'])
-                    start_time = segment.earliest('datetime').datetime
-                    end_time = segment.latest('datetime').datetime
-
-                    delta = end_time - start_time
-                    total_travel_time = total_travel_time + delta
-
-                # Calculate the final time
-                final_time = total_travel_time - bonus_time
-
-                # Convert the times to HH:MM format
-                travel_time = time_format(total_travel_time)
-                bonus_time = time_format(bonus_time)
-                final_time = time_format(final_time)
-
-                # Construct array for the team
-                team_data = dict(members=names, segments=segments, travel_time=travel_time, bonus_time=bonus_time,
-                                 final_time=final_time, is_disqualified=team.is_disqualified)
-
-                # Add the array to the return values
-                return_data.append(team_data)
-
-            return Response(return_data, status=HTTP_200_OK)
+            # If the client already has the current version of the standings, return 304
+            etag = get_standings_etag(event)
+            last_modified = timegm(event.standings_modified.utctimetuple())
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            # Construct the changes or the array to return from the stored standings
+            if since is not None:
+                return_data = get_standings_delta(event, since)
+            else:
+                standings = get_standings(event)
+                if top is not None:
+                    standings = standings[:top]
+                return_data = [serialize_standing(standing) for standing in standings]
+
+            response = Response(return_data, status=HTTP_200_OK)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            return response
 
         # No active event
         return Response(status=HTTP_404_NOT_FOUND)
+
+
+class ScoreboardStream(APIView):
+    """
+    API endpoint streaming the changes of the scoreboard of the active event as server-sent events\n
+    Allowed methods: GET\n
+    Possible HTTP responses:\n
+        - HTTP 200: On successful request, the stream ends after settings.SCOREBOARD_STREAM_TIMEOUT seconds
+        - HTTP 401: If unauthenticated
+        - HTTP 404: If there is no active event
+        - HTTP 405: On POST/PUT/DELETE requests
+        - HTTP 429: If the user already has settings.SCOREBOARD_STREAM_MAX_PER_CLIENT streams open
+    :return: A "scoreboard" event each time the standings change, with as data:
+        - version: Version of the standings (also sent as the event ID)
+        - team_ids: IDs of all teams, in rank order
+        - teams: Scoreboard entries of the teams that changed, as returned by /api/scoreboard/
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (JSONRenderer, EventStreamRenderer)
+
+    def get(self, request):
+        # Get active event
+        event = get_active_event()
+        if event:
+            # Limit the number of streams of the user, each stream holding a worker
+            client = get_stream_client(request)
+            if not open_stream(client):
+                return Response(status=HTTP_429_TOO_MANY_REQUESTS)
+            response = StreamingHttpResponse(event_stream(event.pk, client), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        # No active event
+        return Response(status=HTTP_404_NOT_FOUND)
+
+
+class ScoreboardHistory(APIView):
+    """
+    API endpoint allowing a user to view the scoreboard of an event as it was at a given time\n
+    Allowed methods: GET\n
+    Query parameters:\n
+        - at (optional): Date and time (ISO 8601), to get the scoreboard as it was at that time
+        - version (optional): Standings version, to get the scoreboard of that version (e.g. previous_version)
+    Possible HTTP responses:\n
+        - HTTP 200: On successful request
+        - HTTP 400: If at or version is invalid
+        - HTTP 401: If unauthenticated
+        - HTTP 404: If the event doesn't exist or there is no scoreboard for the requested time/version
+        - HTTP 405: On POST/PUT/DELETE requests
+    :return: The requested scoreboard (the latest one if neither at nor version are provided)
+        - version: Standings version of the scoreboard
+        - created: Date and time the scoreboard was recorded
+        - previous_version: Version of the previous scoreboard, null if this is the first one
+        - next_version: Version of the next scoreboard, null if this is the last one
+        - standings: Items for each team in rank order, as returned by /api/scoreboard/
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, event_id):
+        # Check the requested time and version
+        at = request.query_params.get('at')
+        if at is not None:
+            # parse_datetime() raises ValueError for well formatted but invalid dates
+            try:
+                at = parse_datetime(at)
+            except ValueError:
+                at = None
+            if at is None:
+                return Response(status=HTTP_400_BAD_REQUEST)
+            if is_naive(at):
+                at = make_aware(at)
+
+        version = request.query_params.get('version')
+        if version is not None:
+            if not version.isdigit():
+                return Response(status=HTTP_400_BAD_REQUEST)
+            version = int(version)
+
+        # Get the snapshot
+        if Event.objects.filter(pk=event_id).exists():
+            snapshot = get_snapshot(event_id, at=at, version=version)
+            if snapshot:
+                return Response(serialize_snapshot(snapshot), status=HTTP_200_OK)
+
+        # No such event or snapshot
+        return Response(status=HTTP_404_NOT_FOUND)
@@ -4,8 +4,10 @@ from rest_framework.response import Response
 from rest_framework.status import HTTP_404_NOT_FOUND
 from rest_framework.views import APIView
 
+from backend.mixins import ActiveTeamMixin
 from backend.serializers import PublicUserSerializer
-from webapp.models import Event, Team, UserTeam, Location, TeamLocation
+from webapp.active_event import get_active_event
+from webapp.models import Team, UserTeam, TeamLocation
 
 User = get_user_model()
 
@@ -36,12 +38,10 @@ class TeamView(APIView):
 
     def get(self, request):
         # Get the active event
-        event = Event.objects.filter(is_active=True)
+        event = get_active_event()
 
         # If it exists
         if event:
-            event = Event.objects.get(is_active=True)
-
             # Get the teams associated to the event
             teams = Team.objects.filter(event_id=event.pk)
 
@@ -72,8 +72,7 @@ class TeamView(APIView):
 
                     # If it exists, retrieve location info
                     if last_location:
-                        location = Location.objects.get(pk=last_location.location_id)
-                        location = dict(latitude=location.latitude, longitude=location.longitude,
+                        location = dict(latitude=last_location.latitude, longitude=last_location.longitude,
                                         datetime=last_location.datetime)
 
                     # Otherwise return a blank location
@@ -95,7 +94,7 @@ class TeamView(APIView):
             return Response(status=HTTP_404_NOT_FOUND)
 
 
-class MyTeamView(APIView):
+class MyTeamView(ActiveTeamMixin, APIView):
     """
     API endpoint allowing to retrieve a user's team\n
     Allowed methods: GET\n
@@ -119,50 +118,25 @@ class MyTeamView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
+        # Get the requesting user's team for the active event
+        team = request.active_team
 
-        # Get the ID of the user performing the request
-        user_id = self.request.user.pk
-
-        # Get the active event (if it exists)
-        active_event = Event.objects.filter(is_active=True)
-
-        # If there is an active event, get the teams associated to it
-        if active_event:
-            active_event = Event.objects.get(is_active=True)
-            teams = Team.objects.filter(event_id=active_event)
-
-            # Look for the requesting user's team
-            team_id = -1
-            for team in teams:
-                team_members = UserTeam.objects.filter(team_id=team, user_id=user_id)
-
-                # If the requesting user is in a team for the active event,
-                if team_members:
-                    team_members = UserTeam.objects.get(team_id=team, user_id=user_id)
-                    team_id = team_members.team_id
+        # If there exists such a team, get the team members
+        if team:
+            team_members = []
+            team_members_id = UserTeam.objects.filter(team_id=team.pk).select_related('user').order_by('user_id')
 
-            # If there exists such a user, get the other team members
-            if team_id is not -1:
-                team_members = []
-                team = Team.objects.get(pk=team_id)
-                team_members_id = UserTeam.objects.filter(team_id=team.pk).order_by('user_id')
+            # Get team members' informations
+            for user in team_members_id:
+                serializer = PublicUserSerializer(user.user)
+                team_members.append(serializer.data)
 
-                # Get team members' informations
-                for user in team_members_id:
-                    user = User.objects.get(pk=user.user_id)
-                    serializer = PublicUserSerializer(user)
-                    team_members.append(serializer.data)
+            # Return requesting user's team
+            data = dict(id=team.pk, is_disqualified=team.is_disqualified, is_winner=team.is_winner,
+                        timer_started=team.timer_started, members=team_members)
 
-                # Return requesting user's team
-                data = dict(id=team.pk, is_disqualified=team.is_disqualified, is_winner=team.is_winner,
-                            timer_started=team.timer_started, members=team_members)
-
-                return Response(data)
-
-            # If the requesting user is not in a team for the active event, return 404
-            else:
-                return Response(status=HTTP_404_NOT_FOUND)
+            return Response(data)
 
-        # If there is no active event, return 404
+        # If there is no active event or the requesting user is not in a team for it, return 404
         else:
             return Response(status=HTTP_404_NOT_FOUND)
@@ -0,0 +1,61 @@
+# Process-level cache of the active event
+#
+# The active event, with its start and end locations, is kept in memory by each process along with the version it was
+# loaded at. The version is a key of the Django cache, replaced each time the event, the activation of an event or one
+# of its locations changes (see webapp.signals): with a cache shared by the workers (memcached, Redis, ...) every
+# process reloads the event on its next request. With the default per-process cache, the other processes reload it
+# after settings.ACTIVE_EVENT_CACHE_TIMEOUT seconds at most.
+# The standings fields of the event (standings_stale, standings_version, standings_modified) are updated without
+# signals and must be read from the database.
+
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from webapp.models import Event
+
+VERSION_CACHE_KEY = 'active_event_version'
+
+_lock = threading.Lock()
+_cached = dict(version=None, loaded=0, event=None)
+
+
+def get_active_event():
+    """
+    Returns the active event, with its start and end locations
+    :return: Event object (a copy, it can be modified by the caller), None if there is no active event
+    """
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = _new_version()
+
+    with _lock:
+        expired = time.monotonic() - _cached['loaded'] > settings.ACTIVE_EVENT_CACHE_TIMEOUT
+        # Without a working cache (no version), the event is always loaded
+        if version is None or version != _cached['version'] or expired:
+            _cached['event'] = Event.objects.select_related('start_location', 'end_location') \
+                .filter(is_active=True).first()
+            _cached['version'] = version
+            _cached['loaded'] = time.monotonic()
+        event = _cached['event']
+
+    return copy.deepcopy(event)
+
+
+def invalidate_active_event():
+    """
+    Makes every process reload the active event on its next request
+    """
+    with _lock:
+        _cached['version'] = None
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+# Creates the version key if it is missing (first request or evicted), keeping the one of a concurrent process
+def _new_version():
+    cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    return cache.get(VERSION_CACHE_KEY)
@@ -0,0 +1,231 @@
+# Distance and speed statistics of the teams of an event
+#
+# The track points of an event are loaded into NumPy arrays ordered by team, segment and time, and the statistics of
+# every segment are computed with array operations on the consecutive points (no loop over the points):
+#   - distance: Sum of the haversine distances between the consecutive points
+#   - moving time: Time spent between consecutive points at settings.ANALYTICS_STOP_SPEED or more
+#   - average speed: Distance / moving time
+#   - max speed: Highest speed between two consecutive points
+#   - stops: Number of periods of at least settings.ANALYTICS_STOP_DURATION seconds below settings.ANALYTICS_STOP_SPEED
+# The statistics of each segment are cached per (team, segment) along with the number of track points and the highest
+# TeamLocation ID they were computed from, like the simplified tracks (see webapp.tracks): a new track point only
+# computes the statistics of its segment again. The track points of an archived event are read from its archive (see
+# webapp.archive), its statistics are cached per event.
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+from webapp.archive import read_archive
+from webapp.geohash import EARTH_RADIUS
+from webapp.models import TeamLocation
+
+
+def load_track_points(team_locations):
+    """
+    Loads track points into arrays
+    :param team_locations: TeamLocation queryset, e.g. filtered by event
+    :return: Tuple of arrays (team_ids, segments, latitudes, longitudes, times), ordered by team, segment and time, with
+    the times in seconds since the epoch
+    """
+    rows = team_locations.filter(latitude__isnull=False).order_by('team_id', 'segment', 'datetime') \
+        .values_list('team_id', 'segment', 'latitude', 'longitude', 'datetime').iterator()
+    return _to_arrays(rows)
+
+
+def load_event_track_points(event):
+    """
+    Loads the track points of an event into arrays, from its archive if it is archived
+    :param event: Event object
+    :return: Tuple of arrays, as @load_track_points()
+    """
+    if event.archived is None:
+        return load_track_points(TeamLocation.objects.filter(team__event_id=event.pk))
+
+    rows = ((row['team_id'], row['segment'], row['latitude'], row['longitude'], row['datetime'])
+            for row in read_archive(event.pk, TeamLocation) if row['latitude'] is not None)
+    return _to_arrays(rows)
+
+
+def get_event_track_points_version(event):
+    """
+    Identifies the track points of an event, to check whether results computed from them are outdated
+    :param event: Event object
+    :return: Version of the track points (see @get_track_points_version()), the archiving date for an archived event
+    """
+    if event.archived is None:
+        return get_track_points_version(TeamLocation.objects.filter(team__event_id=event.pk))
+    return event.archived
+
+
+# Converts rows (team_id, segment, latitude, longitude, datetime) into arrays
+def _to_arrays(rows):
+    dtype = [('team_id', np.int64), ('segment', np.int64), ('latitude', np.float64), ('longitude', np.float64),
+             ('time', np.float64)]
+    points = np.fromiter(((team_id, segment, latitude, longitude, datetime.timestamp())
+                          for team_id, segment, latitude, longitude, datetime in rows), dtype=dtype)
+    return points['team_id'], points['segment'], points['latitude'], points['longitude'], points['time']
+
+
+def get_track_points_version(team_locations):
+    """
+    Identifies the track points of @team_locations, to check whether results computed from them are outdated. Covers
+    the track points written without signals (bulk inserts).
+    :param team_locations: TeamLocation queryset
+    :return: Tuple (number of track points with coordinates, highest TeamLocation ID)
+    """
+    size = team_locations.filter(latitude__isnull=False).aggregate(count=Count('id'), last_id=Max('id'))
+    return size['count'], size['last_id']
+
+
+def haversine(latitudes_1, longitudes_1, latitudes_2, longitudes_2):
+    """
+    :return: Array of the great-circle distances (in metres) between the points of the arrays
+    """
+    phi_1, phi_2 = np.radians(latitudes_1), np.radians(latitudes_2)
+    delta_phi = phi_2 - phi_1
+    delta_lambda = np.radians(longitudes_2 - longitudes_1)
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi_1) * np.cos(phi_2) * np.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def compute_statistics(team_ids, segments, latitudes, longitudes, times, stop_speed, stop_duration):
+    """
+    Computes the statistics of each segment of the track points
+    :param team_ids, segments, latitudes, longitudes, times: Arrays as returned by @load_track_points()
+    :param stop_speed: Speed (in m/s) below which a team is stopped
+    :param stop_duration: Minimum duration (in seconds) of a stop
+    :return: List of the statistics of each segment, ordered by team and segment:
+        - team_id: ID of the team
+        - segment: Segment number
+        - distance: Distance travelled (in metres)
+        - moving_time: Time spent moving (in seconds)
+        - max_speed: Highest speed (in m/s)
+        - stops: Number of stops
+    """
+    if not len(team_ids):
+        return []
+
+    # Groups of points of the same team and segment
+    starts = np.flatnonzero(np.r_[True, (team_ids[1:] != team_ids[:-1]) | (segments[1:] != segments[:-1])])
+    groups = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(team_ids)]))
+    count = len(starts)
+
+    # Steps between consecutive points of the same group
+    same = groups[1:] == groups[:-1]
+    step_groups = groups[1:][same]
+    distances = haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])[same]
+    durations = np.diff(times)[same]
+    speeds = np.divide(distances, durations, out=np.zeros_like(distances), where=durations > 0)
+    moving = speeds >= stop_speed
+
+    distance = np.bincount(step_groups, weights=distances, minlength=count)
+    moving_time = np.bincount(step_groups, weights=np.where(moving, durations, 0), minlength=count)
+    max_speed = np.zeros(count)
+    np.maximum.at(max_speed, step_groups, speeds)
+
+    # Stops: runs of consecutive slow steps of the same group, lasting at least stop_duration
+    slow = ~moving
+    first_step = np.r_[True, step_groups[1:] != step_groups[:-1]]
+    last_step = np.r_[first_step[1:], True]
+    run_starts = np.flatnonzero(slow & (first_step | ~np.r_[False, slow[:-1]]))
+    run_ends = np.flatnonzero(slow & (last_step | ~np.r_[slow[1:], False]))
+    elapsed = np.r_[0, np.cumsum(durations)]
+    long_runs = elapsed[run_ends + 1] - elapsed[run_starts] >= stop_duration
+    stops = np.bincount(step_groups[run_starts[long_runs]], minlength=count)
+
+    return [dict(team_id=int(team_ids[start]), segment=int(segments[start]), distance=float(distance[group]),
+                 moving_time=float(moving_time[group]), max_speed=float(max_speed[group]), stops=int(stops[group]))
+            for group, start in enumerate(starts)]
+
+
+def get_event_statistics(event):
+    """
+    Returns the distance and speed statistics of the teams of an event
+    :param event: Event object
+    :return: List of the statistics of each team with track points, ordered by team:
+        - team_id: ID of the team
+        - distance: Distance travelled (in km)
+        - moving_time: Time spent moving (in seconds)
+        - average_speed: Average speed while moving (in km/h)
+        - max_speed: Highest speed (in km/h)
+        - stops: Number of stops
+        - segments: Statistics of each segment (segment number and the same statistics)
+    """
+    if event.archived is not None:
+        # The archive does not change, its statistics are only computed once
+        key = 'event_statistics_%d' % event.pk
+        entry = cache.get(key)
+        if entry is not None and entry['archived'] == event.archived:
+            return entry['statistics']
+        statistics = _team_statistics(compute_statistics(*load_event_track_points(event),
+                                                         stop_speed=settings.ANALYTICS_STOP_SPEED,
+                                                         stop_duration=settings.ANALYTICS_STOP_DURATION))
+        cache.set(key, dict(archived=event.archived, statistics=statistics), settings.TRACKS_CACHE_TIMEOUT)
+        return statistics
+
+    team_locations = TeamLocation.objects.filter(team__event_id=event.pk, latitude__isnull=False)
+
+    # Size of each segment
+    sizes = team_locations.order_by().values('team_id', 'segment') \
+        .annotate(count=Count('id'), last_id=Max('id')).order_by('team_id', 'segment')
+    sizes = [(size['team_id'], size['segment'], (size['count'], size['last_id'])) for size in sizes]
+    keys = {(team_id, segment): _statistics_cache_key(team_id, segment) for team_id, segment, _ in sizes}
+    cached = cache.get_many(keys.values())
+
+    # Compute the statistics of the segments that are not cached or grew
+    segments = {}
+    outdated = Q()
+    for team_id, segment, size in sizes:
+        entry = cached.get(keys[(team_id, segment)])
+        if entry is not None and entry['size'] == size:
+            segments[(team_id, segment)] = entry['statistics']
+        else:
+            outdated |= Q(team_id=team_id, segment=segment)
+
+    if len(segments) < len(sizes):
+        # Only the points of the outdated segments are read
+        entries = {}
+        sizes_by_segment = {(team_id, segment): size for team_id, segment, size in sizes}
+        for statistics in compute_statistics(*load_track_points(team_locations.filter(outdated)),
+                                             stop_speed=settings.ANALYTICS_STOP_SPEED,
+                                             stop_duration=settings.ANALYTICS_STOP_DURATION):
+            segment = (statistics['team_id'], statistics['segment'])
+            segments[segment] = statistics
+            entries[keys[segment]] = dict(size=sizes_by_segment[segment], statistics=statistics)
+        cache.set_many(entries, settings.TRACKS_CACHE_TIMEOUT)
+
+    # A segment is missing if its points were deleted in the meantime
+    return _team_statistics([segments[(team_id, segment)] for team_id, segment, _ in sizes
+                             if (team_id, segment) in segments])
+
+
+# Sums up the statistics of the segments (ordered by team and segment, as returned by compute_statistics()) per team
+def _team_statistics(segments):
+    statistics = []
+    for segment in segments:
+        if not statistics or statistics[-1]['team_id'] != segment['team_id']:
+            statistics.append(dict(team_id=segment['team_id'], distance=0, moving_time=0, max_speed=0, stops=0,
+                                   segments=[]))
+        team = statistics[-1]
+        team['distance'] += segment['distance']
+        team['moving_time'] += segment['moving_time']
+        team['max_speed'] = max(team['max_speed'], segment['max_speed'])
+        team['stops'] += segment['stops']
+        team['segments'].append(dict(segment=segment['segment'], **_format_statistics(segment)))
+    return [dict(team_id=team['team_id'], segments=team['segments'], **_format_statistics(team))
+            for team in statistics]
+
+
+# Returns the cache key of the statistics of a segment
+def _statistics_cache_key(team_id, segment):
+    return 'statistics_%d_%d' % (team_id, segment)
+
+
+# Converts statistics to the units of the API (km, km/h, whole seconds), with the average speed
+def _format_statistics(statistics):
+    moving_time = statistics['moving_time']
+    return dict(distance=round(statistics['distance'] / 1000, 3), moving_time=int(round(moving_time)),
+                average_speed=round(statistics['distance'] / moving_time * 3.6, 1) if moving_time else 0,
+                max_speed=round(statistics['max_speed'] * 3.6, 1), stops=statistics['stops'])
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class WebappConfig(AppConfig):
     name = 'webapp'
+
+    def ready(self):
+        from webapp.signals import connect_signals
+        connect_signals()
@@ -0,0 +1,164 @@
+# Archive of the finished events
+#
+# Archiving an event (inactive and ended) writes the rows of its teams from the hot tables (track points, scores and
+# challenge submissions) to a gzipped NDJSON file in settings.EVENT_ARCHIVE_ROOT, one line per row:
+#   {"model": "teamlocation", "fields": {"id": ..., "team_id": ..., ...}}
+# The rows of each model are written together, the track points ordered by team, segment and time. The rows are then
+# deleted and the event flagged as archived, in the same transaction with the teams locked, so that no row is inserted
+# in between. The event itself, its teams, sub-destinations, challenges, scoreboard (TeamStanding) and scoreboard
+# history stay in the database: the standings of an archived event are frozen (see webapp.standings) and its map and
+# track statistics are read from the archive when needed.
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from webapp.models import Event, Score, Team, TeamChallenge, TeamLocation
+from webapp.standings import refresh_standings
+from webapp.tracks import simplify
+
+# Archived models, in the order of the archive, with the ordering of their rows
+ARCHIVED_MODELS = (
+    (TeamLocation, ('team_id', 'segment', 'datetime')),
+    (Score, ('team_id', 'id')),
+    (TeamChallenge, ('team_id', 'id')),
+)
+
+_lock = threading.Lock()
+# Simplified tracks read from the archives, by event ID then tolerance, least recently used event first
+_tracks = OrderedDict()
+
+
+def get_archive_path(event_id):
+    """
+    :param event_id: ID of the event
+    :return: Path of the archive of the event
+    """
+    return os.path.join(settings.EVENT_ARCHIVE_ROOT, 'event_%d.ndjson.gz' % int(event_id))
+
+
+def can_archive(event):
+    """
+    :param event: Event object
+    :return: Whether the event can be archived: inactive, ended and not archived yet
+    """
+    return not event.is_active and event.end_date < now() and event.archived is None
+
+
+def archive_event(event):
+    """
+    Writes the track points, scores and challenge submissions of an event to its archive, then deletes them
+    :param event: Event object, that can be archived (see @can_archive())
+    :return: Dictionary of the number of archived rows, by model name
+    """
+    path = get_archive_path(event.pk)
+    os.makedirs(settings.EVENT_ARCHIVE_ROOT, exist_ok=True)
+    counts = {}
+    with transaction.atomic():
+        # Lock the teams: the rows referencing them cannot be inserted (the foreign key check waits for the lock) until
+        # the rows are archived and deleted, and those inserted by pending transactions are committed first
+        team_ids = list(Team.objects.select_for_update().filter(event_id=event.pk).values_list('pk', flat=True))
+
+        # The scoreboard is kept, make sure it includes every score
+        refresh_standings(event.pk)
+
+        # Write the archive to a temporary file first, so that a failure never leaves a partial archive
+        try:
+            with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as archive:
+                for model, ordering in ARCHIVED_MODELS:
+                    name = model._meta.model_name
+                    counts[name] = 0
+                    rows = model.objects.filter(team_id__in=team_ids).order_by(*ordering).values() \
+                        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+                    for row in rows:
+                        archive.write(json.dumps(dict(model=name, fields=row), cls=DjangoJSONEncoder) + '\n')
+                        counts[name] += 1
+
+            # Deleted with one query each: QuerySet.delete() would load every row and send the signals marking the
+            # (frozen) standings stale row by row
+            with connection.cursor() as cursor:
+                for model, _ in ARCHIVED_MODELS:
+                    cursor.execute('DELETE FROM %s WHERE team_id = ANY(%%s)' % model._meta.db_table, [team_ids])
+            Event.objects.filter(pk=event.pk).update(archived=now())
+            os.replace(path + '.tmp', path)
+        except Exception:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+            raise
+
+    return counts
+
+
+def read_archive(event_id, model):
+    """
+    Reads the archived rows of a model, without loading the whole archive in memory
+    :param event_id: ID of the archived event
+    :param model: Archived model class
+    :return: Iterator of the rows (dictionaries of the field values, as returned by QuerySet.values())
+    """
+    name = model._meta.model_name
+    found = False
+    with gzip.open(get_archive_path(event_id), 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            record = json.loads(line)
+            if record['model'] == name:
+                found = True
+                yield {field: model._meta.get_field(field).to_python(value)
+                       for field, value in record['fields'].items()}
+            elif found:
+                # The rows of a model are written together
+                break
+
+
+def get_archived_tracks(event_id, tolerance=None):
+    """
+    Returns the simplified segments of the archived track points of an event, as @webapp.tracks.get_tracks()
+    :param event_id: ID of the archived event
+    :param tolerance: Tolerance of the simplification (in metres), settings.TRACK_SIMPLIFY_TOLERANCE by default
+    :return: List of tuples (team_id, segment, points) ordered by team and segment, with @points the list of the kept
+    track points as tuples (latitude, longitude, id, datetime) in chronological order
+    """
+    if tolerance is None:
+        tolerance = settings.TRACK_SIMPLIFY_TOLERANCE
+
+    # The archive does not change, the tracks are only read from it once by each process. They are kept in memory
+    # rather than in the Django cache: the tracks of a large event are more than a memcached item can hold
+    event_id = int(event_id)
+    with _lock:
+        tracks = _tracks.get(event_id, {}).get(tolerance)
+        if tracks is not None:
+            _tracks.move_to_end(event_id)
+    if tracks is None:
+        segments = []
+        for row in read_archive(event_id, TeamLocation):
+            if row['latitude'] is None:
+                continue
+            if not segments or segments[-1][:2] != (row['team_id'], row['segment']):
+                segments.append((row['team_id'], row['segment'], []))
+            segments[-1][2].append((row['latitude'], row['longitude'], row['id'], row['datetime']))
+        tracks = [(team_id, segment, simplify(points, tolerance)) for team_id, segment, points in segments]
+        with _lock:
+            _tracks.setdefault(event_id, {})[tolerance] = tracks
+            _tracks.move_to_end(event_id)
+            while len(_tracks) > settings.EVENT_MEMORY_CACHE_SIZE:
+                _tracks.popitem(last=False)
+    return tracks
+
+
+def delete_archive(event_id):
+    """
+    Deletes the archive of an event, if any
+    :param event_id: ID of the event
+    """
+    path = get_archive_path(event_id)
+    if os.path.exists(path):
+        os.remove(path)
+    with _lock:
+        _tracks.pop(int(event_id), None)
@@ -0,0 +1,179 @@
+# Push channel for scoreboard changes
+#
+# refresh_standings() publishes a message for each rebuild that changed the standings of an event, the streaming
+# endpoints forward them to their clients as server-sent events.
+# The broker class is configured with settings.SCOREBOARD_BROKER. InProcessBroker only reaches the clients connected
+# to the same process: with several workers, each stream also checks the standings version of its event every
+# settings.SCOREBOARD_STREAM_KEEPALIVE seconds and sends the changes published by the other processes. A broker
+# implementing the same interface on top of a shared pub/sub service delivers them without this delay.
+# A stream holds its worker until it ends: the application must be served by asynchronous workers (e.g. gunicorn
+# --worker-class gevent) so that the streams do not use up the workers serving the other requests. The number of
+# streams open at the same time by a client (user, or IP address for the public stream) is limited to
+# settings.SCOREBOARD_STREAM_MAX_PER_CLIENT, counted in the cache shared by the processes.
+
+import json
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+
+class InProcessBroker:
+    """
+    Broker delivering the messages of an event to the subscribers of the same process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, event_id):
+        """
+        :param event_id: ID of the event
+        :return: Queue receiving the messages published for @event_id
+        """
+        subscription = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(event_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, event_id, subscription):
+        """
+        :param event_id: ID of the event
+        :param subscription: Queue returned by @subscribe()
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(event_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(event_id, None)
+
+    def publish(self, event_id, message):
+        """
+        :param event_id: ID of the event
+        :param message: JSON serializable message
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(event_id, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    :return: The broker configured by settings.SCOREBOARD_BROKER (one instance per process)
+    """
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.SCOREBOARD_BROKER)()
+    return _broker
+
+
+def get_stream_client(request):
+    """
+    :param request: Request opening a stream
+    :return: Identifier of the client, used to limit its streams: the ID of the authenticated user, or the IP address
+    (the last one added to X-Forwarded-For by the proxy in front of the application)
+    """
+    if request.user.is_authenticated:
+        return 'user_%d' % request.user.pk
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for:
+        return 'ip_%s' % forwarded_for.split(',')[-1].strip()
+    return 'ip_%s' % request.META.get('REMOTE_ADDR')
+
+
+def open_stream(client):
+    """
+    Counts a stream opened by a client, unless it reached settings.SCOREBOARD_STREAM_MAX_PER_CLIENT streams
+    :param client: Identifier of the client (see @get_stream_client())
+    :return: Whether the stream can be opened, it must then be closed with @close_stream()
+    """
+    # The counter expires if the streams were not closed (process killed)
+    key = _stream_cache_key(client)
+    cache.add(key, 0, settings.SCOREBOARD_STREAM_TIMEOUT * 2)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Expired in the meantime
+        cache.set(key, 1, settings.SCOREBOARD_STREAM_TIMEOUT * 2)
+        count = 1
+    if count > settings.SCOREBOARD_STREAM_MAX_PER_CLIENT:
+        close_stream(client)
+        return False
+    return True
+
+
+def close_stream(client):
+    """
+    Counts a stream of a client as closed
+    :param client: Identifier of the client (see @get_stream_client())
+    """
+    try:
+        cache.decr(_stream_cache_key(client))
+    except ValueError:
+        # Expired
+        pass
+
+
+def event_stream(event_id, client=None):
+    """
+    Generator of the server-sent events of an event's scoreboard.
+    Every settings.SCOREBOARD_STREAM_KEEPALIVE seconds without a message, the standings version of the event is
+    checked: the changes made by the other processes are sent, otherwise a comment keeps the connection open. The stream
+    ends after settings.SCOREBOARD_STREAM_TIMEOUT seconds so that clients reconnect instead of holding a worker forever.
+    :param event_id: ID of the event
+    :param client: Identifier of the client, whose stream is closed (see @close_stream()) when the stream ends
+    """
+    # webapp.standings publishes through this module
+    from webapp.models import Event
+    from webapp.standings import get_published_version, get_standings_delta
+
+    broker = get_broker()
+    subscription = broker.subscribe(event_id)
+    try:
+        # Version of the standings the client is up to date with, read once subscribed so that no rebuild is missed
+        version = get_published_version(event_id)
+
+        # Ask the clients to reconnect after 1 second when the stream ends
+        yield 'retry: 1000\n\n'
+
+        deadline = time.monotonic() + settings.SCOREBOARD_STREAM_TIMEOUT
+        while time.monotonic() < deadline:
+            timeout = min(settings.SCOREBOARD_STREAM_KEEPALIVE, deadline - time.monotonic())
+            try:
+                message = subscription.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                # Check for the rebuilds of the other processes
+                event = Event.objects.filter(pk=event_id).first()
+                if event is None or event.standings_version <= version:
+                    yield ': keepalive\n\n'
+                    continue
+                message = get_standings_delta(event, version)
+            else:
+                if message['version'] <= version:
+                    continue
+                # The message only holds the changes since the previous rebuild, which the client missed
+                if message['previous_version'] is not None and message['previous_version'] > version:
+                    message = get_standings_delta(Event.objects.get(pk=event_id), version)
+
+            version = message['version']
+            data = json.dumps(dict(version=version, team_ids=message['team_ids'], teams=message['teams']),
+                              cls=DjangoJSONEncoder)
+            yield 'id: %d\nevent: scoreboard\ndata: %s\n\n' % (version, data)
+    finally:
+        broker.unsubscribe(event_id, subscription)
+        if client is not None:
+            close_stream(client)
+
+
+# Returns the cache key of the number of streams of a client
+def _stream_cache_key(client):
+    return 'scoreboard_streams_%s' % client
@@ -0,0 +1,100 @@
+# Streaming export of the team tracks as GPX or GeoJSON
+#
+# The track points are read with a server-side cursor (QuerySet.iterator()) and written as they are read, in chunks of
+# settings.EXPORT_CHUNK_SIZE points, so that the memory used does not depend on the size of the event.
+# In GPX, each team is a track (trk) and each of its segments a track segment (trkseg). In GeoJSON, each track point is
+# a Point feature with its team, segment and time as properties.
+
+import json
+
+from django.conf import settings
+
+# Content types and file extensions of the export formats
+EXPORT_FORMATS = {
+    'gpx': ('application/gpx+xml', 'gpx'),
+    'geojson': ('application/geo+json', 'geojson'),
+}
+
+
+def get_track_points(team_locations):
+    """
+    Iterates over the track points of @team_locations without loading them in memory
+    :param team_locations: TeamLocation queryset, e.g. filtered by team or by event
+    :return: Iterator of tuples (team_id, segment, latitude, longitude, datetime), ordered by team, segment and datetime
+    """
+    # Track points not copied yet by the inline_team_locations command have no coordinates
+    return team_locations.filter(latitude__isnull=False).order_by('team_id', 'segment', 'datetime') \
+        .values_list('team_id', 'segment', 'latitude', 'longitude', 'datetime') \
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def export_gpx(team_locations):
+    """
+    Writes the tracks of @team_locations as a GPX 1.1 document
+    :param team_locations: TeamLocation queryset
+    :return: Iterator of strings (parts of the document)
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n' \
+          '<gpx version="1.1" creator="GELIFT" xmlns="http://www.topografix.com/GPX/1/1">\n'
+
+    def points():
+        current_team = current_segment = None
+        for team_id, segment, latitude, longitude, datetime in get_track_points(team_locations):
+            # Close the previous track segment and track, and open the new ones
+            if team_id != current_team:
+                if current_team is not None:
+                    yield '</trkseg></trk>\n'
+                yield '<trk><name>Team %d</name><trkseg>\n' % team_id
+                current_team, current_segment = team_id, segment
+            elif segment != current_segment:
+                yield '</trkseg><trkseg>\n'
+                current_segment = segment
+            yield '<trkpt lat="%r" lon="%r"><time>%s</time></trkpt>\n' % (latitude, longitude, datetime.isoformat())
+        if current_team is not None:
+            yield '</trkseg></trk>\n'
+
+    yield from _chunks(points())
+    yield '</gpx>\n'
+
+
+def export_geojson(team_locations):
+    """
+    Writes the track points of @team_locations as a GeoJSON feature collection
+    :param team_locations: TeamLocation queryset
+    :return: Iterator of strings (parts of the document)
+    """
+    yield '{"type": "FeatureCollection", "features": [\n'
+
+    def points():
+        separator = ''
+        for team_id, segment, latitude, longitude, datetime in get_track_points(team_locations):
+            feature = dict(type='Feature', geometry=dict(type='Point', coordinates=[longitude, latitude]),
+                           properties=dict(team_id=team_id, segment=segment, time=datetime.isoformat()))
+            yield separator + json.dumps(feature)
+            separator = ',\n'
+
+    yield from _chunks(points())
+    yield '\n]}\n'
+
+
+def export_tracks(team_locations, export_format):
+    """
+    :param team_locations: TeamLocation queryset
+    :param export_format: Key of EXPORT_FORMATS
+    :return: Iterator of the parts of the document
+    """
+    if export_format == 'geojson':
+        return export_geojson(team_locations)
+    return export_gpx(team_locations)
+
+
+# Groups the parts of a document by EXPORT_CHUNK_SIZE, to write them in fewer (and larger) chunks
+def _chunks(parts):
+    chunk = []
+    for part in parts:
+        chunk.append(part)
+        if len(chunk) >= settings.EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
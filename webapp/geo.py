@@ -0,0 +1,106 @@
+# Geofences of the destinations of an event
+#
+# Each destination of an event (its sub-destinations in order, then its end location) is surrounded by a circular
+# geofence of settings.GEOFENCE_RADIUS metres. The geofences are built from the sub-destinations in the database, cached
+# for settings.GEOFENCES_CACHE_TIMEOUT seconds and dropped when the event, its sub-destinations or their locations
+# change (see webapp.signals). With a cache shared by the processes every process sees the change at once, otherwise
+# the other processes use the previous geofences until they expire. Checking a location against them is done in
+# memory: a database query is only needed when the location is inside one of them.
+
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+from webapp.geohash import EARTH_RADIUS, distance
+from webapp.models import Location, TeamLocation
+from webapp.scoring import get_segments
+
+
+def get_geofences(event):
+    """
+    Returns the geofences of the destinations of an event, in the order the teams reach them
+    :param event: Event object
+    :return: List of geofences
+        - location_id: ID of the location of the destination
+        - latitude: Latitude of the destination
+        - longitude: Longitude of the destination
+        - min_latitude, max_latitude, min_longitude, max_longitude: Bounding box of the geofence
+    """
+    key = _geofences_cache_key(event.pk)
+    geofences = cache.get(key)
+    if geofences is None:
+        geofences = _build_geofences(event)
+        cache.set(key, geofences, settings.GEOFENCES_CACHE_TIMEOUT)
+    return geofences
+
+
+def invalidate_geofences(event_id):
+    """
+    Drops the cached geofences of an event
+    :param event_id: ID of the event
+    """
+    cache.delete(_geofences_cache_key(event_id))
+
+
+def find_geofences(geofences, latitude, longitude):
+    """
+    :param geofences: Geofences as returned by @get_geofences()
+    :return: The geofences containing the point (@latitude, @longitude)
+    """
+    return [geofence for geofence in geofences
+            if geofence['min_latitude'] <= latitude <= geofence['max_latitude'] and
+            geofence['min_longitude'] <= longitude <= geofence['max_longitude'] and
+            distance(latitude, longitude, geofence['latitude'], geofence['longitude']) <= settings.GEOFENCE_RADIUS]
+
+
+def find_arrival(team, event, latitude, longitude):
+    """
+    Checks whether a team arrived at the next destination it has to reach
+    :param team: Team object
+    :param event: Event of the team
+    :param latitude: Latitude of the team
+    :param longitude: Longitude of the team
+    :return: ID of the location of the destination, None if the team is not inside its geofence
+    """
+    geofences = get_geofences(event)
+    inside = find_geofences(geofences, latitude, longitude)
+    if not inside:
+        return None
+
+    # The next destination is the first one the team did not stop at yet. The stops are used rather than the scores, as
+    # a stop does not always leave a score (no travel time to score)
+    reached = set(TeamLocation.objects.filter(team_id=team.pk, location_id__isnull=False)
+                  .values_list('location_id', flat=True))
+    next_geofence = next((geofence for geofence in geofences if geofence['location_id'] not in reached), None)
+    if next_geofence in inside:
+        return next_geofence['location_id']
+    return None
+
+
+# Cache key of the geofences of an event
+def _geofences_cache_key(event_id):
+    return 'event_geofences_%d' % int(event_id)
+
+
+# Constructs the geofences of an event from its segments, read from the database (the cached segments could be those
+# from before a change made in another process)
+def _build_geofences(event):
+    location_ids = [segment['end_id'] for segment in get_segments(event, cached=False)]
+    locations = Location.objects.in_bulk(location_ids)
+
+    # Bounding box of the radius, to skip the distance computation for most points
+    latitude_margin = math.degrees(settings.GEOFENCE_RADIUS / EARTH_RADIUS)
+
+    geofences = []
+    for location_id in location_ids:
+        location = locations.get(location_id)
+        if location is None:
+            continue
+        longitude_margin = latitude_margin / max(math.cos(math.radians(location.latitude)), 1e-6)
+        geofences.append(dict(location_id=location_id, latitude=location.latitude, longitude=location.longitude,
+                              min_latitude=location.latitude - latitude_margin,
+                              max_latitude=location.latitude + latitude_margin,
+                              min_longitude=location.longitude - longitude_margin,
+                              max_longitude=location.longitude + longitude_margin))
+    return geofences
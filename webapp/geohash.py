@@ -0,0 +1,159 @@
+# Geohash grid index of the locations and track points
+#
+# Location and TeamLocation store the geohash of their coordinates in an indexed column (GeohashField), filled on
+# save and on bulk insert. A geohash identifies a cell of a grid over the Earth, longer geohashes being smaller cells
+# nested in the shorter ones: the points of a cell share its geohash as prefix. A bounding box is covered by a few
+# cells, so that the points inside it are found with indexed prefix lookups instead of scanning every row.
+
+import math
+
+from django.db import models
+from django.db.models import Case, Q, Value, When
+
+# Mean radius of the Earth, in metres
+EARTH_RADIUS = 6371000
+
+# Length of the stored geohashes (cells of about 5 x 5 m)
+GEOHASH_PRECISION = 9
+
+# Maximum number of cells covering a bounding box
+MAX_COVER_CELLS = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def distance(latitude_1, longitude_1, latitude_2, longitude_2):
+    """
+    :return: Great-circle distance (in metres) between two points, with the haversine formula
+    """
+    phi_1, phi_2 = math.radians(latitude_1), math.radians(latitude_2)
+    delta_phi = phi_2 - phi_1
+    delta_lambda = math.radians(longitude_2 - longitude_1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi_1) * math.cos(phi_2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    :return: Geohash of @precision characters of the point (@latitude, @longitude)
+    """
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = []
+    character = 0
+    bit = 0
+    even = True
+    while len(geohash) < precision:
+        # Bits alternate between the longitude and the latitude, starting with the longitude
+        value, value_range = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            character = character * 2 + 1
+            value_range[0] = middle
+        else:
+            character = character * 2
+            value_range[1] = middle
+        even = not even
+
+        bit += 1
+        if bit == 5:
+            geohash.append(_BASE32[character])
+            character = 0
+            bit = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """
+    :return: Tuple (height, width) of the cells of @precision characters, in degrees
+    """
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def cover(min_latitude, min_longitude, max_latitude, max_longitude):
+    """
+    Returns the geohashes of the cells covering a bounding box: the smallest cells for which at most MAX_COVER_CELLS
+    are needed
+    :return: List of geohashes (prefixes of the geohashes of the points inside the bounding box)
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        first_row = math.floor((min_latitude + 90) / height)
+        last_row = math.floor((min(max_latitude, 90 - height / 2) + 90) / height)
+        first_column = math.floor((min_longitude + 180) / width)
+        last_column = math.floor((min(max_longitude, 180 - width / 2) + 180) / width)
+        if (last_row - first_row + 1) * (last_column - first_column + 1) <= MAX_COVER_CELLS:
+            return sorted({encode(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+                           for row in range(first_row, last_row + 1)
+                           for column in range(first_column, last_column + 1)})
+    return ['']
+
+
+def filter_bounding_box(queryset, min_latitude, min_longitude, max_latitude, max_longitude):
+    """
+    Filters the points inside a bounding box
+    :param queryset: Location or TeamLocation queryset
+    :return: @queryset filtered
+    """
+    cells = Q()
+    for geohash in cover(min_latitude, min_longitude, max_latitude, max_longitude):
+        cells |= Q(geohash__startswith=geohash)
+    return queryset.filter(cells, latitude__range=(min_latitude, max_latitude),
+                           longitude__range=(min_longitude, max_longitude))
+
+
+def within_radius(queryset, latitude, longitude, radius):
+    """
+    Returns the points within a distance of (@latitude, @longitude)
+    :param queryset: Location or TeamLocation queryset
+    :param radius: Distance in metres
+    :return: List of tuples (distance, point), nearest first
+    """
+    latitude_margin = math.degrees(radius / EARTH_RADIUS)
+    longitude_margin = latitude_margin / max(math.cos(math.radians(min(abs(latitude) + latitude_margin, 90))), 1e-6)
+    points = filter_bounding_box(queryset, latitude - latitude_margin, longitude - longitude_margin,
+                                 latitude + latitude_margin, longitude + longitude_margin)
+
+    nearby = [(distance(latitude, longitude, point.latitude, point.longitude), point) for point in points]
+    return sorted([(point_distance, point) for point_distance, point in nearby if point_distance <= radius],
+                  key=lambda item: (item[0], item[1].pk))
+
+
+def index_geohashes(queryset, batch_size=1000):
+    """
+    Fills the geohash of the points stored without it (before the index was added, or updated with a query)
+    :param queryset: Location or TeamLocation queryset
+    :param batch_size: Number of points updated per query
+    :return: Number of points updated
+    """
+    points = list(queryset.filter(geohash__isnull=True, latitude__isnull=False, longitude__isnull=False)
+                  .values_list('pk', 'latitude', 'longitude'))
+    for start in range(0, len(points), batch_size):
+        batch = points[start:start + batch_size]
+        queryset.model.objects.filter(pk__in=[pk for pk, _, _ in batch]).update(
+            geohash=Case(*[When(pk=pk, then=Value(encode(latitude, longitude))) for pk, latitude, longitude in batch],
+                         output_field=models.CharField()))
+    return len(points)
+
+
+class GeohashField(models.CharField):
+    """
+    Indexed geohash of the latitude and longitude fields of the model, computed on save and on bulk insert.
+    Null when the coordinates are null.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', GEOHASH_PRECISION)
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('db_index', True)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        if model_instance.latitude is None or model_instance.longitude is None:
+            value = None
+        else:
+            value = encode(model_instance.latitude, model_instance.longitude)
+        setattr(model_instance, self.attname, value)
+        return value
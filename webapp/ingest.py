@@ -0,0 +1,326 @@
+# Write-behind buffer for the location pings
+#
+# With settings.LOCATION_INGEST_MODE = 'buffered', LocationView validates a ping, appends it to the buffer of the
+# process and answers immediately. A background thread stores the buffered pings with one bulk insert every
+# settings.LOCATION_BUFFER_FLUSH_INTERVAL milliseconds, or as soon as settings.LOCATION_BUFFER_FLUSH_SIZE pings are
+# waiting.
+# The buffer is flushed when the process exits. The pings that cannot be stored (database unavailable) are written to
+# a spill file if settings.LOCATION_BUFFER_SPILL_FILE is set, one file per process (the setting suffixed with the
+# process ID), and stored with the next flush. Before being read, a spill file is renamed to a name private to the
+# flush, so that it is never read twice nor removed while being written. The spill files left by the processes that
+# exited are stored by the next flush of any process, e.g. after a restart. Without a spill file the pings stay in
+# memory until the next flush and are lost if the process is killed.
+# Pings only affect the routes and maps, the start and stop of the timers (and so the scores) are always written
+# synchronously.
+#
+# Before being stored, the pings go through the ping filter of the process, which drops the redundant ones: the pings
+# sent less than settings.LOCATION_MIN_INTERVAL seconds after the last accepted point of the team (e.g. the same
+# position sent by the phones of several members), and the pings closer than settings.LOCATION_MIN_DISTANCE metres to
+# it, unless settings.LOCATION_MAX_INTERVAL seconds passed (so that a stopped car still gets a point now and then).
+# The last accepted point of each team is kept in memory, the filter needs no query. Each process has its own filter:
+# with several workers, the pings of a team are only filtered against those handled by the same worker.
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from webapp.geohash import distance
+from webapp.models import TeamLocation
+
+logger = logging.getLogger(__name__)
+
+
+class LocationBuffer:
+    """
+    Buffer of the track points waiting to be stored, flushed by a background thread
+    """
+
+    def __init__(self, flush_interval, flush_size, spill_file=None):
+        """
+        :param flush_interval: Maximum time (in milliseconds) a track point waits in the buffer
+        :param flush_size: Number of waiting track points triggering a flush
+        :param spill_file: Path of the files receiving the track points that could not be stored, suffixed with the
+        process ID, or None
+        """
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.spill_base = spill_file
+        self.spill_file = '%s.%d' % (spill_file, os.getpid()) if spill_file else None
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pending = []
+        self._claims = 0
+
+        # Counters
+        self._flushed = 0
+        self._flushes = 0
+        self._spilled = 0
+        self._last_flush_ms = 0
+        self._max_flush_ms = 0
+
+    def append(self, team_location):
+        """
+        Adds a track point to the buffer
+        :param team_location: Unsaved TeamLocation object
+        """
+        with self._lock:
+            self._pending.append(team_location)
+            depth = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='location-buffer', daemon=True)
+                self._thread.start()
+        if depth >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Stores the buffered and spilled track points with one bulk insert. On a database error, the track points are
+        spilled, or kept in the buffer if there is no spill file.
+        :return: Number of track points stored
+        """
+        with self._flush_lock:
+            with self._lock:
+                team_locations, self._pending = self._pending, []
+            claimed = self._claim_spill_files()
+            spilled = self._read_spill_files(claimed)
+            team_locations = spilled + team_locations
+            if not team_locations:
+                self._remove(claimed)
+                return 0
+
+            start = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    TeamLocation.objects.bulk_create(team_locations)
+            except DatabaseError:
+                logger.exception("Could not store %d track points", len(team_locations))
+                # The claimed track points go back to the spill file of this process, followed by those of the buffer
+                self._write_spill_file(spilled)
+                self._remove(claimed)
+                self._keep(team_locations[len(spilled):])
+                return 0
+            self._remove(claimed)
+            duration = (time.perf_counter() - start) * 1000
+
+            with self._lock:
+                self._flushed += len(team_locations)
+                self._flushes += 1
+                self._last_flush_ms = round(duration, 3)
+                self._max_flush_ms = max(self._max_flush_ms, self._last_flush_ms)
+            return len(team_locations)
+
+    def spill(self):
+        """
+        Writes the buffered track points to the spill file instead of the database
+        :return: Number of track points spilled
+        """
+        with self._flush_lock:
+            with self._lock:
+                team_locations, self._pending = self._pending, []
+            self._keep(team_locations)
+            return len(team_locations)
+
+    def close(self):
+        """
+        Flushes the buffer before the process exits, the track points that cannot be stored are spilled
+        """
+        self.flush()
+        if self.spill_file:
+            self.spill()
+
+    def stats(self):
+        """
+        :return: Counters of the buffer:
+            - depth: Number of track points waiting in the buffer
+            - flushed: Number of track points stored
+            - flushes: Number of bulk inserts
+            - spilled: Number of track points written to the spill file
+            - last_flush_ms: Duration of the last bulk insert (in milliseconds)
+            - max_flush_ms: Duration of the longest bulk insert (in milliseconds)
+        """
+        with self._lock:
+            return dict(depth=len(self._pending), flushed=self._flushed, flushes=self._flushes,
+                        spilled=self._spilled, last_flush_ms=self._last_flush_ms, max_flush_ms=self._max_flush_ms)
+
+    # Spills @team_locations, or puts them back in the buffer if there is no spill file
+    def _keep(self, team_locations):
+        if not team_locations:
+            return
+        if not self.spill_file:
+            with self._lock:
+                self._pending = team_locations + self._pending
+            return
+
+        self._write_spill_file(team_locations)
+        with self._lock:
+            self._spilled += len(team_locations)
+
+    # Appends @team_locations to the spill file of this process
+    def _write_spill_file(self, team_locations):
+        if not team_locations:
+            return
+        with open(self.spill_file, 'a') as file:
+            for team_location in team_locations:
+                file.write(json.dumps(dict(team_id=team_location.team_id, latitude=team_location.latitude,
+                                           longitude=team_location.longitude, segment=team_location.segment,
+                                           datetime=team_location.datetime.isoformat())) + '\n')
+
+    # Renames the spill files of this process and of the processes that exited to names private to this flush, so that
+    # no other flush reads them and no track point is appended to them while they are read. Returns the new paths
+    def _claim_spill_files(self):
+        if not self.spill_file:
+            return []
+        claimed = []
+        for path in sorted(glob.glob(glob.escape(self.spill_base) + '.*')):
+            # Spill files (<base>.<pid>) and files claimed by a flush that did not complete (<base>.flushing.<pid>.<n>)
+            parts = path[len(self.spill_base) + 1:].split('.')
+            if parts[0] == 'flushing' and len(parts) == 3:
+                pid = parts[1]
+            elif len(parts) == 1:
+                pid = parts[0]
+            else:
+                continue
+            if not pid.isdigit() or (int(pid) != os.getpid() and _is_running(int(pid))):
+                continue
+
+            self._claims += 1
+            private_path = '%s.flushing.%d.%d' % (self.spill_base, os.getpid(), self._claims)
+            try:
+                os.replace(path, private_path)
+            except FileNotFoundError:
+                # Claimed by another process
+                continue
+            claimed.append(private_path)
+        return claimed
+
+    # Returns the track points of the claimed spill files
+    def _read_spill_files(self, paths):
+        rows = []
+        for path in paths:
+            with open(path) as file:
+                rows += [json.loads(line) for line in file if line.strip()]
+        for row in rows:
+            row['datetime'] = parse_datetime(row['datetime'])
+        return [TeamLocation(**row) for row in rows]
+
+    # Removes the claimed spill files
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            os.remove(path)
+
+    # Flushes the buffer periodically, or when it is full
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval / 1000)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Location buffer flush failed")
+
+
+class PingFilter:
+    """
+    Filter of the redundant pings, keeping the last accepted point of each team
+    """
+
+    def __init__(self, min_interval, min_distance, max_interval):
+        """
+        :param min_interval: Minimum time (in seconds) between two points of a team, 0 to disable
+        :param min_distance: Minimum distance (in metres) between two points of a team, 0 to disable
+        :param max_interval: Time (in seconds) after which a point is accepted whatever its distance
+        """
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        self._last_points = {}
+        self._accepted = 0
+        self._dropped = 0
+
+    def accept(self, team_location):
+        """
+        Checks whether a ping is to be stored, and remembers it as the last point of its team if it is
+        :param team_location: TeamLocation object (not stored yet)
+        :return: False if the ping is redundant
+        """
+        with self._lock:
+            last_point = self._last_points.get(team_location.team_id)
+            # The first point of a segment is always accepted
+            if last_point is not None and last_point.segment == team_location.segment:
+                elapsed = (team_location.datetime - last_point.datetime).total_seconds()
+                if elapsed < self.min_interval or (
+                        elapsed < self.max_interval and
+                        distance(last_point.latitude, last_point.longitude, team_location.latitude,
+                                 team_location.longitude) < self.min_distance):
+                    self._dropped += 1
+                    return False
+
+            self._last_points[team_location.team_id] = team_location
+            self._accepted += 1
+            return True
+
+    def stats(self):
+        """
+        :return: Counters of the filter
+            - accepted: Number of pings accepted
+            - dropped: Number of redundant pings dropped
+        """
+        with self._lock:
+            return dict(accepted=self._accepted, dropped=self._dropped)
+
+
+# Returns whether a process is running
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, as another user
+        return True
+    return True
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_filter = None
+
+
+def get_location_buffer():
+    """
+    :return: The location buffer of the process, configured by the LOCATION_BUFFER_* settings
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = LocationBuffer(settings.LOCATION_BUFFER_FLUSH_INTERVAL, settings.LOCATION_BUFFER_FLUSH_SIZE,
+                                     settings.LOCATION_BUFFER_SPILL_FILE)
+            atexit.register(_buffer.close)
+    return _buffer
+
+
+def get_ping_filter():
+    """
+    :return: The ping filter of the process, configured by the LOCATION_MIN_INTERVAL, LOCATION_MIN_DISTANCE and
+    LOCATION_MAX_INTERVAL settings
+    """
+    global _filter
+    with _buffer_lock:
+        if _filter is None:
+            _filter = PingFilter(settings.LOCATION_MIN_INTERVAL, settings.LOCATION_MIN_DISTANCE,
+                                 settings.LOCATION_MAX_INTERVAL)
+    return _filter
@@ -0,0 +1,37 @@
+# Archive of the finished events (see webapp.archive)
+#
+# Moves the track points, scores and challenge submissions of the given events, or of every inactive event that ended
+# and is not archived yet, to their archive files.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.archive import archive_event, can_archive, get_archive_path
+from webapp.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Moves the track points, scores and challenge submissions of finished events to archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int,
+                            help='IDs of the events to archive (every finished event by default)')
+
+    def handle(self, *args, **options):
+        if options['event_ids']:
+            events = list(Event.objects.filter(pk__in=options['event_ids']))
+            missing = set(options['event_ids']) - {event.pk for event in events}
+            if missing:
+                raise CommandError('No event with ID %s' % ', '.join(str(event_id) for event_id in sorted(missing)))
+            for event in events:
+                if not can_archive(event):
+                    raise CommandError('Event %d is active, not ended or already archived' % event.pk)
+        else:
+            events = [event for event in Event.objects.filter(is_active=False, archived__isnull=True)
+                      if can_archive(event)]
+
+        for event in events:
+            counts = archive_event(event)
+            self.stdout.write('Event %d archived to %s: %d track points, %d scores and %d challenge submissions' % (
+                event.pk, get_archive_path(event.pk), counts['teamlocation'], counts['score'], counts['teamchallenge']))
+        if not events:
+            self.stdout.write('No event to archive')
@@ -0,0 +1,18 @@
+# Fills the geohash index of the locations and track points stored before it was added (see webapp.geohash)
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from webapp.geohash import index_geohashes
+from webapp.models import Location, TeamLocation
+
+
+class Command(BaseCommand):
+    help = 'Fills the geohash of the locations and track points stored without it'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            locations = index_geohashes(Location.objects.all())
+            track_points = index_geohashes(TeamLocation.objects.all())
+
+        self.stdout.write('%d locations and %d track points indexed' % (locations, track_points))
@@ -0,0 +1,41 @@
+# Data migration of the track points stored before their coordinates were inlined in TeamLocation
+#
+# Each track point used to be stored as a Location row referenced by its TeamLocation. This command copies the
+# coordinates into the TeamLocation rows, then unlinks and deletes the Location rows that are not a named place (start,
+# end or sub-destination of an event, challenge location or end of a score). It can be run several times.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from webapp.geohash import index_geohashes
+from webapp.models import Event, Location, Score, SubLocation, TeamChallenge, TeamLocation
+
+
+class Command(BaseCommand):
+    help = 'Copies the coordinates of the track points into TeamLocation and deletes their Location rows'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Copy the coordinates of the locations into the track points
+            location = Location.objects.filter(pk=OuterRef('location_id'))
+            updated = TeamLocation.objects.filter(latitude__isnull=True, location__isnull=False).update(
+                latitude=Subquery(location.values('latitude')[:1]),
+                longitude=Subquery(location.values('longitude')[:1]))
+            index_geohashes(TeamLocation.objects.all())
+
+            # Track points whose location is not a named place
+            track_points = TeamLocation.objects.filter(location__isnull=False) \
+                .exclude(location_id__in=Event.objects.values('start_location_id')) \
+                .exclude(location_id__in=Event.objects.values('end_location_id')) \
+                .exclude(location_id__in=SubLocation.objects.values('location_id')) \
+                .exclude(location_id__in=TeamChallenge.objects.values('location_id')) \
+                .exclude(location_id__in=Score.objects.values('start_location_id')) \
+                .exclude(location_id__in=Score.objects.values('end_location_id'))
+            location_ids = list(track_points.values_list('location_id', flat=True).distinct())
+
+            # Unlink and delete these locations
+            track_points.update(location=None)
+            deleted = Location.objects.filter(pk__in=location_ids).delete()[0]
+
+        self.stdout.write('%d track points updated, %d locations deleted' % (updated, deleted))
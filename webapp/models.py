@@ -1,9 +1,14 @@
+from datetime import timedelta
+
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import AbstractUser, PermissionsMixin
+from django.contrib.postgres.fields import JSONField
 from django.core.validators import RegexValidator
 from django.db import models
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 
+from .geohash import GeohashField
 from .managers import UserManager as webappUsermanager
 
 
@@ -65,14 +70,17 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 class Location(models.Model):
     """
-    Model defining a location
+    Model defining a named place (start/end location or sub-destination of an event, challenge location), the track
+    points of the teams are stored in TeamLocation
     Fields:
         - id: PK autogenerated
         - latitude: Latitude of the location
         - longitude: Longitude of the location
+        - geohash: Geohash of the location, indexed (see webapp.geohash)
     """
     latitude = models.FloatField()
     longitude = models.FloatField()
+    geohash = GeohashField()
 
 
 class Event(models.Model):
@@ -90,6 +98,11 @@ class Event(models.Model):
         - emergency_contact: Phone number to call in case of emergency
         - winner_photo: Link to a photo of the event's winner
         - is_active: Boolean defining if the event is active
+        - standings_stale: Boolean indicating whether the TeamStanding entries of the event need to be rebuilt
+        - standings_version: Version of the standings, incremented by every write affecting them
+        - standings_modified: Date/time of the last write affecting the standings
+        - archived: Date/time the track points, scores and challenge submissions of the event were moved to its
+          archive (see webapp.archive), null if they were not
     """
     phone_regex = RegexValidator(regex=r'^\+?1?\d{9,15}$', message="Phone number must be entered in the format: "
                                                                    "'+999999999'. Up to 15 digits allowed.")
@@ -103,7 +116,11 @@ class Event(models.Model):
     end_city = models.CharField(max_length=255)
     emergency_contact = models.CharField(validators=[phone_regex], max_length=17)
     winner_photo = models.ImageField(upload_to='event_winners/')
-    is_active = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=False, db_index=True)
+    standings_stale = models.BooleanField(default=True)
+    standings_version = models.IntegerField(default=0)
+    standings_modified = models.DateTimeField(default=now)
+    archived = models.DateTimeField(null=True)
 
 
 class Team(models.Model):
@@ -115,11 +132,17 @@ class Team(models.Model):
         - is_disqualified: Boolean indicating whether a team is disqualified for this event
         - is_winner: Boolean indicating whether the team won the event defined by @event_id
         - timer_started: Boolean indicating whether the team's timer is running.
+        - segment: Number of the current (or last) segment of the team, 0 before the first start
+        - segment_start: Date and time the current (or last) segment was started
+        - unscored_time: Travel time of the stopped segments that is not part of a score yet
     """
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     is_disqualified = models.BooleanField(default=False)
     is_winner = models.BooleanField(default=False)
     timer_started = models.BooleanField(default=False)
+    segment = models.IntegerField(default=0)
+    segment_start = models.DateTimeField(null=True)
+    unscored_time = models.DurationField(default=timedelta)
 
 
 class Challenge(models.Model):
@@ -146,9 +169,13 @@ class UserTeam(models.Model):
         - user_id: FK to User
         - team_id: FK to team
     """
-    user = models.ForeignKey(User, on_delete=models.SET(-1))
+    # Indexed by the composite index, which starts with the user
+    user = models.ForeignKey(User, on_delete=models.SET(-1), db_index=False)
     team = models.ForeignKey(Team, on_delete=models.SET(-1))
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'team'])]
+
 
 class TeamChallenge(models.Model):
     """
@@ -161,12 +188,16 @@ class TeamChallenge(models.Model):
         picture: Link to a picture taken for the challenge
         is_accepted: Boolean indicating whether a challenge submission is under review (false) or accepted (true)
     """
-    team = models.ForeignKey(Team, on_delete=models.SET(-1))
+    # Indexed by the composite index, which starts with the team
+    team = models.ForeignKey(Team, on_delete=models.SET(-1), db_index=False)
     challenge = models.ForeignKey(Challenge, on_delete=models.SET(-1))
     location = models.ForeignKey(Location, on_delete=models.SET(-1))
     picture = models.ImageField(upload_to='challenge/')
     is_accepted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=['team', 'challenge', 'is_accepted'])]
+
 
 class SubLocation(models.Model):
     """
@@ -176,27 +207,43 @@ class SubLocation(models.Model):
         - event_id: FK to a specific event
         - location_id: FK to a specific location
     """
-    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    # Indexed by the composite index, which starts with the event
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, db_index=False)
     location = models.ForeignKey(Location, on_delete=models.SET(-1))
     city = models.CharField(max_length=255, default="No name")
     order = models.IntegerField()
 
+    class Meta:
+        indexes = [models.Index(fields=['event', 'order'])]
+
 
 class TeamLocation(models.Model):
     """
-    TeamLocation model - keeps track of when a team reaches a destination
+    TeamLocation model - track point of a team
     Fields:
-        - id: PK autogenerated (not used)
+        - id: PK autogenerated
         - team_id: FK to Team model
-        - location_id: FK to Location model
+        - location_id: FK to Location model, only set when the point is a named place (e.g. the sub-destination the
+          timer was stopped at)
+        - latitude: Latitude of the point (null only for the points stored before the coordinates were inlined, see
+          the inline_team_locations command)
+        - longitude: Longitude of the point (idem)
+        - geohash: Geohash of the point, indexed (see webapp.geohash)
         - segment: Segment team is on when reaching location
         - datetime: Date/time when the location was reached
     """
-    team = models.ForeignKey(Team, on_delete=models.CASCADE)
-    location = models.ForeignKey(Location, on_delete=models.CASCADE)
+    # Indexed by the composite indexes, which start with the team
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, db_index=False)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True)
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+    geohash = GeohashField()
     segment = models.IntegerField()
     datetime = models.DateTimeField()
 
+    class Meta:
+        indexes = [models.Index(fields=['team', 'segment', 'datetime']), models.Index(fields=['team', 'datetime'])]
+
 
 class Score(models.Model):
     """
@@ -208,7 +255,62 @@ class Score(models.Model):
         - end_location_id: FK to Location model
         - time: time field containing the score
     """
-    team = models.ForeignKey(Team, on_delete=models.CASCADE)
+    # Indexed by the composite index, which starts with the team
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, db_index=False)
     start_location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='start_location_score')
     end_location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='end_location_score')
     time = models.DurationField()
+
+    class Meta:
+        indexes = [models.Index(fields=['team', 'end_location'])]
+
+
+class TeamStanding(models.Model):
+    """
+    TeamStanding model - denormalized scoreboard entry of a team, rebuilt when the standings of its event change
+    Fields:
+        - id: PK autogenerated (not used)
+        - team_id: FK to Team model (one entry per team)
+        - event_id: FK to Event model (event of the team)
+        - travel_time: Total travel time of the stopped segments of the team
+        - bonus_time: Bonus time earned by the team via accepted challenges
+        - final_time: Travel time - bonus time
+        - final_seconds: Final time in whole seconds, used to rank the teams
+        - segments: List of the segments (order, name, time) as shown on the scoreboard
+        - members: List of the first names of the team members
+        - is_disqualified: Whether the team is disqualified
+        - rank: Position of the team on the scoreboard (disqualified teams last, ties broken by team ID)
+        - previous_rank: Position of the team before its last rank change, null if it never changed
+        - version: Standings version of the event when the entry last changed
+    """
+    team = models.OneToOneField(Team, on_delete=models.CASCADE, related_name='standing')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    travel_time = models.DurationField(default=timedelta)
+    bonus_time = models.DurationField(default=timedelta)
+    final_time = models.DurationField(default=timedelta)
+    final_seconds = models.IntegerField(default=0)
+    segments = JSONField(default=list)
+    members = JSONField(default=list)
+    is_disqualified = models.BooleanField(default=False)
+    rank = models.IntegerField(default=0)
+    previous_rank = models.IntegerField(null=True)
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['event', 'rank'])]
+
+
+class ScoreboardSnapshot(models.Model):
+    """
+    ScoreboardSnapshot model - immutable copy of the scoreboard of an event, recorded each time its standings change
+    Fields:
+        - id: PK autogenerated
+        - event_id: FK to Event model
+        - version: Standings version of the event the snapshot was recorded for
+        - created: Date and time the snapshot was recorded
+        - standings: Scoreboard entries of all teams in rank order, as returned by the scoreboard API
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    version = models.IntegerField()
+    created = models.DateTimeField(default=now, db_index=True)
+    standings = JSONField(default=list)
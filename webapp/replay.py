@@ -0,0 +1,86 @@
+# Replay of an event: positions of all teams at given instants
+#
+# The replay index of an event holds, for each team, the times and coordinates of its track points as time-sorted
+# arrays. It is built with one query and kept in memory by each process along with the number of track points and the
+# highest TeamLocation ID, and built again once the event has new points. It is not stored in the Django cache: the
+# index of a large event is several megabytes, more than a memcached item can hold. Each process keeps the indexes of
+# the last settings.EVENT_MEMORY_CACHE_SIZE replayed events.
+# The track points of an archived event are read from its archive (see webapp.archive).
+# The position of a team at an instant is found by binary search and interpolated linearly between the surrounding
+# track points. Between two segments (timer stopped) the team stays at the last point of the first segment.
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from webapp.analytics import get_event_track_points_version, load_event_track_points
+
+_lock = threading.Lock()
+# Replay indexes by event ID, least recently used first
+_indexes = OrderedDict()
+
+
+def get_replay_index(event):
+    """
+    Returns the replay index of an event
+    :param event: Event object
+    :return: Dict of the teams with track points, by team ID, of tuples of arrays (times, latitudes, longitudes,
+    segments) sorted by time, with the times in seconds since the epoch
+    """
+    # Built again only when the event has new track points
+    size = get_event_track_points_version(event)
+    with _lock:
+        entry = _indexes.get(event.pk)
+        if entry is not None and entry['size'] == size:
+            _indexes.move_to_end(event.pk)
+            return entry['index']
+
+    team_ids, segments, latitudes, longitudes, times = load_event_track_points(event)
+    # Track points sorted by team, then by time
+    order = np.lexsort((times, team_ids))
+    team_ids, segments, latitudes, longitudes, times = \
+        team_ids[order], segments[order], latitudes[order], longitudes[order], times[order]
+
+    # First track point of each team (none without track points)
+    index = {}
+    starts = np.flatnonzero(np.r_[True, team_ids[1:] != team_ids[:-1]])[:len(team_ids)]
+    for start, end in zip(starts, np.r_[starts[1:], len(team_ids)]):
+        index[int(team_ids[start])] = (times[start:end], latitudes[start:end], longitudes[start:end],
+                                       segments[start:end])
+
+    with _lock:
+        _indexes[event.pk] = dict(size=size, index=index)
+        _indexes.move_to_end(event.pk)
+        while len(_indexes) > settings.EVENT_MEMORY_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_positions(track, instants):
+    """
+    Interpolates the positions of a team at given instants
+    :param track: Tuple of arrays (times, latitudes, longitudes, segments) of the team, as in @get_replay_index()
+    :param instants: Array of instants (in seconds since the epoch)
+    :return: List of the positions at @instants: (latitude, longitude), or None before the first track point
+    """
+    times, latitudes, longitudes, segments = track
+
+    # Track points before (or at) and after each instant
+    after = np.searchsorted(times, instants, side='right')
+    before = after - 1
+    after = np.minimum(after, len(times) - 1)
+    started = before >= 0
+    before = np.maximum(before, 0)
+
+    # Fraction of the way between the two points, 0 after the last point and between two segments
+    duration = times[after] - times[before]
+    moving = (duration > 0) & (segments[after] == segments[before])
+    fraction = np.divide(instants - times[before], duration, out=np.zeros(len(instants)), where=moving)
+    fraction = np.clip(fraction, 0, 1)
+
+    latitude = latitudes[before] + (latitudes[after] - latitudes[before]) * fraction
+    longitude = longitudes[before] + (longitudes[after] - longitudes[before]) * fraction
+    return [(float(lat), float(lng)) if team_started else None
+            for lat, lng, team_started in zip(latitude, longitude, started)]
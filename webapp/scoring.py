@@ -0,0 +1,132 @@
+# Scoring engine shared by the REST API and the webapp scoreboards
+#
+# The results of all teams of an event are computed with a constant number of grouped queries, whatever the number of
+# teams, segments or TeamLocation entries.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min, Max, Sum
+
+from webapp.models import Team, UserTeam, SubLocation, Score, TeamChallenge, TeamLocation
+
+
+def get_segments(event, cached=True):
+    """
+    Returns the segments of an event: start city to first sub-destination, sub-destination to sub-destination and
+    last sub-destination to end city (or start city to end city if there is no sub-destination).
+    The segments are cached until the event or its sub-destinations change (see webapp.signals).
+    :param event: Event object
+    :param cached: Whether the cached segments can be returned, otherwise they are read from the database (and cached)
+    :return: List of segments
+        - order: Order of the segment
+        - name: Name of the segment (city to city)
+        - start_id: ID of the location starting the segment
+        - end_id: ID of the location ending the segment
+    """
+    key = _segments_cache_key(event.pk)
+    segments = cache.get(key) if cached else None
+    if segments is None:
+        segments = _build_segments(event)
+        cache.set(key, segments, settings.SEGMENTS_CACHE_TIMEOUT)
+    return segments
+
+
+def invalidate_segments(event_id):
+    """
+    Drops the cached segments of an event
+    :param event_id: ID of the event
+    """
+    cache.delete(_segments_cache_key(event_id))
+
+
+def compute_scoreboard(event):
+    """
+    Computes the results of all teams of an event
+    :param event: Event object
+    :return: Tuple (segments, results), with @segments as returned by @get_segments() and @results a list (ordered
+    by team ID) containing for each team:
+        - team: Team object
+        - members: First names of the team members
+        - segment_times: Time the team took to complete each segment of @segments, None if not completed
+        - travel_time: Total travel time of the stopped segments
+        - bonus_time: Bonus time earned via accepted challenges
+        - final_time: Travel time - bonus time
+    """
+    segments = get_segments(event)
+    teams = list(Team.objects.filter(event_id=event.pk).order_by('id'))
+
+    # Member first names, grouped by team
+    members = {}
+    user_teams = UserTeam.objects.filter(team__event_id=event.pk).select_related('user').order_by('user_id')
+    for user_team in user_teams:
+        members.setdefault(user_team.team_id, []).append(user_team.user.first_name)
+
+    # Scores, grouped by (team, end location)
+    scores = {}
+    for row in Score.objects.filter(team__event_id=event.pk).values('team_id', 'end_location_id') \
+            .annotate(time=Sum('time')).order_by():
+        scores[(row['team_id'], row['end_location_id'])] = row['time']
+
+    # Rewards of the accepted challenges, grouped by team
+    bonus_times = {}
+    for row in TeamChallenge.objects.filter(team__event_id=event.pk, is_accepted=True).values('team_id') \
+            .annotate(bonus=Sum('challenge__reward')).order_by():
+        bonus_times[row['team_id']] = row['bonus']
+
+    # Earliest and latest location of each (team, segment)
+    segment_spans = {}
+    for row in TeamLocation.objects.filter(team__event_id=event.pk).values('team_id', 'segment') \
+            .annotate(start=Min('datetime'), end=Max('datetime')).order_by():
+        segment_spans.setdefault(row['team_id'], {})[row['segment']] = row['end'] - row['start']
+
+    # Travel time of the stopped segments, summed up per team. The running segment of a team is left out: pings do not
+    # mark the standings as stale, its time is added once the team stops (which does)
+    travel_times = {}
+    for team in teams:
+        spans = segment_spans.get(team.pk, {})
+        if team.timer_started and spans:
+            # Teams that started before their segment was stored run their last segment
+            spans.pop(team.segment or max(spans), None)
+        travel_times[team.pk] = sum(spans.values(), timedelta())
+
+    results = []
+    for team in teams:
+        segment_times = []
+        for segment in segments:
+            time = scores.get((team.pk, segment['end_id']))
+            # A segment is only completed with a positive score
+            if time is not None and time <= timedelta(seconds=0):
+                time = None
+            segment_times.append(time)
+
+        travel_time = travel_times.get(team.pk, timedelta())
+        bonus_time = bonus_times.get(team.pk, timedelta())
+
+        results.append(dict(team=team, members=members.get(team.pk, []), segment_times=segment_times,
+                            travel_time=travel_time, bonus_time=bonus_time, final_time=travel_time - bonus_time))
+
+    return segments, results
+
+
+# Cache key of the segments of an event
+def _segments_cache_key(event_id):
+    return 'event_segments_%d' % int(event_id)
+
+
+# Constructs the segments of an event from its sub-destinations
+def _build_segments(event):
+    sub_destinations = SubLocation.objects.filter(event_id=event.pk).order_by('order')
+
+    # Each segment ends at a sub-destination, except the last one which ends at the end location
+    cities = [event.start_city] + [location.city for location in sub_destinations] + [event.end_city]
+    location_ids = [event.start_location_id] + [location.location_id for location in sub_destinations] + \
+                   [event.end_location_id]
+
+    segments = []
+    for index in range(len(cities) - 1):
+        segments.append(dict(order=index + 1, name=cities[index] + "-" + cities[index + 1],
+                             start_id=location_ids[index], end_id=location_ids[index + 1]))
+
+    return segments
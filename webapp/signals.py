@@ -0,0 +1,84 @@
+# Signal receivers keeping the denormalized data of an event in sync with the rows it is computed from
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+
+from webapp.active_event import invalidate_active_event
+from webapp.geo import invalidate_geofences
+from webapp.models import Event, Location, Team, Score, TeamChallenge, SubLocation, UserTeam, User
+from webapp.scoring import invalidate_segments
+from webapp.standings import mark_standings_stale, mark_team_standings_stale, mark_user_standings_stale
+
+
+# Marks the standings of the event of a team-related row (Score, TeamChallenge, UserTeam) as stale
+def team_row_changed(sender, instance, **kwargs):
+    mark_team_standings_stale(instance.team_id)
+
+
+# Marks the standings of the event of an event-related row (Team, SubLocation) as stale
+def event_row_changed(sender, instance, **kwargs):
+    mark_standings_stale(instance.event_id)
+
+
+# Drops the cached segments and geofences of the event of a sub-destination when it is added, edited, reordered or
+# deleted
+def sub_destination_changed(sender, instance, **kwargs):
+    invalidate_segments(instance.event_id)
+    invalidate_geofences(instance.event_id)
+
+
+# Marks the standings of an event as stale and drops its cached segments and geofences when it is edited (city names
+# are part of the segment names)
+def event_changed(sender, instance, **kwargs):
+    invalidate_segments(instance.pk)
+    invalidate_geofences(instance.pk)
+    mark_standings_stale(instance.pk)
+
+
+# Drops the cached active event when an event is edited, (de)activated or deleted. The cache is dropped again once the
+# transaction is committed, so that no process keeps the event it reloaded in the meantime
+def active_event_changed(sender, instance, **kwargs):
+    invalidate_active_event()
+    transaction.on_commit(invalidate_active_event)
+
+
+# Drops the cached active event and the geofences of the events of a location when it is edited or deleted (new
+# locations are not part of an event yet)
+def location_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        active_event_changed(sender, instance)
+        event_ids = set(Event.objects.filter(Q(start_location_id=instance.pk) | Q(end_location_id=instance.pk))
+                        .values_list('pk', flat=True))
+        event_ids.update(SubLocation.objects.filter(location_id=instance.pk).values_list('event_id', flat=True))
+        for event_id in event_ids:
+            invalidate_geofences(event_id)
+
+
+# Marks the standings of the events of a user as stale when the user is edited (first names are on the scoreboard)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logging in only updates the last login date
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    mark_user_standings_stale(instance.pk)
+
+
+def connect_signals():
+    for model in (Score, TeamChallenge, UserTeam):
+        post_save.connect(team_row_changed, sender=model)
+        post_delete.connect(team_row_changed, sender=model)
+
+    for model in (Team, SubLocation):
+        post_save.connect(event_row_changed, sender=model)
+        post_delete.connect(event_row_changed, sender=model)
+
+    post_save.connect(sub_destination_changed, sender=SubLocation)
+    post_delete.connect(sub_destination_changed, sender=SubLocation)
+
+    post_save.connect(event_changed, sender=Event)
+
+    post_save.connect(active_event_changed, sender=Event)
+    post_delete.connect(active_event_changed, sender=Event)
+    post_save.connect(location_changed, sender=Location)
+    post_delete.connect(location_changed, sender=Location)
+    post_save.connect(user_changed, sender=User)
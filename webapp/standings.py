@@ -0,0 +1,239 @@
+# Denormalized scoreboard of an event
+#
+# The TeamStanding table holds one precomputed scoreboard entry per team. Writes affecting the standings only mark
+# the event as stale and increment its standings version (see webapp.signals), the entries are then rebuilt once by
+# the next call to refresh_standings(). Each rebuild changing the scoreboard records a ScoreboardSnapshot of it.
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from backend.functions import time_format
+from webapp.broker import get_broker
+from webapp.models import Event, ScoreboardSnapshot, TeamStanding
+from webapp.scoring import compute_scoreboard
+
+
+def mark_standings_stale(event_id):
+    """
+    Flags the standings of an event as outdated and increments their version
+    :param event_id: ID of the event
+    """
+    _mark_stale(Event.objects.filter(pk=event_id))
+
+
+def mark_team_standings_stale(team_id):
+    """
+    Flags the standings of the event of a team as outdated and increments their version
+    :param team_id: ID of the team
+    """
+    _mark_stale(Event.objects.filter(team__pk=team_id))
+
+
+def mark_user_standings_stale(user_id):
+    """
+    Flags the standings of the events of a user's teams as outdated and increments their version
+    :param user_id: ID of the user
+    """
+    _mark_stale(Event.objects.filter(team__userteam__user_id=user_id))
+
+
+def get_standings_etag(event):
+    """
+    :param event: Event object
+    :return: ETag identifying the current version of the standings of @event
+    """
+    return '"%d-%d"' % (event.pk, event.standings_version)
+
+
+def refresh_standings(event_id):
+    """
+    Rebuilds the TeamStanding entries of an event if they are outdated, and publishes the entries that changed.
+    The event row is locked while rebuilding, so concurrent callers wait for the first one instead of rebuilding too.
+    The standings of the archived events are frozen: their scores are no longer in the database.
+    :param event_id: ID of the event
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().filter(pk=event_id, standings_stale=True, archived__isnull=True) \
+            .first()
+        if event is None:
+            return
+
+        existing = {standing.team_id: standing for standing in TeamStanding.objects.filter(event_id=event_id)}
+        standings = []
+        new_standings = []
+        changed_standings = []
+
+        # Entries created or changed by this rebuild are stamped with the current version
+        for team, data in _compute_standings(event):
+            standing = existing.get(team.pk)
+            if standing is None:
+                standing = TeamStanding(team=team, event_id=event_id, version=event.standings_version, **data)
+                new_standings.append(standing)
+                changed_standings.append(standing)
+            elif any(getattr(standing, field) != value for field, value in data.items()):
+                # Keep the previous rank to show the rank movement
+                if standing.rank != data['rank']:
+                    standing.previous_rank = standing.rank
+                for field, value in data.items():
+                    setattr(standing, field, value)
+                standing.version = event.standings_version
+                standing.save()
+                changed_standings.append(standing)
+            standings.append(standing)
+
+        TeamStanding.objects.bulk_create(new_standings)
+        Event.objects.filter(pk=event_id).update(standings_stale=False)
+
+        # Nothing to record or publish if no team changed or was deleted
+        if not changed_standings and len(existing) == len(standings):
+            return
+
+        # Record a snapshot, after reading the version of the previous one (the previous rebuild that was published)
+        previous_version = ScoreboardSnapshot.objects.filter(event_id=event_id).order_by('-version') \
+            .values_list('version', flat=True).first()
+        ScoreboardSnapshot.objects.create(event_id=event_id, version=event.standings_version,
+                                          standings=[serialize_standing(standing) for standing in standings])
+
+    # Publish the changes, with the teams in rank order so that clients can drop the deleted ones. The version of the
+    # previous rebuild tells the subscribers whether they missed a rebuild (published by another process)
+    team_ids = [standing.team_id for standing in standings]
+    message = dict(version=event.standings_version, previous_version=previous_version, team_ids=team_ids,
+                   teams=[serialize_standing(standing) for standing in changed_standings])
+    get_broker().publish(event_id, message)
+
+
+def get_standings(event):
+    """
+    Returns the up-to-date standings of an event
+    :param event: Event object
+    :return: TeamStanding queryset ordered by rank
+    """
+    if event.standings_stale:
+        refresh_standings(event.pk)
+
+    return TeamStanding.objects.filter(event_id=event.pk).order_by('rank')
+
+
+def get_standings_delta(event, since):
+    """
+    Returns the changes of the standings of an event since a given version
+    :param event: Event object
+    :param since: Standings version known by the client
+    :return: Dictionary with:
+        - version: Current version of the standings
+        - team_ids: IDs of all teams, in rank order (teams missing from it were deleted)
+        - teams: Scoreboard entries of the teams that changed after version @since
+    """
+    standings = get_standings(event)
+
+    # A rebuild triggered by get_standings() may stamp the entries with a version newer than the one of @event
+    version = max([event.standings_version] + [standing.version for standing in standings])
+
+    # A version newer than the current one is unknown (e.g. the database was reset), send every team
+    if since > version:
+        since = -1
+
+    team_ids = [standing.team_id for standing in standings]
+    changed = [serialize_standing(standing) for standing in standings if standing.version > since]
+    return dict(version=version, team_ids=team_ids, teams=changed)
+
+
+def get_published_version(event_id):
+    """
+    :param event_id: ID of the event
+    :return: Version of the last rebuild of the standings of the event that was published (the version of its last
+    snapshot), -1 if there is none
+    """
+    version = ScoreboardSnapshot.objects.filter(event_id=event_id).order_by('-version') \
+        .values_list('version', flat=True).first()
+    return -1 if version is None else version
+
+
+def get_snapshot(event_id, at=None, version=None):
+    """
+    Returns a scoreboard snapshot of an event
+    :param event_id: ID of the event
+    :param at: Date and time, to get the scoreboard as it was at that time
+    :param version: Standings version, to get the snapshot of that version
+    :return: The requested snapshot (the latest one if neither @at nor @version are provided), None if there is none
+    """
+    snapshots = ScoreboardSnapshot.objects.filter(event_id=event_id)
+    if at is not None:
+        snapshots = snapshots.filter(created__lte=at)
+    if version is not None:
+        snapshots = snapshots.filter(version=version)
+    return snapshots.order_by('-version').first()
+
+
+def serialize_snapshot(snapshot):
+    """
+    :param snapshot: ScoreboardSnapshot object
+    :return: Dictionary with:
+        - version: Standings version of the snapshot
+        - created: Date and time the snapshot was recorded
+        - previous_version: Version of the previous snapshot of the event, None if this is the first one
+        - next_version: Version of the next snapshot of the event, None if this is the last one
+        - standings: Scoreboard entries of all teams in rank order
+    """
+    snapshots = ScoreboardSnapshot.objects.filter(event_id=snapshot.event_id)
+    previous_snapshot = snapshots.filter(version__lt=snapshot.version).order_by('-version').first()
+    next_snapshot = snapshots.filter(version__gt=snapshot.version).order_by('version').first()
+    return dict(version=snapshot.version, created=snapshot.created,
+                previous_version=previous_snapshot.version if previous_snapshot else None,
+                next_version=next_snapshot.version if next_snapshot else None,
+                standings=snapshot.standings)
+
+
+def serialize_standing(standing):
+    """
+    :param standing: TeamStanding object
+    :return: Scoreboard entry of the team
+        - team_id: ID of the team
+        - members: First names of the team members
+        - segments: List of the segments (order, name, time)
+        - travel_time: Total travel time (HH:MM)
+        - bonus_time: Bonus time earned via challenges (HH:MM)
+        - final_time: Travel time - bonus time (HH:MM)
+        - is_disqualified: Whether the team is disqualified
+        - rank: Position of the team on the scoreboard
+        - rank_change: Number of positions gained (negative if lost) at the last rank change of the team
+    """
+    rank_change = standing.previous_rank - standing.rank if standing.previous_rank else 0
+    return dict(team_id=standing.team_id, members=standing.members, segments=standing.segments,
+                travel_time=time_format(standing.travel_time), bonus_time=time_format(standing.bonus_time),
+                final_time=time_format(standing.final_time), is_disqualified=standing.is_disqualified,
+                rank=standing.rank, rank_change=rank_change)
+
+
+# Flags the standings of the events of @queryset as outdated
+def _mark_stale(queryset):
+    queryset.update(standings_stale=True, standings_version=F('standings_version') + 1, standings_modified=now())
+
+
+# Computes the standings of all teams of an event, as a list of (team, TeamStanding field values)
+def _compute_standings(event):
+    segments, results = compute_scoreboard(event)
+
+    # Rank the teams by final time in seconds, disqualified teams last and ties broken by team ID
+    for result in results:
+        result['final_seconds'] = result['final_time'] // timedelta(seconds=1)
+    results = sorted(results, key=lambda k: (k['team'].is_disqualified, k['final_seconds'], k['team'].pk))
+
+    standings = []
+    for rank, result in enumerate(results, start=1):
+        # Construct segment data (time in HH:MM format or N/A if not completed)
+        team_segments = []
+        for segment, time in zip(segments, result['segment_times']):
+            time = time_format(time) if time else "N/A"
+            team_segments.append(dict(order=segment['order'], name=segment['name'], time=time))
+
+        team = result['team']
+        standings.append((team, dict(travel_time=result['travel_time'], bonus_time=result['bonus_time'],
+                                     final_time=result['final_time'], final_seconds=result['final_seconds'],
+                                     segments=team_segments,
+                                     members=result['members'], is_disqualified=team.is_disqualified, rank=rank)))
+
+    return standings
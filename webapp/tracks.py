@@ -0,0 +1,160 @@
+# Simplified team tracks shared by the route API and the event map
+#
+# Each segment of a team is simplified with the Douglas-Peucker algorithm: the points closer than a tolerance (in
+# metres) to the line joining the kept points are dropped. The simplified segments are cached per (team, segment,
+# tolerance) along with the number of points and the highest TeamLocation ID they were computed from, so a segment is
+# only simplified again once it grew. This check is a single grouped query, which also covers the track points written
+# without signals (bulk inserts of the batch upload and of the location buffer).
+# The segments can also be encoded as polylines (the encoded polyline algorithm format of Google Maps), with the times
+# of their points encoded as differences, for compact payloads.
+
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+# Metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEGREE = 111320
+
+# Number of decimals of the coordinates of the encoded polylines (about 1 m)
+POLYLINE_PRECISION = 5
+
+
+def simplify(points, tolerance):
+    """
+    Simplifies a track with the Douglas-Peucker algorithm
+    :param points: List of points, tuples starting with the latitude and the longitude
+    :param tolerance: Maximum distance (in metres) between a dropped point and the simplified track, 0 keeps every point
+    :return: List of the kept points, in the same order
+    """
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+
+    # Project the points on a plane (in metres), around the latitude of the first point
+    scale = math.cos(math.radians(points[0][0]))
+    projected = [(point[1] * METRES_PER_DEGREE * scale, point[0] * METRES_PER_DEGREE) for point in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = projected[first], projected[last]
+        length = math.hypot(x2 - x1, y2 - y1)
+
+        # Farthest point from the line (or from the first point if both ends are the same)
+        farthest, distance = None, tolerance
+        for index in range(first + 1, last):
+            x, y = projected[index]
+            if length:
+                point_distance = abs((x2 - x1) * (y1 - y) - (x1 - x) * (y2 - y1)) / length
+            else:
+                point_distance = math.hypot(x - x1, y - y1)
+            if point_distance > distance:
+                farthest, distance = index, point_distance
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def get_tracks(team_locations, tolerance=None):
+    """
+    Returns the simplified segments of the track points of @team_locations
+    :param team_locations: TeamLocation queryset, e.g. filtered by team or by event
+    :param tolerance: Tolerance of the simplification (in metres), settings.TRACK_SIMPLIFY_TOLERANCE by default
+    :return: List of tuples (team_id, segment, points) ordered by team and segment, with @points the list of the kept
+    track points as tuples (latitude, longitude, id, datetime) in chronological order
+    """
+    if tolerance is None:
+        tolerance = settings.TRACK_SIMPLIFY_TOLERANCE
+
+    # Track points not copied yet by the inline_team_locations command have no coordinates
+    team_locations = team_locations.filter(latitude__isnull=False)
+
+    # Size of each segment
+    sizes = team_locations.order_by().values('team_id', 'segment') \
+        .annotate(count=Count('id'), last_id=Max('id')).order_by('team_id', 'segment')
+    sizes = [(size['team_id'], size['segment'], (size['count'], size['last_id'])) for size in sizes]
+    keys = {(team_id, segment): _track_cache_key(team_id, segment, tolerance) for team_id, segment, _ in sizes}
+    cached = cache.get_many(keys.values())
+
+    # Simplify the segments that are not cached or grew
+    tracks = {}
+    outdated = set()
+    for team_id, segment, size in sizes:
+        entry = cached.get(keys[(team_id, segment)])
+        if entry is not None and entry['size'] == size:
+            tracks[(team_id, segment)] = entry['points']
+        else:
+            outdated.add((team_id, segment))
+
+    if outdated:
+        # Only the points of the outdated segments are read, not the whole track of their teams
+        segments = Q()
+        for team_id, segment in outdated:
+            segments |= Q(team_id=team_id, segment=segment)
+        points = {}
+        for team_id, segment, latitude, longitude, team_location_id, datetime in team_locations.filter(segments) \
+                .order_by('team_id', 'segment', 'datetime') \
+                .values_list('team_id', 'segment', 'latitude', 'longitude', 'id', 'datetime'):
+            points.setdefault((team_id, segment), []).append((latitude, longitude, team_location_id, datetime))
+
+        entries = {}
+        for team_id, segment, size in sizes:
+            if (team_id, segment) in outdated:
+                tracks[(team_id, segment)] = simplify(points.get((team_id, segment), []), tolerance)
+                entries[keys[(team_id, segment)]] = dict(size=size, points=tracks[(team_id, segment)])
+        cache.set_many(entries, settings.TRACKS_CACHE_TIMEOUT)
+
+    return [(team_id, segment, tracks[(team_id, segment)]) for team_id, segment, _ in sizes]
+
+
+def encode_polyline(points, precision=POLYLINE_PRECISION):
+    """
+    Encodes a track with the encoded polyline algorithm format of Google Maps
+    :param points: List of points, tuples starting with the latitude and the longitude
+    :param precision: Number of decimals of the coordinates
+    :return: Encoded polyline (string)
+    """
+    factor = 10 ** precision
+    encoded = []
+    previous_latitude = previous_longitude = 0
+    for point in points:
+        # Each coordinate is encoded as the difference from the previous point
+        latitude, longitude = int(round(point[0] * factor)), int(round(point[1] * factor))
+        _encode_value(latitude - previous_latitude, encoded)
+        _encode_value(longitude - previous_longitude, encoded)
+        previous_latitude, previous_longitude = latitude, longitude
+    return ''.join(encoded)
+
+
+def encode_times(datetimes):
+    """
+    Encodes the times of the points of a track as differences
+    :param datetimes: List of datetimes, in chronological order
+    :return: List of the number of seconds elapsed since the previous datetime (0 for the first one)
+    """
+    if not datetimes:
+        return []
+    # Rounded from the first datetime, so that the rounding errors do not add up
+    offsets = [int(round((datetime - datetimes[0]).total_seconds())) for datetime in datetimes]
+    return [0] + [offset - previous for previous, offset in zip(offsets, offsets[1:])]
+
+
+# Appends the encoded polyline characters of a signed integer to @encoded
+def _encode_value(value, encoded):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    encoded.append(chr(value + 63))
+
+
+# Returns the cache key of a simplified segment
+def _track_cache_key(team_id, segment, tolerance):
+    return 'track_%d_%d_%s' % (team_id, segment, tolerance)
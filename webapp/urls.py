@@ -31,6 +31,8 @@ urlpatterns = [
 
     url(r'^event_list/$', views.event_list, name='event_list'),
     path(r'event/<event_id>/', views.event, name='event_detail'),
+    path(r'event/<event_id>/history/', views.event_history, name='event_history'),
+    path(r'event/<event_id>/scoreboard/stream/', views.event_scoreboard_stream, name='event_scoreboard_stream'),
     url(r'^admin/event/add/$', views.add_event, name='new_event'),
     path(r'admin/event/edit/<event_id>/', views.edit_event, name='edit_event'),
     path(r'admin/event/edit/<event_id>/location/', views.edit_event_location, name='edit_event_location'),
@@ -57,6 +59,8 @@ urlpatterns = [
     url(r'^admin/administrators/remove/$', views.remove_administrator, name='remove_administrator'),
 
     url(r'^admin/location/add', views.add_location, name='add_location'),
+    path(r'admin/event/<event_id>/export/', views.export_event_tracks, name='export_event_tracks'),
+    path(r'admin/team/<team_id>/export/', views.export_team_track, name='export_team_track'),
 
     path(r'event/<event_id>/challenges', views.challenges, name='challenge'),
     path(r'challenges/<challenge_id>', views.challenge_detail, name='challenge_detail'),
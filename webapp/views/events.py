@@ -2,17 +2,23 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Max
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
 from rest_framework.status import HTTP_200_OK, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_405_METHOD_NOT_ALLOWED, \
-    HTTP_400_BAD_REQUEST
+    HTTP_400_BAD_REQUEST, HTTP_429_TOO_MANY_REQUESTS
 
 from backend.functions import time_format
+from webapp.analytics import get_event_statistics
+from webapp.archive import delete_archive
+from webapp.broker import event_stream, get_stream_client, open_stream
 from webapp.forms import EventCreationForm, EventLocationEditForm, EventEditForm, EventCityNameForm, EventWinnerForm
 from webapp.functions import get_map
 from webapp.models import Event, Team, Score, TeamLocation, TeamChallenge, Challenge, SubLocation, Location, UserTeam, \
     User
+from webapp.scoring import get_segments
+from webapp.standings import get_standings, get_snapshot, serialize_snapshot, serialize_standing
 
 maps_key = settings.GMAPS_API_KEY
 
@@ -28,134 +34,95 @@ def event(request, event_id):
 
     # Get the teams
     teams = Team.objects.filter(event_id=event_id)
-    team_ids = teams.values_list('id')
 
-    # Get the sub-destinations
-    sub_destinations = SubLocation.objects.filter(event_id=event_id).order_by('order')
-    last_sub_destination_order = sub_destinations.aggregate(order=Max('order')).get('order')
+    # Get the sub-destinations and the segments they delimit
+    sub_destinations = SubLocation.objects.filter(event_id=event_id).select_related('location').order_by('order')
+    segment_names = [segment['name'] for segment in get_segments(event)]
 
-    # Get the challenges
-    challenges = Challenge.objects.filter(event_id=event.pk)
-
-    # Get the scores
-    scores = Score.objects.filter(team_id__in=team_ids)
-    team_locations = TeamLocation.objects.filter(team__event_id=event.pk)
-
-    # Get the challenges validated by the teams
-    team_challenges = TeamChallenge.objects.filter(team_id__in=team_ids, is_accepted=True)
-
-    # Construct the segments
-
-    segment_names = []
-    segment_ids = []
-
-    for location in sub_destinations:
-        # If order is 1, then create the start location to first sub-destination segment
-        if location.order == 1:
-            segment_names.append(event.start_city + "-" + location.city)
-            ids = dict(order=location.order, end_id=location.location_id)
-            segment_ids.append(ids)
-        # If order is the biggest one in the table, add last sub-destination to end location segment
-        if location.order == last_sub_destination_order:
-            segment_names.append(location.city + "-" + event.end_city)
-            ids = dict(order=location.order + 1, end_id=event.end_location_id)
-            segment_ids.append(ids)
-        else:
-            next_location = sub_destinations.get(order=location.order + 1)
-            segment_names.append(location.city + "-" + next_location.city)
-            ids = dict(order=location.order + 1, end_id=next_location.location_id)
-            segment_ids.append(ids)
-
-    # If there is no subdestination, create the segment start city - end city
-    if not sub_destinations:
-        seg_name = event.start_city + "-" + event.end_city
-        segment_names.append(seg_name)
-        id = dict(order=1, end_id=event.end_location_id)
-        segment_ids.append(id)
-
-    # Construct array to return
+    # Construct array to return, ordered by rank
     return_data = []
     winning_team = None
-    # For each team
-    for team in teams:
-        # Get the member first names
-        members = UserTeam.objects.filter(team_id=team.pk)
-        users = User.objects.filter(pk__in=members.values_list('user_id'))
-        names = []
-        for user in users:
-            names.append(user.first_name)
-
+    for standing in get_standings(event).select_related('team'):
         # If the team won, add the names to the winning team
-        if team.is_winner:
-            winning_team = names
-
-        # For each segment, fetch the time and the order
-        segments = []
-        for segment_name in segment_names:
-            # Get the array index
-            index = segment_names.index(segment_name)
-
-            # Get the order and end location of the segment
-            order = segment_ids[index].get('order')
-            end_location = segment_ids[index].get('end_id')
-
-            # Get the score data for that segment
-            team_score = scores.filter(end_location_id=end_location, team_id=team.pk)
-            time = timedelta()
-            if team_score:
-                time = team_score.filter(end_location_id=end_location, team_id=team.pk).first().time
-
-            # Construct segment data (time in HH:MM format or N/A if equal to 00:00)
-            if time > timedelta(seconds=0):
-                time = time_format(time)
-            else:
-                time = "N/A"
-
-            segment = dict(name=segment_name, time=time)
-            segments.append(segment)
-
-        # Fetch the bonus time
-        bonus_time = timedelta()
-        for team_challenge in team_challenges.filter(team_id=team.pk):
-            reward = challenges.get(pk=team_challenge.challenge_id).reward
-            bonus_time = bonus_time + reward
-
-        # Calculate the total travel time
-        total_travel_time = timedelta()
-        team_location = team_locations.filter(team_id=team.pk)
-        for data in team_location.values('segment').distinct():
-            segment = team_location.filter(segment=data['segment'])
-            start_time = segment.earliest('datetime').datetime
-            end_time = segment.latest('datetime').datetime
-
-            delta = end_time - start_time
-            total_travel_time = total_travel_time + delta
-        # Calculate the final time
-        final_time = total_travel_time - bonus_time
-
-        # Convert the times to HH:MM format
-        travel_time = time_format(total_travel_time)
-        bonus_time = time_format(bonus_time)
-        final_time = time_format(final_time)
-
-        # Construct array for the team
-        team_data = dict(team_id=team.pk, members=names, segments=segments, travel_time=travel_time,
-                         bonus_time=bonus_time,
-                         final_time=final_time, is_disqualified=team.is_disqualified)
-
-        # Add the array to the return values
-        return_data.append(team_data)
-
-    # Sort the return list by total time
-    return_data = sorted(return_data, key=lambda k: k['final_time'])
-    return_data = sorted(return_data, key=lambda k: k['is_disqualified'])
+        if standing.team.is_winner:
+            winning_team = standing.members
+
+        # Add the array for the team to the return values
+        return_data.append(serialize_standing(standing))
+
+    # Only show the first teams on the scoreboard if the GET parameter "top" is provided
+    top = request.GET.get('top')
+    top = int(top) if top and top.isdigit() else None
+    scoreboard_data = return_data[:top]
+
+    # Distance and speed statistics of the teams, in the scoreboard order
+    statistics = {team['team_id']: team for team in get_event_statistics(event)}
+    statistics_data = []
+    for team in return_data:
+        if team['team_id'] in statistics:
+            team_statistics = statistics[team['team_id']]
+            statistics_data.append(dict(team_statistics, members=team['members'],
+                                        moving_time=time_format(timedelta(seconds=team_statistics['moving_time']))))
 
     return render(request, 'webapp/event_detail.html',
                   {'teams': teams, 'team_routes': team_routes, 'event': event, 'subdestinations': sub_destinations,
-                   'team_data': return_data, 'segment_names': segment_names, 'winning_team': winning_team,
+                   'team_data': return_data, 'scoreboard_data': scoreboard_data, 'top': top,
+                   'statistics_data': statistics_data, 'segment_names': segment_names, 'winning_team': winning_team,
                    'photo': photo, 'gmaps_key': maps_key})
 
 
+# Shows the scoreboard of an event as it was at a given time (GET parameter "at") or version (GET parameter "version")
+def event_history(request, event_id):
+    event = get_object_or_404(Event, pk=event_id)
+
+    # Check the requested time and version
+    at = request.GET.get('at')
+    if at:
+        # parse_datetime() raises ValueError for well formatted but invalid dates
+        try:
+            at = parse_datetime(at)
+        except ValueError:
+            at = None
+        if at is None:
+            return HttpResponse(status=HTTP_400_BAD_REQUEST)
+        if is_naive(at):
+            at = make_aware(at)
+    else:
+        at = None
+
+    version = request.GET.get('version')
+    if version:
+        if not version.isdigit():
+            return HttpResponse(status=HTTP_400_BAD_REQUEST)
+        version = int(version)
+    else:
+        version = None
+
+    # Get the snapshot and the names of its segments
+    snapshot = get_snapshot(event.pk, at=at, version=version)
+    segment_names = []
+    if snapshot:
+        snapshot = serialize_snapshot(snapshot)
+        if snapshot['standings']:
+            segment_names = [segment['name'] for segment in snapshot['standings'][0]['segments']]
+
+    return render(request, 'webapp/event_history.html',
+                  {'event': event, 'snapshot': snapshot, 'segment_names': segment_names})
+
+
+# Streams the changes of the scoreboard of an active event as server-sent events
+def event_scoreboard_stream(request, event_id):
+    event = get_object_or_404(Event, pk=event_id, is_active=True)
+
+    # Limit the number of streams of the client, each stream holding a worker
+    client = get_stream_client(request)
+    if not open_stream(client):
+        return HttpResponse(status=HTTP_429_TOO_MANY_REQUESTS)
+    response = StreamingHttpResponse(event_stream(event.pk, client), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 # Shows the list of all events
 def event_list(request):
     active_events = Event.objects.filter(is_active=True).order_by('-start_date')
@@ -238,8 +205,9 @@ def delete_event(request, event_id):
                 SubLocation.objects.filter(event_id=event_id).delete()
                 # Delete the teams
                 Team.objects.filter(event_id=event_id)
-                # Delete the event
+                # Delete the event and its archive
                 Event.objects.filter(pk=event_id).delete()
+                delete_archive(event_id)
 
                 return HttpResponse(status=HTTP_200_OK)
             # Event does not exist
@@ -276,25 +244,25 @@ def edit_event(request, event_id):
                     # Change start date
                     if start_date:
                         event.start_date = start_date
-                        event.save()
+                        event.save(update_fields=['start_date'])
                         return HttpResponse(status=HTTP_200_OK)
 
                     # Change end date
                     if end_date:
                         event.end_date = end_date
-                        event.save()
+                        event.save(update_fields=['end_date'])
                         return HttpResponse(status=HTTP_200_OK)
 
                     # Change title
                     if title:
                         event.title = title
-                        event.save()
+                        event.save(update_fields=['title'])
                         return HttpResponse(status=HTTP_200_OK)
 
                     # Change emergency contact
                     if emergency_contact:
                         event.emergency_contact = emergency_contact
-                        event.save()
+                        event.save(update_fields=['emergency_contact'])
                         return HttpResponse(status=HTTP_200_OK)
 
                     # If there is no information submitted
@@ -386,7 +354,7 @@ def edit_event_location(request, event_id):
                             event.end_location_id = location.pk
 
                         # Save the new location
-                        event.save()
+                        event.save(update_fields=['start_location', 'end_location'])
 
                         return HttpResponse(status=HTTP_200_OK)
 
@@ -436,7 +404,7 @@ def edit_event_city_name(request):
                     else:
                         return HttpResponse(status=HTTP_400_BAD_REQUEST)
                     # Save in database and return HTTP 200
-                    event.save()
+                    event.save(update_fields=['start_city', 'end_city'])
                     return HttpResponse(status=HTTP_200_OK)
 
                 # Event doesn't exist
@@ -465,17 +433,21 @@ def mark_event_active(request, event_id):
                 # Get the event
                 event = Event.objects.get(pk=event_id)
 
+                # An archived event has no track points or scores anymore, and its standings are frozen
+                if event.archived:
+                    return HttpResponse(status=HTTP_400_BAD_REQUEST)
+
                 # Check if it is already active
                 if event.is_active is False:
                     # Mark all other events as inactive
                     other_events = Event.objects.exclude(pk=event_id)
                     for other_event in other_events:
                         other_event.is_active = False
-                        other_event.save()
+                        other_event.save(update_fields=['is_active'])
 
                     # Mark requested event as active
                     event.is_active = True
-                    event.save()
+                    event.save(update_fields=['is_active'])
 
                 return HttpResponse(status=HTTP_200_OK)
             # Event doesn't exist
@@ -504,7 +476,7 @@ def mark_event_inactive(request, event_id):
                 if event.is_active is True:
                     # Mark requested event as inactive
                     event.is_active = False
-                    event.save()
+                    event.save(update_fields=['is_active'])
 
                 return HttpResponse(status=HTTP_200_OK)
 
@@ -547,7 +519,7 @@ def event_winners(request, event_id):
 
             # Set the event's winner photo
             event.winner_photo = photo
-            event.save()
+            event.save(update_fields=['winner_photo'])
 
             return render(request, 'webapp/admin/event_winners.html',
                           {'new_entry': True, 'is_valid': True, 'event': event})
@@ -615,7 +587,7 @@ def edit_event_winners(request, event_id):
 
             # Save the new photo
             event.winner_photo = photo
-            event.save()
+            event.save(update_fields=['winner_photo'])
 
             return render(request, 'webapp/admin/event_winners.html',
                           {'new_entry': True, 'is_valid': True, 'edit': True, 'event': event})
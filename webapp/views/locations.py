@@ -1,12 +1,13 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, \
     HTTP_405_METHOD_NOT_ALLOWED
 
+from webapp.export import EXPORT_FORMATS, export_tracks
 from webapp.forms import IdForm, SubLocationCoordinatesForm, SubLocationCityForm, SubLocationOrderForm, LocationForm
-from webapp.models import Event, Location, SubLocation
+from webapp.models import Event, Location, SubLocation, Team, TeamLocation
 
 maps_key = settings.GMAPS_API_KEY
 
@@ -290,3 +291,40 @@ def add_location(request):
     # User is not superuser
     else:
         return HttpResponse(status=HTTP_403_FORBIDDEN)
+
+
+# Allows the superuser to download the tracks of all teams of an event (GET parameter "format": "gpx" or "geojson")
+@login_required
+def export_event_tracks(request, event_id):
+    # Check for permission
+    if request.user.is_superuser:
+        event = get_object_or_404(Event, pk=event_id)
+        return _export_response(request, TeamLocation.objects.filter(team__event_id=event.pk), 'event_%d' % event.pk)
+    # User is not superuser
+    else:
+        return HttpResponse(status=HTTP_403_FORBIDDEN)
+
+
+# Allows the superuser to download the track of a team (GET parameter "format": "gpx" or "geojson")
+@login_required
+def export_team_track(request, team_id):
+    # Check for permission
+    if request.user.is_superuser:
+        team = get_object_or_404(Team, pk=team_id)
+        return _export_response(request, TeamLocation.objects.filter(team_id=team.pk), 'team_%d' % team.pk)
+    # User is not superuser
+    else:
+        return HttpResponse(status=HTTP_403_FORBIDDEN)
+
+
+# Streams the tracks of @team_locations in the requested format, as a file named @name
+def _export_response(request, team_locations, name):
+    # Check the requested format
+    export_format = request.GET.get('format', 'gpx')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(status=HTTP_400_BAD_REQUEST)
+
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(export_tracks(team_locations, export_format), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (name, extension)
+    return response
@@ -6,6 +6,7 @@ from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_400_BAD_
 
 from webapp.forms import IdForm, UserTeamForm
 from webapp.models import Team, Score, TeamLocation, UserTeam, Event, User
+from webapp.standings import refresh_standings
 
 
 # Allows an administrator to edit teams
@@ -251,6 +252,9 @@ def disqualify_team(request):
                 team = Team.objects.get(pk=team_id)
                 team.is_disqualified = True
                 team.save()
+
+                # Rebuild the scoreboard with the team ranked last
+                refresh_standings(team.event_id)
                 return HttpResponse(status=HTTP_200_OK)
 
             # Team doesn't exist
@@ -283,6 +287,9 @@ def undisqualify_team(request):
                 team = Team.objects.get(pk=team_id)
                 team.is_disqualified = False
                 team.save()
+
+                # Rebuild the scoreboard with the team ranked again
+                refresh_standings(team.event_id)
                 return HttpResponse(status=HTTP_200_OK)
 
             # Team doesn't exist
@@ -1,6 +1,7 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
 
+from webapp.active_event import get_active_event
 from webapp.models import Event, User
 
 
@@ -13,9 +14,8 @@ def admin_dashboard(request):
 
 def index(request):
     # Get active event
-    event = Event.objects.filter(is_active=True)
+    event = get_active_event()
     if event:
-        event = Event.objects.get(is_active=True)
         return render(request, 'webapp/index.html', {'event': event})
     else:
         return render(request, 'webapp/index.html')